@@ -8,6 +8,7 @@ import pydeck as pdk
 import dataloader
 import geostuff
 import map_functions
+import tracing
 
 #change to false if you want to connect to the API
 #you will need to enter your API key on the sidebar
@@ -18,6 +19,13 @@ testing_mode = True
 #otherwise, you will be connected to the CSV for demo purposes
 #limited scope, limited dates and airports
 
+#debugging slow searches: show the timings / counters of every search in a
+#collapsible panel, profile it (None, 'cprofile' or 'pyinstrument'), and/or
+#append every trace to a JSON lines file (None to not keep them):
+show_debug_panel = True
+profiler = None
+trace_log = None
+
 
 if "counter" not in st.session_state:
     st.session_state.counter = 0
@@ -144,8 +152,15 @@ if airline_selection != '--Select an Airline--':
         origin_iata = dataloader.airports_reversed[origin]
         origin_coords = geostuff.get_origin_coordinates(IATA = origin_iata,coordinates_only=True)
 
+        #co-terminal airports: searched together with the origin, routes may
+        #leave from and come back to any of them
+        origin_radius = st.sidebar.slider('Include airports within (miles):', min_value=0, max_value=500, value=0, step=25)
+        nearby_airports = [each for each in geostuff.filter_airports_within_radius(origin_coords, origin_radius) if each != origin_iata]
+
         #convert back to simply IATA once the selection is made
-        origin_options = [dataloader.airports_reversed[origin]]
+        origin_options = [origin_iata]
+        if nearby_airports:
+            origin_options += st.sidebar.multiselect('Co-terminal airports:', options=nearby_airports, default=nearby_airports)
 
         #Set destination options NOW based on these:
         destination_options = [each for each in airlines[airline_selection].airports if dataloader.airports_reversed[each] not in origin_options]
@@ -190,13 +205,18 @@ with c3:
 
 build = True if ((airline_selection != '--Select an Airline--')) else False
 
+#one trace per script run, covering the build and the rerank:
+trace = tracing.Trace('search', profiler=profiler)
+
+#this session's inputs and results (never another session's):
+context = dataloader.mrf.session_context()
+
 if build:
     #once the "CALCULATE" button is pressed,
-    #wrap all user inputs together by using dataloader.mrf.user_inputs
-    #recall that this was initialized as 'False' in dataloader.mrf
+    #wrap all user inputs together in this session's search context
 
-    dataloader.mrf.user_route_inputs  =  {
-                                        'origin'            :   origin_options[0],
+    context.route_inputs  =  {
+                                        'origin'            :   origin_options,
                                         'target_miles'      :   need[tier_choice_radio],
                                         'min_layover'       :   dataloader.timedelta(hours = 1),
                                         'max_stops'         :   max_stops,
@@ -207,15 +227,16 @@ if build:
                                         }
     
 
-    if dataloader.mrf.user_route_inputs:
+    if context.route_inputs:
         #st.write('START ALGORITHM HERE!:')
-        try:
-            dataloader.mrf.main_build()
-        except ValueError:
-            st.error("""No qualifying routes found, please try: 
-                        1. increase maximum layovers
-                        2. loosen your search criteria
-                        3. change origin airports.""")
+        with trace:
+            try:
+                dataloader.mrf.main_build(context)
+            except ValueError:
+                st.error("""No qualifying routes found, please try: 
+                            1. increase maximum layovers
+                            2. loosen your search criteria
+                            3. change origin airports.""")
     #Sliderbars for the weights
     st.sidebar.write('# Customize Route Search:')
     if 'time_weight' not in st.session_state:
@@ -234,16 +255,23 @@ if build:
     st.sidebar.slider('Cost Weight', min_value=0.0, max_value=1.0, value=st.session_state.cost_weight, step=0.01, key='cost_weight', on_change=update_time_weight)
 
 if recalculate:
-    dataloader.mrf.user_preference_inputs = {
+    context.preference_inputs = {
                                         'cost_weight'       :   st.session_state.cost_weight,
                                         'time_weight'       :   st.session_state.time_weight,
                                         'max_stops'         :   max_stops
                                         }
-    if dataloader.mrf.user_preference_inputs:
-        try:
-            dataloader.mrf.main_rerank()
-        except ValueError:
-            st.error("""No qualifying routes found, please try: 
-                        1. increase maximum layovers
-                        2. loosen your search criteria
-                        3. change origin airports.""")
\ No newline at end of file
+    if context.preference_inputs:
+        with trace:
+            try:
+                dataloader.mrf.main_rerank(context)
+            except ValueError:
+                st.error("""No qualifying routes found, please try: 
+                            1. increase maximum layovers
+                            2. loosen your search criteria
+                            3. change origin airports.""")
+
+if trace.spans:
+    if show_debug_panel:
+        tracing.debug_panel(trace)
+    if trace_log is not None:
+        trace.append_to(trace_log)
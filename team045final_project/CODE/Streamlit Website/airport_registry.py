@@ -0,0 +1,118 @@
+#this python file contains the airport registry: everything the app needs to
+#know about an airport (FlightLabs entity id, coordinates, city, time zone),
+#loaded once from the files in data/ and looked up by IATA code through a hash
+#index instead of filtering a dataframe on every call.
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+#column names of the openflights airports.dat file (it has no header row)
+OPENFLIGHTS_COLUMNS = ['Name', 'City', 'Country', 'IATA', 'ICAO', 'Latitude', 'Longitude',
+                       'Altitude', 'UTCOffset', 'DST', 'TimeZone', 'Type', 'Source']
+
+class AirportRegistry:
+    """IATA code -> entity id, coordinates, city and time zone, as parallel arrays behind a hash index"""
+    def __init__(self, airports):
+        '''
+        inputs:
+
+            airports    :   a pandas dataframe with one row per IATA code and the
+                            'IATA', 'Name', 'City', 'Country', 'Latitude',
+                            'Longitude', 'TimeZone' and 'EntityId' columns
+                            (EntityId -1 where FlightLabs' id is not known)
+        '''
+        self.codes = pd.Index(airports['IATA'].to_numpy(dtype=object))
+        self.positions_by_code = {code: i for i, code in enumerate(self.codes)}
+        self.name = airports['Name'].to_numpy(dtype=object)
+        self.city = airports['City'].to_numpy(dtype=object)
+        self.country = airports['Country'].to_numpy(dtype=object)
+        self.timezone = airports['TimeZone'].to_numpy(dtype=object)
+        self.latitude = airports['Latitude'].to_numpy(dtype=np.float64)
+        self.longitude = airports['Longitude'].to_numpy(dtype=np.float64)
+        self.entity_ids = airports['EntityId'].to_numpy(dtype=np.int64)
+
+    @classmethod
+    def from_files(cls, data_dir='data'):
+        '''
+        Build the registry from data/: airport_data.csv is used first (it is
+        the curated list the map was drawn from), airports.dat fills in the
+        airports it is missing and the time zones, and entity_sky_id.csv adds
+        the FlightLabs entity ids.
+        '''
+        curated = pd.read_csv(os.path.join(data_dir, 'airport_data.csv'))
+        openflights = pd.read_csv(os.path.join(data_dir, 'airports.dat'), header=None,
+                                  names=OPENFLIGHTS_COLUMNS, na_values=['\\N'], keep_default_na=False)
+        openflights = openflights[openflights['IATA'].str.len() == 3].drop_duplicates('IATA')
+
+        airports = pd.concat([curated, openflights[curated.columns]]).drop_duplicates('IATA')
+        airports = airports.merge(openflights[['IATA', 'TimeZone']], on='IATA', how='left')
+
+        entity = pd.read_csv(os.path.join(data_dir, 'entity_sky_id.csv'))
+        entity = entity.drop_duplicates('SkyId').set_index('SkyId')['EntityId']
+        airports['EntityId'] = airports['IATA'].map(entity).fillna(-1).astype(np.int64)
+        return cls(airports.reset_index(drop=True))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.positions_by_code
+
+    def position(self, code):
+        '''row of an IATA code, -1 if it is not in the registry'''
+        return self.positions_by_code.get(code, -1)
+
+    def positions(self, codes):
+        '''numpy array of the rows of many IATA codes (-1 for unknown ones) in one hashed lookup'''
+        return self.codes.get_indexer(list(codes))
+
+    def entity_id(self, code):
+        '''the FlightLabs entity id of an airport as the API expects it (text), None if not known'''
+        i = self.position(code)
+        if i < 0 or self.entity_ids[i] < 0:
+            return None
+        return str(self.entity_ids[i])
+
+    def coordinates(self, code):
+        '''(latitude, longitude) of one airport, KeyError if it is not in the registry'''
+        i = self.position(code)
+        if i < 0:
+            raise KeyError(code)
+        return self.latitude[i], self.longitude[i]
+
+    def batch_coordinates(self, codes):
+        '''
+        numpy array of shape (len(codes), 2): the latitude, longitude of every
+        code (NaN for codes that are not in the registry)
+        '''
+        positions = self.positions(codes)
+        known = positions >= 0
+        output = np.full((len(positions), 2), np.nan)
+        output[known, 0] = self.latitude[positions[known]]
+        output[known, 1] = self.longitude[positions[known]]
+        return output
+
+    def info(self, code):
+        '''dictionary with the 'City', 'IATA', 'Latitude' and 'Longitude' of one airport, None if unknown'''
+        i = self.position(code)
+        if i < 0:
+            return None
+        return {'City': self.city[i], 'IATA': code,
+                'Latitude': self.latitude[i], 'Longitude': self.longitude[i]}
+
+    def frame(self, codes=None):
+        '''the registry (or the rows of 'codes' that are in it) as a dataframe'''
+        positions = np.arange(len(self)) if codes is None else self.positions(codes)
+        positions = positions[positions >= 0]
+        return pd.DataFrame({'IATA': self.codes[positions], 'Name': self.name[positions],
+                             'City': self.city[positions], 'Country': self.country[positions],
+                             'Latitude': self.latitude[positions], 'Longitude': self.longitude[positions],
+                             'TimeZone': self.timezone[positions], 'EntityId': self.entity_ids[positions]})
+
+@lru_cache(maxsize=None)
+def load_registry(data_dir='data'):
+    '''the registry of data_dir, read from disk only the first time it is asked for'''
+    return AirportRegistry.from_files(data_dir)
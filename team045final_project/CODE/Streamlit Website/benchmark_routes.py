@@ -0,0 +1,141 @@
+#benchmark for the route search: compares the dataframe-scan search that
+#RouteFinder used to do with the FlightIndex based search.
+#
+#run from the "Streamlit Website" folder (same as the app):
+#
+#    python benchmark_routes.py
+#    python benchmark_routes.py --origin JFK --max-stops 2 --copies 50
+
+import argparse
+import time
+from datetime import timedelta
+
+from route_finder import FlightData, RouteFinder
+from route_search import OBJECTIVES, default_scales, route_score
+from schedule_generator import replicate_schedule
+
+def legacy_find_routes(flights, origin, target_miles, min_layover, max_stops):
+    '''
+    The original RouteFinder search: every recursive call re-filters the whole
+    flights dataframe with a boolean mask on 'Origin' and 'Departs'.
+    Kept here only as the baseline for the benchmark.
+    '''
+    def build_route(current_route, remaining_flights):
+        last_flight = current_route[-1]
+        valid_routes = []
+
+        valid_connections = remaining_flights[
+            (remaining_flights['Origin'] == last_flight['Destination']) &
+            (remaining_flights['Departs'] >= last_flight['Arrives'] + min_layover)
+        ]
+
+        for _, next_flight in valid_connections.iterrows():
+            new_route = current_route + [next_flight]
+            total_price = sum(f['Price'] for f in new_route)
+
+            if total_price >= target_miles and new_route[-1]['Destination'] == origin and len(new_route) > 1:
+                valid_routes.append(new_route)
+            elif len(new_route) <= max_stops + 1 and new_route[-1]['Destination'] != origin:
+                valid_routes.extend(build_route(new_route, remaining_flights))
+
+        return valid_routes
+
+    initial_routes = []
+    for _, flight in flights[flights['Origin'] == origin].iterrows():
+        initial_routes.extend(build_route([flight], flights))
+    return initial_routes
+
+def time_search(search, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        routes = search()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, routes
+
+def route_keys(routes):
+    return [tuple((f['Origin'], f['Departs']) for f in route) for route in routes]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the route search')
+    parser.add_argument('--csv', default='data/cached_flights_1.csv')
+    parser.add_argument('--origin', default='ATL')
+    parser.add_argument('--target-miles', type=float, default=1000)
+    parser.add_argument('--max-stops', type=int, default=1)
+    parser.add_argument('--copies', type=int, default=50,
+                        help='size of the synthetic schedule, as a multiple of the csv')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--top-k', type=int, default=20,
+                        help='also compare exhaustive search + sort with the best-first top-k search')
+    parser.add_argument('--weight-time', type=float, default=0.5)
+    parser.add_argument('--optimal', action='store_true',
+                        help='also compare exhaustive search + min with the exact A* solver')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='also time the search spread over this many processes')
+    args = parser.parse_args()
+
+    flight_data = FlightData(args.csv)
+    flight_data.load_data()
+    min_layover = timedelta(hours=1)
+
+    schedules = [('csv', flight_data.data),
+                 (f'synthetic x{args.copies}', replicate_schedule(flight_data.data, args.copies))]
+
+    for name, flights in schedules:
+        legacy_time, legacy_routes = time_search(
+            lambda: legacy_find_routes(flights, args.origin, args.target_miles, min_layover, args.max_stops),
+            args.repeat)
+        index_time, index_routes = time_search(
+            lambda: RouteFinder(flights, args.origin, args.target_miles, min_layover, args.max_stops).find_routes(),
+            args.repeat)
+        #leg ids only, without turning the routes back into pandas Series:
+        ids_time, _ = time_search(
+            lambda: RouteFinder(flights, args.origin, args.target_miles, min_layover, args.max_stops).find_route_ids(),
+            args.repeat)
+
+        same = route_keys(legacy_routes) == route_keys(index_routes)
+        print(f'{name:>16}: {len(flights):>7} legs, {len(index_routes):>7} routes | '
+              f'dataframe scan {legacy_time:8.3f}s | index {index_time:8.3f}s | leg ids {ids_time:8.3f}s | '
+              f'speedup {legacy_time / index_time:6.1f}x | same routes: {same}')
+
+        if args.workers > 1:
+            finder = RouteFinder(flights, args.origin, args.target_miles, min_layover, args.max_stops)
+            serial_time, serial_routes = time_search(finder.find_route_ids, args.repeat)
+            parallel_time, parallel_routes = time_search(lambda: finder.find_route_ids(args.workers), args.repeat)
+            print(f'{"":>16}  {args.workers} workers: single process {serial_time:8.3f}s | '
+                  f'process pool {parallel_time:8.3f}s | same routes: {serial_routes == parallel_routes}')
+
+        if args.top_k:
+            finder = RouteFinder(flights, args.origin, args.target_miles, min_layover, args.max_stops)
+            scales = default_scales(finder.flight_index, args.max_stops)
+            weights = (args.weight_time, 1 - args.weight_time, 0)
+
+            def exhaustive_top_k():
+                routes = finder.find_route_ids()
+                scored = sorted((route_score(duration, price, len(route) - 1, weights, scales), route)
+                                for route, price, duration in zip(routes, finder.route_prices, finder.route_durations))
+                return [route for _, route in scored[:args.top_k]]
+
+            exhaustive_time, exhaustive_routes = time_search(exhaustive_top_k, args.repeat)
+            top_k_time, top_k_routes = time_search(
+                lambda: finder.find_top_route_ids(args.top_k, args.weight_time), args.repeat)
+            print(f'{"":>16}  top {args.top_k}: exhaustive + sort {exhaustive_time:8.3f}s | '
+                  f'best-first {top_k_time:8.3f}s | same routes: {exhaustive_routes == top_k_routes}')
+
+        if args.optimal:
+            finder = RouteFinder(flights, args.origin, args.target_miles, min_layover, args.max_stops)
+            for objective in OBJECTIVES:
+                def exhaustive_min():
+                    finder.find_route_ids()
+                    values = finder.route_prices if objective == 'price' else finder.route_durations
+                    return min(values, default=None)
+
+                exhaustive_time, best = time_search(exhaustive_min, args.repeat)
+                solver_time, (route, value) = time_search(
+                    lambda: finder.find_optimal_route_ids(objective), args.repeat)
+                print(f'{"":>16}  optimal {objective}: exhaustive + min {exhaustive_time:8.3f}s | '
+                      f'A* {solver_time:8.3f}s | same value: {best == value}')
+
+if __name__ == '__main__':
+    main()
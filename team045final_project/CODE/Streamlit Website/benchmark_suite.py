@@ -0,0 +1,203 @@
+#benchmark suite for the route search and ranking on synthetic schedules (see
+#schedule_generator.py), with results written as JSON so two runs can be
+#compared.  benchmark_routes.py compares search implementations on the cached
+#csv, this measures how the current one scales.
+#
+#run from the "Streamlit Website" folder (same as the app):
+#
+#    python benchmark_suite.py run --output before.json
+#    python benchmark_suite.py run --airports 60 --legs-per-day 1500 --max-stops 0 1 2 --output after.json
+#    python benchmark_suite.py compare before.json after.json
+#
+#every (max_stops, target) case reports the search and ranking times (best of
+#--repeat), the peak memory traced while searching and ranking, the number of
+#partial routes the search explored and the number of routes it returned.
+#compare exits with status 1 if a case got slower or bigger than --threshold
+#allows, or returned a different number of routes.
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from flight_index import FlightIndex, enumerate_routes
+from route_finder import RouteRanker
+from schedule_generator import PRICE_DISTRIBUTIONS, generate_schedule
+
+#differences smaller than this are timer noise and never count as a regression
+MIN_SECONDS = 0.005
+MIN_BYTES = 1 * 2**20
+
+TIMED = ('search_seconds', 'rank_seconds', 'rerank_seconds')
+
+def best_time(function, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def run_case(index, origin, target_miles, min_layover, max_stops, weight_time, top_n, repeat):
+    '''search and rank one case, returns its result dictionary'''
+    stats = {}
+
+    def search():
+        return enumerate_routes(index, origin, target_miles, min_layover, max_stops, stats=stats)[0]
+
+    def rank(routes):
+        #routes that all tie on a metric make its entropy weight 0 / 0, as in the app
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return RouteRanker(routes, weight_time, flight_index=index).rank_initial_routes(top_n)
+
+    def rerank(routes):
+        return RouteRanker(routes, weight_time, flight_index=index).rerank_routes(top_n)
+
+    search_seconds, routes = best_time(search, repeat)
+    #ranking needs at least two routes (the entropy weights divide by log(len(routes)))
+    ranked = len(routes) > 1
+    rank_seconds = best_time(lambda: rank(routes), repeat)[0] if ranked else None
+    rerank_seconds = best_time(lambda: rerank(routes), repeat)[0] if ranked else None
+
+    #memory in a separate pass: tracing allocations slows the search down
+    del routes
+    tracemalloc.start()
+    routes = search()
+    if ranked:
+        rank(routes)
+        rerank(routes)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'max_stops': max_stops, 'target_miles': target_miles,
+            'search_seconds': search_seconds, 'rank_seconds': rank_seconds,
+            'rerank_seconds': rerank_seconds, 'peak_bytes': peak_bytes,
+            'explored': stats['explored'], 'routes': len(routes)}
+
+def run(args):
+    schedule = {'airports': args.airports, 'hubs': args.hubs, 'legs_per_day': args.legs_per_day,
+                'days': args.days, 'hub_share': args.hub_share,
+                'price_distribution': args.price_distribution, 'seed': args.seed}
+    legs = generate_schedule(**schedule)
+    origin = args.origin or legs['Origin'].sort_values().iloc[0]
+    min_layover = timedelta(minutes=args.min_layover)
+
+    index_seconds, index = best_time(lambda: FlightIndex(legs), args.repeat)
+    print(f'{len(legs)} legs, {args.airports} airports ({args.hubs} hubs), origin {origin}, '
+          f'index built in {index_seconds:.3f}s', file=sys.stderr)
+
+    cases = []
+    for target_miles in args.targets:
+        too_slow = False
+        for max_stops in sorted(args.max_stops):
+            if too_slow:
+                #every extra stop multiplies the search: don't start what cannot finish
+                cases.append({'max_stops': max_stops, 'target_miles': target_miles, 'skipped': True})
+                print(f'  stops {max_stops} target {target_miles:>7g}: skipped', file=sys.stderr)
+                continue
+            case = run_case(index, origin, target_miles, min_layover, max_stops,
+                            args.weight_time, args.top_n, args.repeat)
+            cases.append(case)
+            too_slow = case['search_seconds'] > args.budget
+            print(f'  stops {max_stops} target {target_miles:>7g}: {case["routes"]:>9} routes, '
+                  f'{case["explored"]:>10} explored, search {case["search_seconds"]:8.3f}s, '
+                  f'rank {case["rank_seconds"] or 0:7.3f}s, peak {case["peak_bytes"] / 2**20:8.1f} MB',
+                  file=sys.stderr)
+
+    report = {'created': datetime.now().isoformat(timespec='seconds'),
+              'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                              'platform': platform.platform()},
+              'schedule': schedule, 'legs': len(legs), 'origin': origin,
+              'min_layover_minutes': args.min_layover, 'weight_time': args.weight_time,
+              'top_n': args.top_n, 'repeat': args.repeat,
+              'index_seconds': index_seconds, 'cases': cases}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+def compare_reports(before, after, threshold):
+    '''
+    Compare the cases two reports have in common.
+
+    returns a list of (max_stops, target_miles, metric, before, after, flagged)
+    rows, flagged when 'after' is worse by more than the threshold (and by
+    more than timer / allocator noise), or returned a different number of routes
+    '''
+    if before['schedule'] != after['schedule']:
+        print('warning: the reports were run on different schedules', file=sys.stderr)
+    earlier = {(case['max_stops'], case['target_miles']): case for case in before['cases']}
+    rows = []
+    for case in after['cases']:
+        key = (case['max_stops'], case['target_miles'])
+        old = earlier.get(key)
+        if old is None or old.get('skipped') or case.get('skipped'):
+            continue
+        for metric, noise in [(name, MIN_SECONDS) for name in TIMED] + [('peak_bytes', MIN_BYTES)]:
+            if old[metric] is None or case[metric] is None:
+                continue
+            flagged = case[metric] > old[metric] * (1 + threshold) and case[metric] - old[metric] > noise
+            rows.append((*key, metric, old[metric], case[metric], flagged))
+        for metric in ('explored', 'routes'):
+            rows.append((*key, metric, old[metric], case[metric], old[metric] != case[metric]))
+    return rows
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    rows = compare_reports(before, after, args.threshold)
+    for max_stops, target_miles, metric, old, new, flagged in rows:
+        change = f'{(new - old) / old:+8.1%}' if old else ''
+        print(f'{"REGRESSION" if flagged else "":>10}  stops {max_stops} target {target_miles:>7g}  '
+              f'{metric:<15} {old:>14.6g} -> {new:<14.6g} {change}')
+    regressions = sum(flagged for *_, flagged in rows)
+    print(f'{regressions} regression(s) in {len(rows)} comparisons')
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Route search benchmark suite on synthetic schedules')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runner = commands.add_parser('run', help='run the benchmark and write a JSON report')
+    runner.add_argument('--airports', type=int, default=30)
+    runner.add_argument('--hubs', type=int, default=4)
+    runner.add_argument('--legs-per-day', type=int, default=500)
+    runner.add_argument('--days', type=int, default=3)
+    runner.add_argument('--hub-share', type=float, default=0.8)
+    runner.add_argument('--price-distribution', choices=PRICE_DISTRIBUTIONS, default='lognormal')
+    runner.add_argument('--seed', type=int, default=0)
+    runner.add_argument('--origin', help='default: the first hub')
+    runner.add_argument('--max-stops', type=int, nargs='+', default=[0, 1, 2, 3, 4])
+    runner.add_argument('--targets', type=float, nargs='+', default=[1000, 3000])
+    runner.add_argument('--min-layover', type=int, default=60, help='minutes')
+    runner.add_argument('--weight-time', type=float, default=0.5)
+    runner.add_argument('--top-n', type=int, default=50, help='routes ranked for display')
+    runner.add_argument('--repeat', type=int, default=3)
+    runner.add_argument('--budget', type=float, default=30,
+                        help='seconds: once a search takes longer, larger max_stops are skipped')
+    runner.add_argument('--output', help='JSON report file (default: stdout)')
+
+    comparer = commands.add_parser('compare', help='compare two JSON reports and flag regressions')
+    comparer.add_argument('before')
+    comparer.add_argument('after')
+    comparer.add_argument('--threshold', type=float, default=0.10,
+                          help='allowed slowdown / growth as a fraction (default 10%%)')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+        return 0
+    return compare(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
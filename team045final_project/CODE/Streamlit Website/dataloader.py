@@ -4,11 +4,17 @@
 #also put dictionaries, lists, and other stuff containing information that will
 #allow us to efficiently access data.
 
+import asyncio
 import pandas as pd
-import time
-import requests
 import mileagerun_finder_oop as mrf
+import airport_registry
+import flight_cache
+import flight_fetcher
 from datetime import timedelta
+#the retrieveFlights api itself lives in flightlabs.py (the fetcher uses it
+#without importing this module), its names are kept here for existing callers:
+from flightlabs import (BASE_URL, DELTA_CARRIER_ID, get_flights, flight_params, TEXT_COLUMNS,
+                        API_DATE_FORMAT, parse_api_dates, parse_flights)
 
 esi = pd.read_csv('data/entity_sky_id.csv')
 
@@ -70,154 +76,58 @@ airports_geo = pd   .DataFrame  (
                                 right_on='IATA'
                                 )
 
-def get_airport_coordinates(IATA,data=airports_geo):
-    lat,lon = airports_geo[airports_geo['IATA']==IATA][['Latitude','Longitude']].values[0]
-    return lat,lon
-
-
-
-
-
-def get_flights(api_key , iata_origin, iata_destination, date):
+#every airport's entity id / coordinates / city, looked up by IATA code:
+registry = airport_registry.load_registry()
 
-    '''
-    -----------------------------------------------------------------------------
-    DOES:
-    -----------------------------------------------------------------------------
-    Gets all delta flights for a specific day using the arguments:
-
-    api_key             :   your api key from flightlabs
-
-    iata_origin         :   three-character airport code.  Remember, to limit
-                            the scope of the project, it must be one of the ones
-                            listed in the "airports" dictionary.
-
-    iata_destination    :   three-character airport code. Same rules as above
-
-    date                :   in YYYY-MM-DD format
-    -----------------------------------------------------------------------------
-    RETURNS:
-    -----------------------------------------------------------------------------
+def get_airport_coordinates(IATA):
+    lat,lon = registry.coordinates(IATA)
+    return lat,lon
 
-    pandas dataframe with columns   :   'id'            'CarrierName'   'Origin' 
-                                        'Destination'   'Departs'       'Arrives' 
-                                        'Duration'      'Price'
 
-    status_comp                     :   A boolean, if True is returned, then the
-                                        API call returned a status of complete.
-                                        
-    NOTES REGARDING INCOMPLETE STATUS (from FlightLabs):
-    
-    If you receive incomplete results, please wait a moment and try your request
-    again for the full information. Sometimes heavy queries may take longer to process.
-    Please be aware that incomplete API calls will still be counted towards your API usage.
-    '''
-    ##################################################
-    #Query the API:
-    ##################################################     
-
-    BASE_URL = "https://www.goflightlabs.com/retrieveFlights"
-
-    params  =   {   
-                #API Key:
-                'access_key'    :   api_key,
-                #ORIGIN:
-                #skyid: 3 char code:
-                'originSkyId'   :   iata_origin,
-                #Entity ID:
-                'originEntityId':   esi[esi['SkyId']==iata_origin]['EntityId'].to_string(index=False),
-                #DESTINATION
-                #skyid: 3 char code:
-                'destinationSkyId'  :   iata_destination,
-                #EntityID
-                'destinationEntityId' : esi[esi['SkyId']==iata_destination]['EntityId'].to_string(index=False),
-                #date
-                'date' : date,
-                #Cabin class premium economy: basic economy fares don't contribute to MQD on Delta!
-                'cabinClass' : 'premium_economy'
-                }
-
-    response = requests.get(BASE_URL , params=params)
-
-    ##################################################
-    #Pre-Data Frame Organizing Stuff:
-    ##################################################     
-
-    #list output that will be turned into dataframe
-    output  =   []
-
-
-    #the structure of this loop is dictated by the json/api call
-    #please review FlightLabs documentation if you need a refresher
-    #on how a json arrives once you call:
-    
-    for each in response.json()['itineraries']:
-        for leg in each['legs']:
-            row =   {
-                    'id'            :       leg['id'],
-                    'CarrierName'   :       leg['carriers']['marketing'][0]['name'],
-                    'Origin'        :       leg['origin']['id'],
-                    'Destination'   :       leg['destination']['id'],
-                    'Departs'       :       leg['departure'],
-                    'Arrives'       :       leg['arrival'],
-                    'Duration'      :       leg['durationInMinutes'],
-                    'Price'         :       each['price']['raw']
-                    }
-            carrier_id  =   leg['carriers']['marketing'][0]['id']
 
-            #-32385 is the identifier for delta.  Append to output
-            #if and only if delta flight
-            if carrier_id   ==  -32385:
-                output.append(row)
 
-    ##################################################
-    #Create the output DataFrame:
-    ##################################################     
-    output_df = pd.DataFrame(output)
-    
-    if output:
-        #convert to pandas datetime objects:
-        output_df['Departs'] = pd.to_datetime(output_df['Departs'])
-        output_df['Arrives'] = pd.to_datetime(output_df['Arrives'])
-    
-    status_comp = response.json()['context']['status']=='complete'
-    return output_df , status_comp
 
-def gather_flights(api_key, dates, codes, max_iter=1):
+def gather_flights(api_key, dates, codes, max_iter=1, csv_path=None):
     """
-    Loops through each combination of dates and airport codes to gather Delta flights data.
-    Appends each successful result to a list of DataFrames.
+    Fetches Delta flights data for each combination of dates and airport codes,
+    many requests at a time (see flight_fetcher.fetch_flights for the rate
+    limit, concurrency and retry settings).
 
     INPUT : LIST of DATES (must be a list, list of 1 is fine) YYYY-MM-DD
             LIST of AIRPORT CODES (IATA)
+            csv_path: optional cached_flights csv, each result is appended to it
+                      as soon as it arrives
     
     Returns:
     --------
-    List of DataFrames with gathered Delta flights data.
+    DataFrame with the gathered Delta flights data.
+
+    This runs its own event loop: code that is already inside one (a jupyter
+    cell, an async server) has to await gather_flights_async instead.
     """
-    
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(gather_flights_async(api_key, dates, codes, max_iter, csv_path))
+    raise RuntimeError('gather_flights was called inside a running event loop, '
+                       'use "await dataloader.gather_flights_async(...)" there')
+
+async def gather_flights_async(api_key, dates, codes, max_iter=1, csv_path=None):
+    '''gather_flights for callers that already run an event loop (same inputs and result)'''
     assert type(dates)==list, 'dates argument must be a list'
     assert type(codes)==list, 'codes argument must be a list'
 
-    # List to store each DataFrame
-    flights_dataframes = [] 
-
-    #total combinations:
+    #total combinations (the first max_iter + 1 of them):
     combinations = [(a,b,c) for a in codes for b in codes for c in dates if a!=b]
-    counter = 0
-
-    for (x,y,z) in combinations:
-        if counter > max_iter:
-            break
-        output,status = get_flights(api_key=api_key,
-                                    iata_origin=x,
-                                    iata_destination=y,
-                                    date=z)
-        
-        flights_dataframes.append(output)
-
-        counter +=1
-        time.sleep(5)
-    
-    return pd.concat(flights_dataframes)
+    combinations = combinations[:max_iter + 1]
 
+    def on_result(result):
+        if csv_path is not None:
+            flight_cache.append_legs(csv_path, result.legs)
+
+    results = await flight_fetcher.fetch_flights(api_key, combinations, on_result=on_result)
+
+    flights_dataframes = [result.legs for result in results if result.legs is not None]
+    if not flights_dataframes:
+        return pd.DataFrame()
+    return pd.concat(flights_dataframes)
@@ -0,0 +1,138 @@
+#this python file contains the binary (parquet) cache of the scraped flight
+#legs.  The csv files in data/ stay the source of truth: the parquet file next
+#to a csv is rebuilt automatically whenever the csv changes, and loading from
+#it skips the csv parse and date inference on every app start.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    #pyarrow comes with streamlit, without it we just parse the csv every time
+    pa = pq = None
+
+#how dates are written in the cached_flights csv files, e.g. 11/14/2024 12:45
+CSV_DATE_FORMAT = '%m/%d/%Y %H:%M'
+
+#the typed schema of a leg:
+LEG_COLUMNS = ['id', 'CarrierName', 'Origin', 'Destination', 'Departs', 'Arrives', 'Duration', 'Price']
+CATEGORY_COLUMNS = ['CarrierName', 'Origin', 'Destination']
+
+#rows per parquet row group: the table is written sorted by departure time, so
+#date filters can skip whole row groups
+ROW_GROUP_SIZE = 50_000
+
+def cache_path(csv_path):
+    '''the parquet file that caches csv_path: same folder and name, .parquet extension'''
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+def source_signature(csv_path):
+    '''identifies the current version of the csv: changes whenever it is rewritten or appended to'''
+    stat = os.stat(csv_path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+def parse_dates(values):
+    '''parse with the csv format first, only fall back to (slow) inference for other formats'''
+    try:
+        return pd.to_datetime(values, format=CSV_DATE_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values)
+
+def read_csv_legs(csv_path):
+    '''
+    Read a cached_flights csv into the typed leg schema:
+    categorical carrier/airport codes, datetime64 timestamps, int32 durations
+    and float32 prices.  A leg fetched again (a re-run scrape appends every
+    result) is kept once, as its last appended row.
+    '''
+    legs = pd.read_csv(csv_path, usecols=LEG_COLUMNS, dtype={'id': str})
+    legs = legs.drop_duplicates('id', keep='last')
+    legs['Departs'] = parse_dates(legs['Departs']).astype('datetime64[ns]')
+    legs['Arrives'] = parse_dates(legs['Arrives']).astype('datetime64[ns]')
+    legs['Duration'] = legs['Duration'].astype(np.int32)
+    legs['Price'] = legs['Price'].astype(np.float32)
+    for column in CATEGORY_COLUMNS:
+        legs[column] = legs[column].astype('category')
+    return legs.sort_values('Departs', kind='stable').reset_index(drop=True)
+
+def append_legs(csv_path, legs):
+    '''
+    Append freshly fetched legs (a get_flights / parse_flights dataframe) to a
+    cached_flights csv in its own format.  The parquet cache notices the csv
+    changed and is rebuilt on the next load, legs already in the csv are
+    dropped then (see read_csv_legs).
+    '''
+    if legs is None or legs.empty:
+        return
+    write_header = not os.path.exists(csv_path)
+    legs[LEG_COLUMNS].to_csv(csv_path, mode='a', header=write_header, date_format=CSV_DATE_FORMAT)
+
+def build_cache(csv_path):
+    '''(Re)write the parquet cache of csv_path, tagged with the csv's signature'''
+    legs = read_csv_legs(csv_path)
+    table = pa.Table.from_pandas(legs, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'source_signature'] = source_signature(csv_path).encode()
+    table = table.replace_schema_metadata(metadata)
+    pq.write_table(table, cache_path(csv_path), row_group_size=ROW_GROUP_SIZE)
+    return legs
+
+def cache_is_fresh(csv_path):
+    path = cache_path(csv_path)
+    if not os.path.exists(path):
+        return False
+    metadata = pq.read_schema(path).metadata or {}
+    return metadata.get(b'source_signature') == source_signature(csv_path).encode()
+
+def to_pandas_types(legs):
+    '''float32 prices are only for storage: back to float64 cents so route totals add up as before'''
+    legs['Price'] = legs['Price'].astype(np.float64).round(2)
+    return legs
+
+def load_legs(csv_path, carriers=None, airports=None, start=None, end=None):
+    '''
+    Load the flight legs of csv_path through its parquet cache (rebuilt first
+    if the csv changed), keeping only the legs that match the filters.  With
+    the parquet cache the filters are pushed down to the reader, so row groups
+    and rows that do not match are never turned into pandas objects.
+
+    inputs:
+
+        carriers        :   list of carrier names, e.g. ['Delta']
+        airports        :   list of IATA codes: both ends of a leg must be in it
+        start, end      :   datetimes: keep legs departing in [start, end]
+
+    returns a pandas dataframe sorted by departure time
+    '''
+    filters = []
+    if carriers is not None:
+        filters.append(('CarrierName', 'in', list(carriers)))
+    if airports is not None:
+        filters.append(('Origin', 'in', list(airports)))
+        filters.append(('Destination', 'in', list(airports)))
+    if start is not None:
+        filters.append(('Departs', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('Departs', '<=', pd.Timestamp(end)))
+
+    if pq is None:
+        legs = read_csv_legs(csv_path)
+        for column, op, value in filters:
+            if op == 'in':
+                legs = legs[legs[column].isin(value)]
+            elif op == '>=':
+                legs = legs[legs[column] >= value]
+            else:
+                legs = legs[legs[column] <= value]
+        return to_pandas_types(legs.reset_index(drop=True))
+
+    if not cache_is_fresh(csv_path):
+        build_cache(csv_path)
+    legs = pd.read_parquet(cache_path(csv_path), filters=filters or None)
+    for column in CATEGORY_COLUMNS:
+        legs[column] = legs[column].cat.remove_unused_categories()
+    return to_pandas_types(legs)
@@ -0,0 +1,140 @@
+#this python file contains the concurrent FlightLabs fetcher used to fill the
+#flight cache: many (origin, destination, date) queries in flight at once,
+#held to the API's request rate by a token bucket, with retries for responses
+#that come back incomplete.
+
+#the http calls go through one pooled requests.Session (keep-alive connections
+#are reused between calls) and run in worker threads, so no extra async http
+#library is needed.
+
+import asyncio
+import random
+import time
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import flightlabs
+import response_cache
+
+#FlightLabs request budget: sustained requests per second, and how many can go
+#out back to back before the rate applies
+REQUESTS_PER_SECOND = 1.0
+BURST = 5
+
+#requests waiting on the API at the same time
+CONCURRENCY = 8
+
+#incomplete responses / errors are retried after BACKOFF, 2 * BACKOFF, 4 * BACKOFF... seconds
+MAX_RETRIES = 3
+BACKOFF = 2.0
+
+REQUEST_TIMEOUT = 60
+
+#one query's outcome: 'legs' is the get_flights dataframe (None if every attempt
+#failed), 'complete' is True if the API reported status complete
+FetchResult = namedtuple('FetchResult', ['origin', 'destination', 'date', 'legs', 'complete', 'attempts'])
+
+class TokenBucket:
+    """Async token bucket: 'rate' tokens per second, holding at most 'capacity'"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = None
+
+    async def acquire(self):
+        #the lock has to be created inside the running event loop
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def make_session(pool_size=CONCURRENCY):
+    '''a requests.Session whose connection pool can hold one connection per concurrent request'''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_json(session, url, params, timeout=REQUEST_TIMEOUT):
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+async def fetch_flights(api_key, queries, on_result=None, base_url=flightlabs.BASE_URL,
+                        concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND, burst=BURST,
+                        max_retries=MAX_RETRIES, backoff=BACKOFF, session=None, cache=None):
+    '''
+    Fetch every (origin, destination, date) in 'queries' from retrieveFlights.
+
+    inputs:
+
+        api_key         :   your api key from flightlabs
+        queries         :   list of (iata_origin, iata_destination, 'YYYY-MM-DD')
+        on_result       :   optional function called with each FetchResult as soon
+                            as that query is done (e.g. to append it to the flight cache)
+        base_url        :   the retrieveFlights url (point it at a local stub server to test)
+        concurrency     :   requests in flight at the same time
+        rate, burst     :   token bucket: requests per second and burst size
+        max_retries     :   extra attempts for a query whose status is not complete
+                            (or whose request failed), with exponential backoff
+        cache           :   response_cache.ResponseCache: fresh responses are taken
+                            from it without an API call, complete ones are stored
+                            in it, keyed by base_url as well as the query
+                            (default: response_cache.default_cache())
+
+    returns:
+
+        list of FetchResult, in the order the queries finished
+    '''
+    limiter = TokenBucket(rate, burst)
+    in_flight = asyncio.Semaphore(concurrency)
+    session = session if session is not None else make_session(concurrency)
+    cache = cache if cache is not None else response_cache.default_cache()
+    loop = asyncio.get_running_loop()
+
+    async def fetch_one(origin, destination, date):
+        params = flightlabs.flight_params(api_key, origin, destination, date)
+        legs, complete = None, False
+
+        async def call_api():
+            #only calls that actually reach the API use up the rate limit, and the
+            #token is taken once a connection slot is free: a token taken while
+            #waiting for a slot would let the waiting calls go out all at once
+            async with in_flight:
+                await limiter.acquire()
+                return await loop.run_in_executor(None, get_json, session, base_url, params)
+
+        for attempt in range(1, max_retries + 2):
+            try:
+                payload = await cache.fetch_async(base_url, params, call_api)
+                legs, complete = flightlabs.parse_flights(payload)
+            except (requests.RequestException, ValueError, KeyError, TypeError):
+                #network error, http error status or a malformed body: try again
+                complete = False
+            if complete or attempt > max_retries:
+                break
+            #incomplete results still cost a call: wait before asking again
+            await asyncio.sleep(backoff * 2 ** (attempt - 1) * (1 + random.random() / 10))
+
+        result = FetchResult(origin, destination, date, legs, complete, attempt)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    tasks = [asyncio.ensure_future(fetch_one(*query)) for query in queries]
+    results = []
+    for finished in asyncio.as_completed(tasks):
+        results.append(await finished)
+    return results
@@ -0,0 +1,341 @@
+#this python file contains the prebuilt connection index that the route
+#search walks instead of re-filtering the whole flights dataframe on every
+#recursive call, and the route enumeration engine that runs on it.
+
+#legs are referred to by their integer position in the flights dataframe
+#(a "leg id"), routes are tuples of leg ids.
+
+#a search origin is either one IATA code or a set of co-terminal airports
+#(e.g. JFK/LGA/EWR): routes leave from any of them and end as soon as they
+#land at any of them.
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+#how leg times are shown in itinerary details
+DETAIL_DATE_FORMAT = '%m/%d/%Y %H:%M'
+
+#leg rows and itinerary details an index keeps, the least recently used are
+#dropped beyond these (one index is shared by every session, for as long as
+#the server runs): a full results page (route_store.MAX_PAGE_SIZE routes of up
+#to 4 legs) fits in the rows, and far more routes than anyone opens at once in
+#the itineraries
+CACHED_ROWS = 4096
+CACHED_ITINERARIES = 512
+
+def origin_codes(origin):
+    '''a search origin as a tuple of IATA codes: one code, or the co-terminal airports given'''
+    if isinstance(origin, str):
+        return (origin,)
+    return tuple(origin)
+
+class FlightIndex:
+    """Time-expanded connection index: legs grouped by origin airport and sorted by departure time"""
+    def __init__(self, flights):
+        '''
+        inputs:
+
+            flights     :   a pandas dataframe of flight legs with (at least)
+                            the 'Origin', 'Destination', 'Departs', 'Arrives',
+                            'Duration' and 'Price' columns (see FlightData)
+        '''
+        self.flights = flights
+
+        #leg table, one row per leg id:
+        airport_ids, self.airports = pd.factorize(pd.concat([flights['Origin'], flights['Destination']]))
+        self.airport_ids = {code: i for i, code in enumerate(self.airports)}
+        self.origin = airport_ids[:len(flights)].astype(np.int64)
+        self.destination = airport_ids[len(flights):].astype(np.int64)
+        #epoch seconds:
+        self.departs = flights['Departs'].to_numpy(dtype='datetime64[ns]').view('int64') // 10**9
+        self.arrives = flights['Arrives'].to_numpy(dtype='datetime64[ns]').view('int64') // 10**9
+        self.duration = flights['Duration'].to_numpy(dtype=np.float64)
+        self.price = flights['Price'].to_numpy(dtype=np.float64)
+
+        #legs sorted by (origin, departure time): the legs leaving airport a are
+        #order[group_start[a]:group_end[a]], and 'keys' packs (origin, departure)
+        #into one int64 so a single searchsorted finds the first valid connection
+        self.order = np.lexsort((self.departs, self.origin))
+        self.keys = (self.origin[self.order] << 32) | self.departs[self.order]
+        airport_range = np.arange(len(self.airports), dtype=np.int64)
+        self.group_start = np.searchsorted(self.origin[self.order], airport_range, side='left')
+        self.group_end = np.searchsorted(self.origin[self.order], airport_range, side='right')
+
+        #one index is shared by every session searching the same flights: nothing may change it
+        for array in (self.origin, self.destination, self.departs, self.arrives, self.duration, self.price,
+                      self.order, self.keys, self.group_start, self.group_end):
+            array.flags.writeable = False
+
+        #rows are only turned into pandas Series when a route uses them, and
+        #itinerary details only built for the routes a user opens (see itinerary),
+        #both kept for the next sessions asking (see memoized)
+        self._rows = OrderedDict()
+        self._itineraries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.origin)
+
+    def __getstate__(self):
+        #what a search worker needs: the leg arrays, not the dataframe or its rows
+        state = self.__dict__.copy()
+        state['flights'] = None
+        state['_rows'] = OrderedDict()
+        state['_itineraries'] = OrderedDict()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def memoized(self, memo, key, build, limit):
+        '''
+        memo[key], made by build() the first time it is asked for and kept in
+        the LRU dictionary 'memo' of at most 'limit' entries.  Sessions share the
+        index: the lock only guards the dictionary, build runs outside of it.
+        '''
+        with self._lock:
+            value = memo.get(key)
+            if value is not None:
+                memo.move_to_end(key)
+                return value
+        value = build()
+        with self._lock:
+            memo[key] = value
+            if len(memo) > limit:
+                memo.popitem(last=False)
+        return value
+
+    def airport_id(self, code):
+        '''integer id of an IATA code, -1 if no leg touches that airport'''
+        return self.airport_ids.get(code, -1)
+
+    def home_mask(self, origin):
+        '''boolean array over airport ids: True for the airports of 'origin' (see origin_codes)'''
+        mask = np.zeros(len(self.airports), dtype=bool)
+        ids = [self.airport_id(code) for code in origin_codes(origin)]
+        mask[[i for i in ids if i >= 0]] = True
+        return mask
+
+    def lands_home(self, origin):
+        '''boolean array over leg ids: True for the legs that land at one of the airports of origin'''
+        return self.home_mask(origin)[self.destination]
+
+    def row(self, leg):
+        return self.memoized(self._rows, leg, lambda: self.flights.iloc[leg], CACHED_ROWS)
+
+    def route_rows(self, route):
+        '''a route of leg ids as the list of pandas Series the rest of the app uses'''
+        return [self.row(leg) for leg in route]
+
+    def itinerary(self, route):
+        '''
+        The legs of a route (tuple of leg ids) as display dicts: 'Origin',
+        'Destination', 'Departs', 'Arrives' (text), 'Price' and 'Duration'
+        (hours).  Built from the leg arrays the first time the route is asked
+        for and memoized per route (the CACHED_ITINERARIES most recent ones).
+        '''
+        return self.memoized(self._itineraries, route, lambda: self.build_itinerary(route), CACHED_ITINERARIES)
+
+    def build_itinerary(self, route):
+        '''the itinerary details of a route, built every time (see itinerary)'''
+        legs = np.asarray(route, dtype=np.int64)
+        departs = pd.to_datetime(self.departs[legs], unit='s').strftime(DETAIL_DATE_FORMAT)
+        arrives = pd.to_datetime(self.arrives[legs], unit='s').strftime(DETAIL_DATE_FORMAT)
+        return [{'Origin': self.airports[origin], 'Destination': self.airports[destination],
+                 'Departs': departure, 'Arrives': arrival, 'Price': price,
+                 'Duration': round(duration / 60, 2)}
+                for origin, destination, departure, arrival, price, duration in zip(
+                    self.origin[legs], self.destination[legs], departs, arrives,
+                    self.price[legs].tolist(), self.duration[legs].tolist())]
+
+    def route_metrics(self, routes):
+        '''
+        numpy arrays over a list of routes: total duration in seconds (last
+        arrival - first departure), total price and number of connections
+        '''
+        lengths = np.fromiter((len(route) for route in routes), dtype=np.int64, count=len(routes))
+        legs = np.fromiter(chain.from_iterable(routes), dtype=np.int64, count=int(lengths.sum()))
+        starts = np.cumsum(lengths) - lengths
+        durations = (self.arrives[legs[starts + lengths - 1]] - self.departs[legs[starts]]).astype(np.float64)
+        prices = np.add.reduceat(self.price[legs], starts) if len(routes) else np.empty(0)
+        return durations, prices, lengths - 1
+
+    def departure_legs(self, origin):
+        '''
+        leg ids of every leg that can start a route from 'origin' (one code or
+        several), in table order: legs leaving one of its airports, except the
+        ones landing at another (a first leg never closes the loop, and a route
+        may not go on through a home airport)
+        '''
+        airports = [self.airport_id(code) for code in origin_codes(origin)]
+        groups = [self.order[self.group_start[a]:self.group_end[a]] for a in sorted(set(airports)) if a >= 0]
+        if not groups:
+            return []
+        legs = np.sort(np.concatenate(groups))
+        return legs[~self.lands_home(origin)[legs]].tolist()
+
+    def connection_ranges(self, min_layover):
+        '''
+        For every leg, the legs that can follow it (leaving its destination at or
+        after Arrives + min_layover) are order[first[leg]:end[leg]].  All of the
+        first valid connections are found with one vectorized binary search.
+        '''
+        layover = int(pd.Timedelta(min_layover).total_seconds())
+        first = np.searchsorted(self.keys, (self.destination << 32) | (self.arrives + layover), side='left')
+        end = self.group_end[self.destination]
+        return first, end
+
+    def connection_lists(self, min_layover, arrays=False):
+        '''
+        Returns a function that maps a leg id to the list of leg ids that can
+        follow it (see connection_ranges), or to a sorted numpy array with
+        arrays=True.  The lists are built (in table order) the first time they
+        are asked for and shared between legs with the same first connection.
+        A leg with no connection gets an empty list: its first[leg] == end[leg]
+        is also where the next airport's legs start.
+        '''
+        first, end = self.connection_ranges(min_layover)
+        first, end = first.tolist(), end.tolist()
+        order = self.order
+        empty = np.empty(0, dtype=order.dtype) if arrays else []
+        built = {}
+
+        def connections(leg):
+            start = first[leg]
+            if start >= end[leg]:
+                return empty
+            if start not in built:
+                following = np.sort(order[start:end[leg]])
+                built[start] = following if arrays else following.tolist()
+            return built[start]
+
+        return connections
+
+def enumerate_routes(index, origin, target_miles, min_layover, max_stops, first_legs=None, stats=None):
+    '''
+    Enumerate every qualifying route: a loop that leaves 'origin', comes back to
+    it with a total price of at least 'target_miles' and has at most
+    max_stops + 2 legs.  With several origin airports, every airport in the
+    set is searched in the same traversal and a loop may come back to any of
+    them.  Uses an explicit stack instead of recursion and carries
+    the running price forward instead of re-summing the route.
+
+    inputs:
+
+        index           :   a FlightIndex
+        origin          :   an IATA code, or a list/tuple of co-terminal IATA codes
+        first_legs      :   optional list of leg ids to start from (default:
+                            index.departure_legs(origin)), legs landing at
+                            a home airport are skipped
+        stats           :   optional dictionary, 'explored' is set to the number
+                            of partial routes the search expanded and 'pruned'
+                            to the number of connections cut off by max_stops
+
+    returns:
+
+        routes          :   list of tuples of leg ids, in the same order as the
+                            recursive dataframe search
+        prices          :   list of total prices
+        durations       :   list of total route durations in seconds
+                            (last arrival - first departure)
+    '''
+    if first_legs is None:
+        first_legs = index.departure_legs(origin)
+    connections = index.connection_lists(min_layover)
+    lands_home = index.lands_home(origin).tolist()
+    price = index.price.tolist()
+    departs = index.departs.tolist()
+    arrives = index.arrives.tolist()
+    #connections of every leg that do not land home: all of them are cut off
+    #when a route of max_stops + 1 legs reaches it (counted per route, not per connection)
+    first_connection, end_connection = index.connection_ranges(min_layover)
+    away = np.concatenate([[0], np.cumsum(~index.lands_home(origin)[index.order])])
+    cut_off = (away[end_connection] - away[first_connection]).tolist()
+
+    routes, prices, durations = [], [], []
+    explored = pruned = 0
+
+    for first in first_legs:
+        if lands_home[first]:
+            continue
+        explored += 1
+        if max_stops == 0:
+            pruned += cut_off[first]
+        stack = [((first,), price[first], iter(connections(first)))]
+        while stack:
+            route, total, children = stack[-1]
+            for leg in children:
+                new_total = total + price[leg]
+                if lands_home[leg]:
+                    #back home: keep it if it qualifies, either way the route ends
+                    if new_total >= target_miles:
+                        routes.append(route + (leg,))
+                        prices.append(new_total)
+                        durations.append(arrives[leg] - departs[first])
+                elif len(route) <= max_stops:
+                    explored += 1
+                    if len(route) == max_stops:
+                        pruned += cut_off[leg]
+                    stack.append((route + (leg,), new_total, iter(connections(leg))))
+                    break
+            else:
+                stack.pop()
+
+    if stats is not None:
+        stats['explored'] = explored
+        stats['pruned'] = pruned
+    return routes, prices, durations
+
+#the index a pool worker searches, set once per worker process by _init_worker
+_worker_index = None
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+def _enumerate_shard(args):
+    origin, target_miles, min_layover, max_stops, first_legs = args
+    return enumerate_routes(_worker_index, origin, target_miles, min_layover, max_stops, first_legs)
+
+def parallel_enumerate_routes(index, origin, target_miles, min_layover, max_stops, workers=None, shards_per_worker=4):
+    '''
+    enumerate_routes spread over a process pool.  The subtree under every first
+    leg is independent, so the first legs are split into contiguous shards and
+    searched by separate processes.  The index is sent to each worker once (as
+    the pool initializer argument, without the flights dataframe) rather than
+    with every shard, and the shards are merged back in first-leg order, so the
+    result is exactly the same as the single-process search.
+
+    inputs:
+
+        workers             :   number of processes (default: os.cpu_count())
+        shards_per_worker   :   more shards than workers evens out the load, as
+                                some first legs have much bigger subtrees
+
+    returns the same (routes, prices, durations) lists as enumerate_routes
+    '''
+    workers = workers or os.cpu_count() or 1
+    first_legs = index.departure_legs(origin)
+    shard_count = min(len(first_legs), workers * shards_per_worker)
+    if workers <= 1 or shard_count <= 1:
+        return enumerate_routes(index, origin, target_miles, min_layover, max_stops, first_legs)
+
+    shards = [(origin, target_miles, min_layover, max_stops, shard.tolist())
+              for shard in np.array_split(np.asarray(first_legs, dtype=np.int64), shard_count)]
+
+    routes, prices, durations = [], [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index,)) as pool:
+        #map returns the shards in submission order, whichever finishes first
+        for shard_routes, shard_prices, shard_durations in pool.map(_enumerate_shard, shards):
+            routes.extend(shard_routes)
+            prices.extend(shard_prices)
+            durations.extend(shard_durations)
+    return routes, prices, durations
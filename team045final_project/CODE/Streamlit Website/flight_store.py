@@ -0,0 +1,215 @@
+#this python file contains the flight store: the SQLite database the scraped
+#legs live in between refreshes.  It remembers when every (origin,
+#destination, date) cell was last fetched, so a refresh only asks the API for
+#the cells that are missing or stale, and it keeps the price history of every
+#leg instead of overwriting it.  The cached_flights csv the app loads is
+#exported from it.
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+import flight_cache
+import flight_fetcher
+from response_cache import response_ttl
+
+DEFAULT_PATH = 'data/flight_store.sqlite'
+
+#how leg timestamps are stored (sortable text)
+STORE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class FlightStore:
+    """Scraped flight legs with per-cell fetch times and per-leg price history"""
+    def __init__(self, path=DEFAULT_PATH, ttl=response_ttl):
+        '''
+        inputs:
+
+            path    :   sqlite file (':memory:' for a store that is not kept)
+            ttl     :   function (date, now) -> seconds a cell stays fresh, or
+                        None if it never goes stale (default: the response
+                        cache's policy, so a stale cell is never answered from
+                        the response cache)
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS cells (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                date TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                complete INTEGER NOT NULL,
+                legs INTEGER NOT NULL,
+                PRIMARY KEY (origin, destination, date));
+            CREATE TABLE IF NOT EXISTS legs (
+                id TEXT PRIMARY KEY,
+                CarrierName TEXT,
+                Origin TEXT,
+                Destination TEXT,
+                Departs TEXT,
+                Arrives TEXT,
+                Duration INTEGER,
+                Price REAL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS price_history (
+                id TEXT NOT NULL,
+                observed_at REAL NOT NULL,
+                Price REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS price_history_id ON price_history (id, observed_at);
+            ''')
+        self.db.commit()
+
+    def stale_cells(self, codes, dates, now=None):
+        '''
+        The (origin, destination, date) cells among every pair of 'codes' on
+        every one of 'dates' that have to be fetched: never fetched, fetched
+        incomplete, or older than their ttl.
+        '''
+        now = time.time() if now is None else now
+        with self.lock:
+            fetched = {(o, d, day): (fetched_at, complete) for o, d, day, fetched_at, complete
+                       in self.db.execute('SELECT origin, destination, date, fetched_at, complete FROM cells')}
+        stale = []
+        for cell in [(a, b, c) for a in codes for b in codes for c in dates if a != b]:
+            if cell not in fetched:
+                stale.append(cell)
+                continue
+            fetched_at, complete = fetched[cell]
+            ttl = self.ttl(cell[2], now)
+            if not complete or (ttl is not None and fetched_at + ttl <= now):
+                stale.append(cell)
+        return stale
+
+    def record(self, origin, destination, date, legs, complete, now=None):
+        '''
+        Store the result of fetching one cell: upsert its legs by FlightLabs
+        leg id and append a price_history row for every new leg and every leg
+        whose price changed.  Legs that did not change only get their
+        last_seen time updated.
+
+        returns the number of legs that were added or changed
+        '''
+        now = time.time() if now is None else now
+        rows = []
+        if legs is not None and not legs.empty:
+            legs = legs[flight_cache.LEG_COLUMNS].copy()
+            legs['Departs'] = pd.to_datetime(legs['Departs']).dt.strftime(STORE_DATE_FORMAT)
+            legs['Arrives'] = pd.to_datetime(legs['Arrives']).dt.strftime(STORE_DATE_FORMAT)
+            legs = legs.drop_duplicates('id', keep='last')
+            rows = list(legs.itertuples(index=False, name=None))
+
+        changed = 0
+        with self.lock:
+            known = {}
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                known.update((leg_id, rest) for leg_id, *rest in self.db.execute(
+                    'SELECT id, CarrierName, Origin, Destination, Departs, Arrives, Duration, Price '
+                    f'FROM legs WHERE id IN ({",".join("?" * len(chunk))})', chunk))
+
+            for row in rows:
+                leg_id, price = row[0], row[-1]
+                before = known.get(leg_id)
+                if before is not None and tuple(before) == tuple(row[1:]):
+                    self.db.execute('UPDATE legs SET last_seen = ? WHERE id = ?', (now, leg_id))
+                    continue
+                changed += 1
+                self.db.execute('''INSERT INTO legs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                   ON CONFLICT (id) DO UPDATE SET
+                                       CarrierName = excluded.CarrierName, Origin = excluded.Origin,
+                                       Destination = excluded.Destination, Departs = excluded.Departs,
+                                       Arrives = excluded.Arrives, Duration = excluded.Duration,
+                                       Price = excluded.Price, last_seen = excluded.last_seen''',
+                                (*row, now, now))
+                if before is None or before[-1] != price:
+                    self.db.execute('INSERT INTO price_history VALUES (?, ?, ?)', (leg_id, now, price))
+
+            self.db.execute('INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?)',
+                            (origin, destination, date, now, int(bool(complete)), len(rows)))
+            self.db.commit()
+        return changed
+
+    def refresh(self, api_key, codes, dates, now=None, **fetch_options):
+        '''
+        Fetch the stale cells (see stale_cells) with flight_fetcher.fetch_flights
+        and record each one as it arrives.  Cells that are still fresh cost
+        nothing.
+
+        inputs:
+
+            api_key         :   your api key from flightlabs
+            codes           :   list of IATA codes (every ordered pair is a cell)
+            dates           :   list of dates, YYYY-MM-DD
+            fetch_options   :   passed on to fetch_flights (concurrency, rate, ...)
+
+        returns a dict: cells checked, cells fetched, legs added or changed
+
+        This runs its own event loop: code that is already inside one has to
+        await refresh_async instead.
+        '''
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.refresh_async(api_key, codes, dates, now, **fetch_options))
+        raise RuntimeError('FlightStore.refresh was called inside a running event loop, '
+                           'use "await store.refresh_async(...)" there')
+
+    async def refresh_async(self, api_key, codes, dates, now=None, **fetch_options):
+        '''refresh for callers that already run an event loop (same inputs and result)'''
+        stale = self.stale_cells(codes, dates, now)
+        summary = {'cells': len(codes) * (len(codes) - 1) * len(dates), 'fetched': len(stale), 'changed': 0}
+
+        def on_result(result):
+            if result.legs is None:
+                #every attempt failed: leave the cell stale so the next refresh retries it
+                return
+            summary['changed'] += self.record(result.origin, result.destination, result.date,
+                                              result.legs, result.complete)
+
+        if stale:
+            await flight_fetcher.fetch_flights(api_key, stale, on_result=on_result, **fetch_options)
+        return summary
+
+    def legs(self, carriers=None):
+        '''every stored leg (current price) as a get_flights style dataframe, sorted by departure'''
+        query = 'SELECT id, CarrierName, Origin, Destination, Departs, Arrives, Duration, Price FROM legs'
+        params = []
+        if carriers is not None:
+            query += f' WHERE CarrierName IN ({",".join("?" * len(carriers))})'
+            params = list(carriers)
+        with self.lock:
+            legs = pd.read_sql_query(query + ' ORDER BY Departs, id', self.db, params=params)
+        legs['Departs'] = pd.to_datetime(legs['Departs'], format=STORE_DATE_FORMAT)
+        legs['Arrives'] = pd.to_datetime(legs['Arrives'], format=STORE_DATE_FORMAT)
+        return legs
+
+    def price_history(self, leg_id):
+        '''dataframe of (observed_at, Price) for one leg, oldest first'''
+        with self.lock:
+            history = pd.read_sql_query('SELECT observed_at, Price FROM price_history WHERE id = ? '
+                                        'ORDER BY observed_at', self.db, params=[leg_id])
+        history['observed_at'] = pd.to_datetime(history['observed_at'], unit='s')
+        return history
+
+    def export_csv(self, csv_path, carriers=None):
+        '''
+        (Re)write a cached_flights csv from the store.  The file is replaced in
+        one step, and flight_cache rebuilds its parquet cache on the next load.
+        '''
+        legs = self.legs(carriers)
+        temporary = csv_path + '.tmp'
+        legs.to_csv(temporary, date_format=flight_cache.CSV_DATE_FORMAT)
+        os.replace(temporary, csv_path)
+        return len(legs)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,161 @@
+#this python file contains the FlightLabs retrieveFlights api: the url, the
+#query parameters of one (origin, destination, date) and the parser of its
+#responses.  It only needs the airport registry, so the fetcher, the caches and
+#the tests can use it without loading the rest of dataloader (and streamlit).
+
+import json
+
+import numpy as np
+import pandas as pd
+import requests
+
+import airport_registry
+import response_cache
+
+BASE_URL = "https://www.goflightlabs.com/retrieveFlights"
+
+#-32385 is the identifier for delta
+DELTA_CARRIER_ID = -32385
+
+def get_flights(api_key , iata_origin, iata_destination, date, cache=None):
+
+    '''
+    -----------------------------------------------------------------------------
+    DOES:
+    -----------------------------------------------------------------------------
+    Gets all delta flights for a specific day using the arguments:
+
+    api_key             :   your api key from flightlabs
+
+    iata_origin         :   three-character airport code.  Remember, to limit
+                            the scope of the project, it must be one of the ones
+                            listed in the "airports" dictionary.
+
+    iata_destination    :   three-character airport code. Same rules as above
+
+    date                :   in YYYY-MM-DD format
+
+    cache               :   response_cache.ResponseCache to answer from / store
+                            into (default: response_cache.default_cache())
+    -----------------------------------------------------------------------------
+    RETURNS:
+    -----------------------------------------------------------------------------
+
+    pandas dataframe with columns   :   'id'            'CarrierName'   'Origin' 
+                                        'Destination'   'Departs'       'Arrives' 
+                                        'Duration'      'Price'
+
+    status_comp                     :   A boolean, if True is returned, then the
+                                        API call returned a status of complete.
+                                        
+    NOTES REGARDING INCOMPLETE STATUS (from FlightLabs):
+    
+    If you receive incomplete results, please wait a moment and try your request
+    again for the full information. Sometimes heavy queries may take longer to process.
+    Please be aware that incomplete API calls will still be counted towards your API usage.
+    '''
+    ##################################################
+    #Query the API:
+    ##################################################     
+
+    #responses already in the response cache (and still fresh) cost no API call:
+    params = flight_params(api_key, iata_origin, iata_destination, date)
+    cache = cache if cache is not None else response_cache.default_cache()
+    payload = cache.fetch(BASE_URL, params, lambda: requests.get(BASE_URL , params=params).json())
+    return parse_flights(payload)
+
+def flight_params(api_key, iata_origin, iata_destination, date):
+    '''the retrieveFlights query parameters for one (origin, destination, date)'''
+    registry = airport_registry.load_registry()
+    return  {   
+            #API Key:
+            'access_key'    :   api_key,
+            #ORIGIN:
+            #skyid: 3 char code:
+            'originSkyId'   :   iata_origin,
+            #Entity ID:
+            'originEntityId':   registry.entity_id(iata_origin),
+            #DESTINATION
+            #skyid: 3 char code:
+            'destinationSkyId'  :   iata_destination,
+            #EntityID
+            'destinationEntityId' : registry.entity_id(iata_destination),
+            #date
+            'date' : date,
+            #Cabin class premium economy: basic economy fares don't contribute to MQD on Delta!
+            'cabinClass' : 'premium_economy'
+            }
+
+#text columns of a leg, filled in by parse_flights:
+TEXT_COLUMNS = ['id', 'CarrierName', 'Origin', 'Destination', 'Departs', 'Arrives']
+
+#how the API writes timestamps, e.g. 2024-11-14T12:45:00
+API_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+def parse_api_dates(values):
+    try:
+        return pd.to_datetime(values, format=API_DATE_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values)
+
+def parse_flights(payload, carrier_id=DELTA_CARRIER_ID):
+    '''
+    Turn a retrieveFlights response (the raw body or the decoded json) into
+    the delta legs dataframe and the "status complete" flag (see get_flights
+    for the returned columns).
+
+    The body is decoded once, legs of other carriers are skipped before any
+    of their fields are read, and the delta legs are written straight into
+    column arrays sized for the whole response instead of one dict per leg.
+    That saves the per-leg rows, not the decoded json itself: the whole
+    response is still one json.loads (or arrives already decoded from the
+    response cache / requests), and that tree is the peak memory of a parse.
+    '''
+    if isinstance(payload, (bytes, str)):
+        payload = json.loads(payload)
+    itineraries = payload['itineraries']
+
+    ##################################################
+    #Column buffers:
+    ##################################################     
+
+    #upper bound on the number of legs, trimmed to the real count at the end
+    size = sum(len(each['legs']) for each in itineraries)
+    columns = {name: np.empty(size, dtype=object) for name in TEXT_COLUMNS}
+    duration = np.empty(size, dtype=np.int64)
+    price = np.empty(size, dtype=np.float64)
+
+    #the structure of this loop is dictated by the json/api call
+    #please review FlightLabs documentation if you need a refresher
+    #on how a json arrives once you call:
+
+    n = 0
+    for each in itineraries:
+        itinerary_price = each['price']['raw']
+        for leg in each['legs']:
+            marketing = leg['carriers']['marketing'][0]
+            #keep the leg if and only if delta flight
+            if marketing['id'] != carrier_id:
+                continue
+            columns['id'][n] = leg['id']
+            columns['CarrierName'][n] = marketing['name']
+            columns['Origin'][n] = leg['origin']['id']
+            columns['Destination'][n] = leg['destination']['id']
+            columns['Departs'][n] = leg['departure']
+            columns['Arrives'][n] = leg['arrival']
+            duration[n] = leg['durationInMinutes']
+            price[n] = itinerary_price
+            n += 1
+
+    ##################################################
+    #Create the output DataFrame:
+    ##################################################     
+    output_df = pd.DataFrame({name: values[:n] for name, values in columns.items()})
+    #convert to pandas datetime objects:
+    output_df['Departs'] = parse_api_dates(output_df['Departs'])
+    output_df['Arrives'] = parse_api_dates(output_df['Arrives'])
+    output_df['Duration'] = duration[:n]
+    output_df['Price'] = price[:n]
+
+    status_comp = payload['context']['status']=='complete'
+    return output_df , status_comp
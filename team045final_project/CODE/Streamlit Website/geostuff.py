@@ -1,60 +1,156 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import pydeck as pdk    
 import dataloader
+from functools import lru_cache
 from geopy.distance import geodesic
+from scipy.spatial import cKDTree
+#the spherical math itself (also used without streamlit, e.g. by schedule_generator):
+from great_circle import haversine_miles, unit_vectors, chord_length
 
-def get_origin_coordinates(IATA , airports_geo = dataloader.airports_geo,coordinates_only = False):
+#the haversine distance is within 0.5% of the ellipsoidal (geodesic) one: radius
+#searches in exact mode look this much further out before checking geodesically
+EXACT_MARGIN = 1.01
+
+def geodesic_miles(origin_coords, latitudes, longitudes):
+    '''exact (ellipsoidal) distance in miles from one point to each of many, with geopy'''
+    return np.array([geodesic(origin_coords, (lat, lon)).miles for lat, lon in zip(latitudes, longitudes)])
+
+class AirportIndex:
+    """Spatial index (k-d tree of unit vectors) over airports, for radius and nearest-airport queries"""
+    def __init__(self, codes, latitudes, longitudes):
+        known = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        self.codes = np.asarray(codes, dtype=object)[known]
+        self.latitude = np.asarray(latitudes, dtype=np.float64)[known]
+        self.longitude = np.asarray(longitudes, dtype=np.float64)[known]
+        self.tree = cKDTree(unit_vectors(self.latitude, self.longitude))
+
+    @classmethod
+    def from_registry(cls, registry):
+        return cls(registry.codes, registry.latitude, registry.longitude)
+
+    def within_radius(self, origin_coords, radius, exact=False):
+        '''
+        Airports within 'radius' miles of origin_coords ([latitude, longitude]),
+        nearest first.
+
+        returns:
+
+            codes       :   numpy array of IATA codes
+            distances   :   numpy array of their distances in miles (geodesic if
+                            exact, otherwise haversine)
+        '''
+        search = radius * EXACT_MARGIN + 1 if exact else radius
+        #a hair of slack so rounding in the chord can't drop an airport right on the edge
+        candidates = np.asarray(self.tree.query_ball_point(unit_vectors(*origin_coords)[0],
+                                                           chord_length(search) * (1 + 1e-9)), dtype=np.int64)
+        if exact:
+            distances = geodesic_miles(origin_coords, self.latitude[candidates], self.longitude[candidates])
+        else:
+            distances = haversine_miles(origin_coords[0], origin_coords[1],
+                                        self.latitude[candidates], self.longitude[candidates])
+        keep = distances <= radius
+        candidates, distances = candidates[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return self.codes[candidates[order]], distances[order]
+
+    def nearest(self, origin_coords, k=1, exact=False):
+        '''the k airports nearest to origin_coords: (codes, distances in miles), nearest first'''
+        k = min(k, len(self.codes))
+        if k <= 0:
+            return self.codes[:0], np.empty(0)
+        _, candidates = self.tree.query(unit_vectors(*origin_coords)[0], k=k)
+        candidates = np.atleast_1d(candidates)
+        if exact:
+            distances = geodesic_miles(origin_coords, self.latitude[candidates], self.longitude[candidates])
+        else:
+            distances = haversine_miles(origin_coords[0], origin_coords[1],
+                                        self.latitude[candidates], self.longitude[candidates])
+        order = np.argsort(distances, kind='stable')
+        return self.codes[candidates[order]], distances[order]
+
+@lru_cache(maxsize=None)
+def airport_index():
+    '''the spatial index over every airport in the registry, built the first time it is needed'''
+    return AirportIndex.from_registry(dataloader.registry)
+
+@lru_cache(maxsize=16)
+def distance_matrix(codes=tuple(dataloader.airports), exact=False):
+    '''
+    All-pairs distances in miles between the airports in 'codes' (a tuple,
+    default: the supported airports) as a pandas dataframe indexed both ways
+    by IATA code.  Computed once per set of codes and shared: don't modify it.
+    '''
+    coordinates = dataloader.registry.batch_coordinates(codes)
+    lat, lon = coordinates[:, 0], coordinates[:, 1]
+    if exact:
+        distances = np.array([geodesic_miles((lat[i], lon[i]), lat, lon) for i in range(len(codes))])
+    else:
+        distances = haversine_miles(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    return pd.DataFrame(distances, index=list(codes), columns=list(codes))
+
+def get_origin_coordinates(IATA , registry = dataloader.registry,coordinates_only = False):
     ''' 
     inputs:
 
         IATA            :   The IATA airport code
-        airports_geo    :   The pandas dataframe containing the geo information
+        registry        :   The airport registry to look the code up in
                             (currently stored in the dataloader py file)
     
     returns:
 
         a dictionary    :   {
-                            'City'      :   city name from the dataloader,
+                            'City'      :   city name from the registry,
                             'IATA'      :   the IATA code supplied,
                             'Latitude'  :   Latitude coordinate,
                             'Longitude' :   Longitude coordinate    
                             }
-    '''
-    cols =   ['City','IATA','Latitude','Longitude']
 
-    criteria = airports_geo['IATA']==IATA
+        None if the code is not a known airport
+    '''
+    output = registry.info(IATA)
 
-    if airports_geo[criteria].empty:
-        output = None
+    if output is None:
         return output
+    if coordinates_only:
+        return [output['Latitude'] , output['Longitude']]
     else:
-        output = airports_geo.query("IATA == @IATA")[cols].iloc[0,:].to_dict()
-        if coordinates_only:
-            return [output['Latitude'] , output['Longitude']]
-        else:
-            return output
+        return output
 
-def filter_airports_within_radius(origin_coords , radius , airports_geo=dataloader.airports_geo):
+def filter_airports_within_radius(origin_coords , radius , airports_geo=dataloader.airports_geo, exact=False):
     ''' 
     inputs
         origin_coords       :   a list: [latitude,longitude]
-        radius              :   float/int : radius in
+        radius              :   float/int : radius in miles
         airports_geo        :   The pandas dataframe containing the geo information
                                 (currently stored in the dataloader py file)
+        exact               :   measure with geopy's geodesic (ellipsoid) instead of
+                                the vectorized great circle distance
     
     outputs
-        pandas dataframe with desired results
+        list of the IATA codes of airports_geo within the radius
     '''
-
-    def calculate_distance(row):
-        return geodesic(origin_coords,(row['Latitude'],row['Longitude'])).miles
-    
-    distances = airports_geo.apply(calculate_distance,axis=1)
+    distances = haversine_miles(origin_coords[0], origin_coords[1],
+                                airports_geo['Latitude'].to_numpy(), airports_geo['Longitude'].to_numpy())
+    if exact:
+        #only the airports that could be inside get the (slow) exact check
+        close = distances <= radius * EXACT_MARGIN + 1
+        distances[close] = geodesic_miles(origin_coords, airports_geo['Latitude'].to_numpy()[close],
+                                          airports_geo['Longitude'].to_numpy()[close])
 
     return list(airports_geo[distances<=radius]['IATA'].unique())
-    
-
-
 
+def nearby_airports(origin_coords , radius , exact=False):
+    '''
+    Every airport (not just the supported ones) within 'radius' miles of
+    origin_coords ([latitude,longitude]), nearest first, from the spatial index.
 
+    outputs
+        pandas dataframe with the 'IATA', 'City', 'Latitude', 'Longitude' and
+        'Distance' (miles) of each airport
+    '''
+    codes, distances = airport_index().within_radius(origin_coords, radius, exact=exact)
+    output = dataloader.registry.frame(codes)[['IATA','City','Latitude','Longitude']]
+    output['Distance'] = distances
+    return output
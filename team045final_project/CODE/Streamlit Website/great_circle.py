@@ -0,0 +1,26 @@
+#this python file contains the great circle math on a spherical earth, with
+#numpy only: it is shared by geostuff (airport radius searches) and by
+#schedule_generator, which must not load streamlit or the app's data to use it.
+
+import numpy as np
+
+#mean earth radius, the sphere the fast (haversine) distances are measured on
+EARTH_RADIUS_MILES = 3958.7613
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    '''
+    Great circle distance in miles, vectorized: every argument can be a number
+    or a numpy array (arrays are broadcast against each other)
+    '''
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(each, dtype=np.float64)) for each in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def unit_vectors(latitudes, longitudes):
+    '''points on the unit sphere, shape (n, 3): straight-line distance between them grows with arc length'''
+    lat, lon = np.radians(np.asarray(latitudes, dtype=np.float64)), np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def chord_length(miles):
+    '''straight-line distance on the unit sphere between two points 'miles' apart along the surface'''
+    return 2 * np.sin(np.minimum(np.asarray(miles, dtype=np.float64) / EARTH_RADIUS_MILES, np.pi) / 2)
@@ -1,8 +1,146 @@
 import pydeck as pdk
 import streamlit as st
-import pandas as pd
 import numpy as np
 import dataloader
+import tracing
+
+#most points on a great circle arc drawn between two airports, and the arc
+#length (degrees) each extra point stands for: short hops are nearly straight
+ARC_POINTS = 24
+ARC_DEGREES_PER_POINT = 4.0
+
+#map coordinates are rounded to this many decimals (~100 m for airports, ~1 km
+#along arcs) before they are sent to the browser: enough for a country-wide
+#map, and much less JSON
+COORDINATE_DECIMALS = 3
+ARC_DECIMALS = 2
+
+#node sizes of the best ranked airports (in map order), and of all the others
+POINT_SIZES = [150000, 120000, 90000, 60000]
+DEFAULT_POINT_SIZE = 40000
+
+ORIGIN_COLOR = [255, 120, 0]
+STOP_COLOR = [0, 120, 255]
+
+#arcs are drawn thicker and more opaque the better the best route using them ranks
+ARC_WIDTHS = (2, 8)
+
+#great circle polylines already computed, by (airport, airport) in sorted order
+_arcs = {}
+
+def great_circle_arcs(start, end, points=ARC_POINTS):
+    '''
+    Great circle polylines between many pairs of points in one vectorized
+    pass (spherical linear interpolation of the unit vectors).
+
+    inputs:
+
+        start, end  :   arrays of shape (n, 2), latitude / longitude in degrees
+
+    returns an array of shape (n, points, 2): longitude / latitude along each arc
+    '''
+    def unit(coordinates):
+        lat, lon = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+        return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+    a, b = unit(np.asarray(start, dtype=np.float64)), unit(np.asarray(end, dtype=np.float64))
+    angle = np.arccos(np.clip((a * b).sum(axis=1), -1, 1))[:, None, None]
+    t = np.linspace(0, 1, points)[None, :, None]
+    #sin(angle) is 0 for a zero length arc: fall back to the (constant) straight line
+    sin_angle = np.sin(angle)
+    safe = np.where(sin_angle > 1e-12, sin_angle, 1)
+    weight_a = np.where(sin_angle > 1e-12, np.sin((1 - t) * angle) / safe, 1 - t)
+    weight_b = np.where(sin_angle > 1e-12, np.sin(t * angle) / safe, t)
+    xyz = weight_a * a[:, None, :] + weight_b * b[:, None, :]
+    latitude = np.degrees(np.arctan2(xyz[..., 2], np.hypot(xyz[..., 0], xyz[..., 1])))
+    longitude = np.degrees(np.arctan2(xyz[..., 1], xyz[..., 0]))
+    return np.stack([longitude, latitude], axis=-1)
+
+def airport_arcs(pairs):
+    '''
+    The rounded great circle polyline (list of [longitude, latitude]) of every
+    (IATA, IATA) pair in 'pairs', computed once per pair for the whole process.
+    Longer arcs get more points, up to ARC_POINTS.
+    '''
+    keys = [tuple(sorted(pair)) for pair in pairs]
+    missing = list(dict.fromkeys(key for key in keys if key not in _arcs))
+    if missing:
+        start = dataloader.registry.batch_coordinates([a for a, _ in missing])
+        end = dataloader.registry.batch_coordinates([b for _, b in missing])
+        arcs = great_circle_arcs(start, end).round(ARC_DECIMALS)
+        #central angle between the end points, from the haversine formula
+        lat1, lon1, lat2, lon2 = np.radians([start[:, 0], start[:, 1], end[:, 0], end[:, 1]])
+        a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+        angles = np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+        points = np.clip(np.ceil(angles / ARC_DEGREES_PER_POINT) + 1, 2, ARC_POINTS).astype(np.int64)
+        for key, arc, count in zip(missing, arcs, points.tolist()):
+            _arcs[key] = arc[np.linspace(0, ARC_POINTS - 1, count).round().astype(np.int64)].tolist()
+    return [_arcs[key] for key in keys]
+
+def map_payload(itineraries, scores):
+    '''
+    The node and arc records of the map for ranked routes, built in one pass
+    over all of their stops.
+
+    inputs:
+
+        itineraries :   tuple of itineraries (tuples of IATA codes), best ranked first
+        scores      :   their 'Weighted Score' (higher is better)
+
+    returns:
+
+        nodes       :   list of {'IATA', 'Latitude', 'Longitude', 'Color', 'PointSize'}:
+                        every airport once, orange where a route starts or ends
+                        and blue for the stops in between
+        arcs        :   list of {'path', 'Width', 'Color'}: every leg flown by
+                        any of the routes once, as a great circle polyline
+    '''
+    lengths = np.fromiter((len(stops) for stops in itineraries), dtype=np.int64, count=len(itineraries))
+    codes = np.array([code for stops in itineraries for code in stops], dtype=object)
+    if not len(codes):
+        return [], []
+    route = np.repeat(np.arange(len(itineraries)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    position = np.arange(len(codes)) - starts[route]
+    is_endpoint = (position == 0) | (position == lengths[route] - 1)
+    route_scores = np.asarray(scores, dtype=np.float64)
+
+    #nodes: the first time each airport appears decides its color and score
+    #(an origin scores 0 so it is never among the biggest points)
+    airports, first = np.unique(codes, return_index=True)
+    coordinates = dataloader.registry.batch_coordinates(airports)
+    known = ~np.isnan(coordinates).any(axis=1)
+    airports, first, coordinates = airports[known], first[known], coordinates[known]
+    node_scores = np.where(position[first] == 0, 0.0, route_scores[route[first]])
+    #biggest points for the best scores, ties in the order the airports were first seen
+    order = np.lexsort((first, -node_scores))
+    sizes = np.full(len(order), DEFAULT_POINT_SIZE)
+    sizes[:min(len(order), len(POINT_SIZES))] = POINT_SIZES[:len(order)]
+    nodes = [{'IATA': code, 'Latitude': latitude, 'Longitude': longitude,
+              'Color': ORIGIN_COLOR if endpoint else STOP_COLOR, 'PointSize': int(size)}
+             for code, latitude, longitude, endpoint, size in zip(
+                 airports[order].tolist(), *coordinates[order].round(COORDINATE_DECIMALS).T.tolist(),
+                 is_endpoint[first[order]].tolist(), sizes)]
+
+    #arcs: consecutive stops of the same route, once per airport pair, scored by the best route using it
+    leg = np.flatnonzero(position[1:] > 0)
+    pair_codes = np.column_stack([codes[leg], codes[leg + 1]])
+    pair_codes.sort(axis=1)
+    pairs, inverse = np.unique(pair_codes.astype(str), axis=0, return_inverse=True)
+    best = np.full(len(pairs), -np.inf)
+    np.maximum.at(best, inverse.ravel(), route_scores[route[leg + 1]])
+    #legs to or from an airport without coordinates are not drawn, like its node
+    drawn = np.isin(pairs, airports).all(axis=1)
+    pairs, best = pairs[drawn], best[drawn]
+    if not len(pairs):
+        return nodes, []
+    low, high = best.min(), best.max()
+    strength = (best - low) / (high - low) if high > low else np.ones(len(best))
+    widths = ARC_WIDTHS[0] + strength * (ARC_WIDTHS[1] - ARC_WIDTHS[0])
+    alphas = (80 + 150 * strength).astype(np.int64)
+    arcs = [{'path': path, 'Width': round(width, 1), 'Color': [*STOP_COLOR, alpha]}
+            for path, width, alpha in zip(airport_arcs(map(tuple, pairs.tolist())), widths.tolist(), alphas.tolist())]
+    return nodes, arcs
 
 def create_layer(data,radius=4):
     '''
@@ -10,14 +148,14 @@ def create_layer(data,radius=4):
 
     inputs:
 
-        data        :   a pandas dataframe with columns
-                        'City', 'IATA', 'Latitude', and 'Longitude'
-    
+        data        :   a pandas dataframe (or list of records) with columns
+                        'Latitude', 'Longitude', 'PointSize' and 'Color'
+
         layer_name  :   a string: name for the layer:
                         ideally this will just be origin and destination
     returns
 
-        pdk.Layer   :   A configured layer for Pydeck scatterplot          
+        pdk.Layer   :   A configured layer for Pydeck scatterplot
     '''
 
     return pdk.Layer    (
@@ -32,114 +170,52 @@ def create_layer(data,radius=4):
                         tooltip = True
                         )
 
+def create_arc_layer(data):
+    '''
+    Create a pydeck path layer for the arc records of map_payload: one great
+    circle polyline per leg, width and opacity by the best route flying it
+    '''
+    return pdk.Layer    (
+                        'PathLayer',
+                        data=data,
+                        get_path = 'path',
+                        get_width = 'Width',
+                        width_units = 'pixels',
+                        get_color = 'Color',
+                        pickable = False
+                        )
 
-
-
-
+@st.cache_resource(max_entries=64)
+def map_deck(itineraries, scores):
+    '''the pydeck Deck for ranked routes, built once per set of itineraries and scores'''
+    nodes, arcs = map_payload(itineraries, scores)
+    if nodes:
+        latitudes = [node['Latitude'] for node in nodes]
+        longitudes = [node['Longitude'] for node in nodes]
+        center_lat, center_lon = (min(latitudes) + max(latitudes)) / 2, (min(longitudes) + max(longitudes)) / 2
+    else:
+        #blank map of the US
+        center_lat, center_lon = 39.8, -98.6
+    view_state = pdk.ViewState(latitude=center_lat, longitude=center_lon, zoom=4, pitch=0)
+    return pdk.Deck(map_style="mapbox://styles/mapbox/light-v10",
+                    initial_view_state=view_state,
+                    layers=[create_arc_layer(arcs), create_layer(nodes)],
+                    tooltip={'text': '{IATA}'})
+
+@tracing.traced('plot_map')
 def plot_map(df):
     '''
-    Plot a map: separate layers/ coloring for origin and destinations.
-    If origin_coordinates is None or empty, display a blank map of the US.
-
-
-    the dataframe should have the 'Stops' and 'Weighted Score' columns
+    Plot a map: the airports of the ranked routes (orange where routes start
+    and end, blue for the stops, bigger for the best ranked) and every leg
+    they fly as a great circle arc.  If df is empty, display a blank map of
+    the US.
+
+    the dataframe should have the 'Itinerary' and 'Weighted Score' columns;
+    the layers are cached by the itineraries and scores, so redrawing the
+    same routes (every streamlit rerun) does not rebuild anything
     '''
-
-    # Initialize separate layers for nodes and edges:
-
-    nodes = []
-    edges = []
-
-    min_score,max_score = df['Weighted Score'].min(),df['Weighted Score'].max()
-
-    #set the interval: even though it seems unlikely in this situation,
-    #avoid division by zero
-
-    score_range = (max_score - min_score)
-
-    #define a lambda function to set the thickness based on 'thickness_range' input:
-    
-
-    #track unique nodes:
-
-    unique_nodes = set()
-
-    for _,row in df.iterrows():
-        #break up the stops:
-        stops = list(row['Itinerary'])
-        weighted_score  =   row['Weighted Score']
-        
-        
-        #check code in a little bit 
-        coordinates = [dataloader.get_airport_coordinates(code) for code in stops]
-
-        #add nodes:
-
-        if coordinates:
-            origin = coordinates[0]
-            if (origin[0],origin[1]) not in unique_nodes:
-                #set points identified as origin in ORANGE:
-                nodes.append({'Latitude': origin[0], 'Longitude': origin[1],"Color": [255, 120, 0],"Weighted Score" : 0})
-                unique_nodes.add((origin[0] , origin[1]))
-
-
-            #others should be BLUE:
-            for coord in coordinates[1:-1]:
-                stop = (coord[0] , coord[1])
-                if stop not in unique_nodes:
-                    nodes.append({'Latitude': coord[0] , 'Longitude':coord[1],"Color": [0, 120, 255],"Weighted Score":weighted_score})
-                    unique_nodes.add(stop)
-
-            #orange: last leg is the same as first in our current format:
-            last_stop = coordinates[-1]
-
-            if (last_stop[0],last_stop[1]) not in unique_nodes:
-                nodes.append({'Latitude':last_stop[0],'Longitude':last_stop[1],'Color':[255, 120, 0],"Weighted Score":weighted_score})
-                unique_nodes.add((last_stop[0] , last_stop[1]))
-
-        #add edges:
-        #for i in range(len(coordinates)-1):
-        #    edges.append({'path' : [coordinates[i],coordinates[i+1]], 'thickness' : thickness_scale(weighted_score)})
-        
- 
-    
-    
-            
-    
-
-    # Create a DataFrame for all coordinates:
-    all_coordinates = pd.DataFrame(nodes)
-
-    # Add PointSize column based on ranking:
-    point_sizes = [150000,120000,90000,60000]
-    all_coordinates.sort_values(by='Weighted Score', ascending=False, inplace=True)
-    all_coordinates.reset_index(drop=True, inplace=True)
-    all_coordinates['PointSize'] = all_coordinates.index.map(lambda idx: point_sizes[idx] if idx < len(point_sizes) else 40000)
-
-
-
-    # Create a layer for the origin and destination nodes:
-    origin_dest_layer = create_layer(all_coordinates, 'Nodes')
-
- 
-
-
-
-
-    lat_min , lat_max   =   all_coordinates['Latitude'].min() , all_coordinates['Latitude'].max()
-    lon_min , lon_max   =   all_coordinates['Longitude'].min() , all_coordinates['Longitude'].max()
-
-    center_lat , center_lon =   (lat_min + lat_max) / 2 , (lon_min + lon_max)/2
-
-    view_state  =   pdk.ViewState(latitude= center_lat , longitude=center_lon,zoom=4,pitch=0)
-
-    #render
-
-    st.pydeck_chart (
-                    pdk.Deck(
-                        map_style="mapbox://styles/mapbox/light-v10",
-                        initial_view_state=view_state,
-                        layers=(origin_dest_layer)
-                    ))
-    
-
+    itineraries = tuple(tuple(stops) for stops in df['Itinerary'])
+    scores = tuple(float(score) for score in df['Weighted Score'])
+    deck = map_deck(itineraries, scores)
+    tracing.count('map_points', len({code for stops in itineraries for code in stops}))
+    st.pydeck_chart(deck)
@@ -0,0 +1,135 @@
+#this python file contains the Pareto front of a route search: the routes no
+#other qualifying route beats on trip time, price and connections all at
+#once, and the "knee" of its time / price trade-off.  It is taken from the
+#exhaustive route list the search already has (see flight_index.enumerate_routes).
+
+#for Delta, the MQD a ticket earns is its price, so "MQD earned" is not a
+#separate objective: it is the search constraint (total price >= target),
+#and the front trades price off against time and connections.
+
+import numpy as np
+import pandas as pd
+
+#the objectives, all minimized, in the column order used below
+OBJECTIVES = ['Total Route Duration', 'Total Price', 'Connections']
+
+def non_dominated(objectives):
+    '''
+    Boolean mask of the rows of 'objectives' (an n x 3 array of duration,
+    price and connections, every column minimized) that no other row
+    dominates (no worse in every column and better in at least one).  Rows
+    with identical objectives are all kept.
+
+    Connections only take max_stops + 2 values, so the rows are handled one
+    connection count at a time, in increasing order, without a per-row loop:
+
+        -   within a count, after sorting by (duration, price), a row is
+            dominated if a row sorted before its block of identical rows
+            is no more expensive (a running minimum of price)
+        -   a row with fewer connections dominates it if it is no slower and
+            no more expensive: a binary search in the staircase of the
+            fronts of the lower counts (sorted by duration, running minimum
+            of price)
+    '''
+    objectives = np.asarray(objectives, dtype=np.float64).reshape(-1, 3)
+    keep = np.zeros(len(objectives), dtype=bool)
+    #staircase of the front of the lower connection counts:
+    stair_durations = stair_prices = np.empty(0)
+    for count in np.unique(objectives[:, 2]):
+        rows = np.flatnonzero(objectives[:, 2] == count)
+        durations, prices = objectives[rows, 0], objectives[rows, 1]
+        order = np.lexsort((prices, durations))
+        durations, prices, rows = durations[order], prices[order], rows[order]
+
+        #first row of each block of identical (duration, price) rows, and the
+        #cheapest price sorted before that block
+        new_block = np.ones(len(rows), dtype=bool)
+        new_block[1:] = (durations[1:] != durations[:-1]) | (prices[1:] != prices[:-1])
+        block_start = np.maximum.accumulate(np.where(new_block, np.arange(len(rows)), 0))
+        cheapest_before = np.concatenate([[np.inf], np.minimum.accumulate(prices)])[block_start]
+        front = cheapest_before > prices
+
+        if len(stair_durations):
+            step = np.searchsorted(stair_durations, durations, side='right') - 1
+            front &= (step < 0) | (stair_prices[np.maximum(step, 0)] > prices)
+
+        keep[rows[front]] = True
+        stair_durations = np.concatenate([stair_durations, durations[front]])
+        stair_prices = np.concatenate([stair_prices, prices[front]])
+        order = np.argsort(stair_durations, kind='stable')
+        stair_durations = stair_durations[order]
+        stair_prices = np.minimum.accumulate(stair_prices[order])
+    return keep
+
+class ParetoFront:
+    """The non-dominated routes of a search, with their objectives as one NumPy array"""
+    def __init__(self, routes, durations, prices, connections):
+        '''
+        inputs:
+
+            routes          :   tuples of leg ids, all non-dominated
+            durations       :   total route durations, seconds
+            prices          :   total prices (= MQD earned)
+            connections     :   number of connections
+        '''
+        #sorted by leg ids, so ties are broken the same way everywhere:
+        order = sorted(range(len(routes)), key=routes.__getitem__)
+        self.routes = [routes[i] for i in order]
+        self.objectives = np.column_stack([np.asarray(durations, dtype=np.float64)[order],
+                                           np.asarray(prices, dtype=np.float64)[order],
+                                           np.asarray(connections, dtype=np.float64)[order]]).reshape(len(order), 3)
+
+    @classmethod
+    def from_routes(cls, index, routes):
+        '''the front of an exhaustive route list (see flight_index.enumerate_routes)'''
+        durations, prices, connections = index.route_metrics(routes)
+        keep = non_dominated(np.column_stack([durations, prices, connections]).reshape(len(routes), 3))
+        return cls([route for route, kept in zip(routes, keep) if kept],
+                   durations[keep], prices[keep], connections[keep])
+
+    def __len__(self):
+        return len(self.routes)
+
+    @property
+    def durations(self):
+        return self.objectives[:, 0]
+
+    @property
+    def prices(self):
+        return self.objectives[:, 1]
+
+    @property
+    def connections(self):
+        return self.objectives[:, 2]
+
+    def knee(self):
+        '''
+        Position of the "knee" of the time / price trade-off: the route farthest
+        below the straight line between the fastest and the cheapest route
+        (normalized over the front), where giving up a little of one buys the
+        most of the other.  None for an empty front.
+        '''
+        if not len(self):
+            return None
+        points = self.objectives[:, :2]
+        low, high = points.min(axis=0), points.max(axis=0)
+        points = np.where(high > low, (points - low) / np.where(high > low, high - low, 1.0), 0.0)
+        #lexsort keys are (last key first): fastest with the lowest price / cheapest with the lowest time
+        fastest = points[np.lexsort((points[:, 1], points[:, 0]))[0]]
+        cheapest = points[np.lexsort((points[:, 0], points[:, 1]))[0]]
+        direction = cheapest - fastest
+        length = np.hypot(*direction)
+        if length == 0:
+            return int(np.argmin(points.sum(axis=1)))
+        #signed distance from the line, negative on the side of the ideal (0, 0) point:
+        side = (direction[0] * (points[:, 1] - fastest[1]) - direction[1] * (points[:, 0] - fastest[0])) / length
+        return int(np.argmin(side))
+
+    def frame(self):
+        '''the front as a dataframe for plotting: hours, price, connections and a knee flag'''
+        knee = self.knee()
+        output = pd.DataFrame({'Total Route Duration': self.durations / 3600,
+                               'Total Price': self.prices,
+                               'Connections': self.connections.astype(np.int64),
+                               'Knee': np.arange(len(self)) == knee})
+        return output.sort_values('Total Route Duration', kind='stable')
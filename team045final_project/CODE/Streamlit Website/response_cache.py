@@ -0,0 +1,239 @@
+#this python file contains the on-disk cache of FlightLabs retrieveFlights
+#responses.  Every call to the API costs quota (even the incomplete ones), so
+#a response is stored under the query it answers and reused until it goes
+#stale, and identical queries that are in flight at the same time share one
+#call.  The key includes the url the query is sent to, so responses of a test
+#or stub server are never served in place of the real API's.
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime
+
+DEFAULT_PATH = 'data/flightlabs_responses.sqlite'
+
+#parameters that do not change the answer and are left out of the cache key
+IGNORED_PARAMS = ('access_key',)
+
+#how long a response stays fresh, by days left until the departure date:
+#fares close to departure move quickly, far-out fares barely move
+HOUR = 3600
+TTL_BY_DAYS_OUT = [(3, 1 * HOUR), (14, 6 * HOUR), (60, 24 * HOUR)]
+FAR_OUT_TTL = 72 * HOUR
+
+def response_ttl(departure_date, now=None):
+    '''
+    Seconds a response for flights on 'departure_date' (YYYY-MM-DD) stays
+    fresh, None if it never expires (the departure date is in the past, so
+    the fares will not change any more).
+    '''
+    today = datetime.fromtimestamp(now).date() if now is not None else date.today()
+    days_out = (date.fromisoformat(departure_date) - today).days
+    if days_out < 0:
+        return None
+    for max_days, ttl in TTL_BY_DAYS_OUT:
+        if days_out <= max_days:
+            return ttl
+    return FAR_OUT_TTL
+
+def normalize_params(params):
+    '''the query as it is keyed: no api key, sorted names, codes upper case, all values text'''
+    normalized = {}
+    for name, value in params.items():
+        if name in IGNORED_PARAMS:
+            continue
+        value = str(value).strip()
+        if name.endswith('SkyId'):
+            value = value.upper()
+        normalized[name] = value
+    return dict(sorted(normalized.items()))
+
+def query_text(url, params):
+    '''the query as it is stored: the url and the normalized parameters, as json'''
+    return json.dumps({'url': url, 'params': normalize_params(params)}, separators=(',', ':'))
+
+def request_key(url, params):
+    '''content address of a query: sha256 of its url and normalized parameters'''
+    return hashlib.sha256(query_text(url, params).encode()).hexdigest()
+
+def is_complete(payload):
+    return payload.get('context', {}).get('status') == 'complete'
+
+class _Pending:
+    """A synchronous fetch in progress, waited on by identical requests"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.payload = None
+        self.error = None
+
+class ResponseCache:
+    """SQLite cache of retrieveFlights responses keyed by the url and the normalized query"""
+    def __init__(self, path=DEFAULT_PATH, ttl=response_ttl):
+        '''
+        inputs:
+
+            path    :   sqlite file (':memory:' for a cache that is not kept)
+            ttl     :   function (departure date, now) -> seconds fresh or None
+                        for never expires (default: response_ttl)
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS responses (
+                               key TEXT PRIMARY KEY,
+                               params TEXT NOT NULL,
+                               payload BLOB NOT NULL,
+                               fetched_at REAL NOT NULL,
+                               expires_at REAL)''')
+        self.db.commit()
+
+        self.pending = {}
+        self.async_pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.shared = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def get(self, url, params, now=None):
+        '''the cached response to 'params' sent to 'url' if there is a fresh one, else None'''
+        now = time.time() if now is None else now
+        with self.lock:
+            row = self.db.execute('SELECT payload, expires_at FROM responses WHERE key = ?',
+                                  (request_key(url, params),)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.bytes_read += len(row[0])
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, url, params, payload, now=None):
+        '''
+        Store the response to 'params' sent to 'url'.  Incomplete responses are
+        not stored: asking again later is the only way to get the full answer.
+        '''
+        if not is_complete(payload):
+            return False
+        now = time.time() if now is None else now
+        ttl = self.ttl(params['date'], now)
+        blob = zlib.compress(json.dumps(payload, separators=(',', ':')).encode())
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                            (request_key(url, params), query_text(url, params), blob,
+                             now, None if ttl is None else now + ttl))
+            self.db.commit()
+            self.stores += 1
+            self.bytes_written += len(blob)
+        return True
+
+    def fetch(self, url, params, call):
+        '''
+        The response to 'params' sent to 'url': from the cache if fresh,
+        otherwise from call() (which queries the API), stored if complete.
+        Threads asking for the same query while it is being fetched wait for
+        that fetch instead of making their own call.
+        '''
+        payload = self.get(url, params)
+        if payload is not None:
+            return payload
+
+        key = request_key(url, params)
+        with self.lock:
+            pending = self.pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self.pending[key] = _Pending()
+            else:
+                self.shared += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.payload
+
+        try:
+            pending.payload = call()
+            self.put(url, params, pending.payload)
+            return pending.payload
+        except BaseException as error:
+            pending.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+            pending.done.set()
+
+    async def fetch_async(self, url, params, call):
+        '''
+        fetch for asyncio: 'call' is a coroutine function, and coroutines
+        asking for the same query while it is being fetched await that fetch.
+        '''
+        payload = self.get(url, params)
+        if payload is not None:
+            return payload
+
+        key = request_key(url, params)
+        pending = self.async_pending.get(key)
+        if pending is not None:
+            self.shared += 1
+            return await asyncio.shield(pending)
+
+        pending = self.async_pending[key] = asyncio.get_running_loop().create_future()
+        try:
+            payload = await call()
+            self.put(url, params, payload)
+            pending.set_result(payload)
+            return payload
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as error:
+            pending.set_exception(error)
+            #nobody else may be waiting: don't warn about an unretrieved exception
+            pending.exception()
+            raise
+        finally:
+            del self.async_pending[key]
+
+    def purge(self, now=None):
+        '''delete the expired responses, returns how many were deleted'''
+        now = time.time() if now is None else now
+        with self.lock:
+            deleted = self.db.execute('DELETE FROM responses WHERE expires_at <= ?', (now,)).rowcount
+            self.db.commit()
+        return deleted
+
+    def stats(self):
+        with self.lock:
+            entries, stored_bytes = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM responses').fetchone()
+            return {'entries': entries, 'stored_bytes': stored_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                    'shared': self.shared, 'bytes_read': self.bytes_read,
+                    'bytes_written': self.bytes_written}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+#one cache per sqlite file, shared by every caller in the process
+_caches = {}
+_caches_lock = threading.Lock()
+
+def default_cache(path=DEFAULT_PATH):
+    with _caches_lock:
+        if path not in _caches:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _caches[path] = ResponseCache(path)
+        return _caches[path]
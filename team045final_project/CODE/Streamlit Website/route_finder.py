@@ -0,0 +1,388 @@
+#this python file contains the flight data, route search and ranking classes
+#of the app.  Nothing in here touches streamlit, so the same code answers the
+#app's searches and the headless ones (see search_service.py).
+
+from datetime import datetime
+from functools import partial
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from flight_cache import load_legs
+from flight_index import FlightIndex, enumerate_routes, parallel_enumerate_routes
+from pareto_front import ParetoFront
+from route_search import optimal_route, top_k_routes
+
+class FlightData:
+    """Class to load and preprocess flight data.
+    After load_data, self.data is the canonical leg table (sorted by departure time) and is never changed:
+    the filter_* methods return FlightView objects over it instead."""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.data = None
+        #to make the columns in the input file
+        #match what was coded:
+        self.column_mapping = {
+                                'origin': 'Origin',
+                                'destination': 'Destination',
+                                'departure': 'Departs',
+                                'arrival': 'Arrives',
+                                'price': 'Price'}
+        
+
+    def load_data(self):
+        #typed, date-parsed legs from the parquet cache of the csv (see flight_cache.py),
+        #already sorted by departure time so a date window is a binary search
+        self.data = load_legs(self.file_path, carriers=['Delta'])
+        self.departs = self.data['Departs'].to_numpy(dtype='datetime64[ns]')
+        self.departs.flags.writeable = False
+
+    def view(self):
+        """A view over every flight"""
+        return FlightView(self, slice(0, len(self.data)))
+
+    def filter_airports(self, airports):
+        return self.view().filter_airports(airports)
+
+    def filter_dates(self, start_date, end_date):
+        return self.view().filter_dates(start_date, end_date)
+
+    def filter_carriers(self, carriers):
+        return self.view().filter_carriers(carriers)
+
+class FlightView:
+    """A read-only subset of a FlightData table, stored as row positions (a slice or a sorted array) into it.
+    Filters return new views and never copy or change the table; .data builds the dataframe when it is needed."""
+    def __init__(self, flight_data, positions):
+        self.flight_data = flight_data
+        self.positions = positions
+
+    def __len__(self):
+        if isinstance(self.positions, slice):
+            return self.positions.stop - self.positions.start
+        return len(self.positions)
+
+    @property
+    def data(self):
+        return self.flight_data.data.iloc[self.positions]
+
+    def position_array(self):
+        if isinstance(self.positions, slice):
+            return np.arange(self.positions.start, self.positions.stop)
+        return self.positions
+
+    def where(self, mask):
+        '''the rows of this view where 'mask' (a boolean array over the whole table) is True'''
+        positions = self.position_array()
+        return FlightView(self.flight_data, positions[mask[positions]])
+
+    def filter_airports(self, airports):
+        data = self.flight_data.data
+        return self.where((data['Origin'].isin(airports) & data['Destination'].isin(airports)).to_numpy())
+
+    def filter_carriers(self, carriers):
+        return self.where(self.flight_data.data['CarrierName'].isin(carriers).to_numpy())
+
+    def filter_dates(self, start_date, end_date):
+        '''flights departing between start_date and end_date (inclusive): O(log n) on the departure index'''
+        start_date = np.datetime64(datetime.combine(start_date, datetime.min.time()), 'ns')
+        end_date = np.datetime64(datetime.combine(end_date, datetime.max.time()), 'ns')
+        first = int(np.searchsorted(self.flight_data.departs, start_date, side='left'))
+        last = int(np.searchsorted(self.flight_data.departs, end_date, side='right'))
+        if isinstance(self.positions, slice):
+            first, last = max(first, self.positions.start), min(last, self.positions.stop)
+            return FlightView(self.flight_data, slice(first, max(first, last)))
+        #positions are sorted, so the window is a slice of them too:
+        lo, hi = np.searchsorted(self.positions, [first, last])
+        return FlightView(self.flight_data, self.positions[lo:hi])
+    
+class RouteFinder:
+    """Class to find all possible routes from a given origin airport (or set of co-terminal airports) and target miles"""
+    def __init__(self, flight_data, origin, target_miles, min_layover, max_stops, flight_index=None):
+        '''
+        origin          :   an IATA code, or a list of co-terminal IATA codes (e.g. ['JFK','LGA','EWR']):
+                            routes leave from any of them and may come back to any of them
+        '''
+        self.flight_data = flight_data
+        self.origin = origin
+        self.target_miles = target_miles
+        self.min_layover = min_layover
+        self.max_stops = max_stops
+        #prebuilt connection index, pass one in to reuse it across searches:
+        self.flight_index = flight_index if flight_index is not None else FlightIndex(flight_data)
+
+    def find_route_ids(self, workers=None):
+        """Find all possible routes from the origin airport as tuples of leg ids (positions in flight_data).
+        Pass workers > 1 to spread the search over that many processes."""
+        #explored / pruned counts of the last search (single process searches only):
+        self.search_stats = {}
+        if workers is not None and workers > 1:
+            search = partial(parallel_enumerate_routes, workers=workers)
+        else:
+            search = partial(enumerate_routes, stats=self.search_stats)
+        routes, self.route_prices, self.route_durations = search(self.flight_index, self.origin,
+                                                                 self.target_miles, self.min_layover,
+                                                                 self.max_stops)
+        return routes
+
+    def find_routes(self, workers=None):
+        """Find all possible routes from the origin airport"""
+        return [self.flight_index.route_rows(route) for route in self.find_route_ids(workers)]
+
+    def find_top_route_ids(self, k, weight_time, connection_weight=0, scales=None):
+        """Find only the k best routes under the rerank_routes weights (see route_search.top_k_routes), best first"""
+        routes, self.route_scores = top_k_routes(self.flight_index, self.origin, self.target_miles,
+                                                 self.min_layover, self.max_stops, k,
+                                                 weight_time, connection_weight, scales)
+        return routes
+
+    def find_top_routes(self, k, weight_time, connection_weight=0, scales=None):
+        """Find only the k best routes under the rerank_routes weights, best first"""
+        return [self.flight_index.route_rows(route)
+                for route in self.find_top_route_ids(k, weight_time, connection_weight, scales)]
+
+    def find_pareto_front(self, workers=None):
+        """Find the routes no other route beats on duration, price and connections at once,
+        as a ParetoFront of the exhaustive search (see pareto_front.ParetoFront.from_routes)"""
+        return ParetoFront.from_routes(self.flight_index, self.find_route_ids(workers))
+
+    def find_optimal_route_ids(self, objective='price', max_duration=None):
+        """Find the single cheapest ('price') or shortest ('duration') route, optionally back within
+        max_duration (see route_search.optimal_route), as (leg ids, value); (None, None) if none qualifies"""
+        return optimal_route(self.flight_index, self.origin, self.target_miles, self.min_layover,
+                             self.max_stops, objective, max_duration)
+
+class RouteRanker:
+    """Class rank routes based on multi-objective optimization (MOO) weights or user-defined weights, input routes is from RouteFinder.
+    Route metrics are kept in NumPy arrays and scored in bulk, display rows are only built for the routes returned."""
+    def __init__(self, routes, weight_time, connection_weight=0, flight_index=None):
+        '''
+        routes          :   either the lists of pandas Series from RouteFinder.find_routes, or
+                            (with flight_index) the tuples of leg ids from RouteFinder.find_route_ids
+        '''
+        self.routes = routes
+        self.flight_index = flight_index
+        self.weight_time = weight_time
+        self.weight_cost = 1 - weight_time
+        self.connection_weight = connection_weight
+
+        if flight_index is not None:
+            lengths = np.fromiter((len(route) for route in routes), dtype=np.int64, count=len(routes))
+            legs = np.fromiter(chain.from_iterable(routes), dtype=np.int64, count=int(lengths.sum()))
+            starts = np.cumsum(lengths) - lengths
+            first_legs, last_legs = legs[starts], legs[starts + lengths - 1]
+            self.all_route_durations = (flight_index.arrives[last_legs] - flight_index.departs[first_legs]).astype(np.float64)
+            self.all_prices = np.add.reduceat(flight_index.price[legs], starts) if len(routes) else np.empty(0)
+            self.route_legs_flat, self.route_starts = legs, starts
+            #every airport a route touches, as (route number, airport id) pairs:
+            route_numbers = np.repeat(np.arange(len(routes)), lengths)
+            stop_pairs = (np.concatenate([route_numbers, route_numbers]),
+                          np.concatenate([flight_index.origin[legs], flight_index.destination[legs]]))
+            airport_count = len(flight_index.airports)
+        else:
+            self.all_route_durations = np.array([(route[-1]['Arrives'] - route[0]['Departs']).total_seconds() for route in routes])
+            self.all_prices = np.array([sum(f['Price'] for f in route) for route in routes])
+            lengths = np.array([len(route) for route in routes], dtype=np.int64)
+            airport_codes, airport_ids = {}, []
+            for route in routes:
+                for f in route:
+                    airport_ids.append(airport_codes.setdefault(f['Origin'], len(airport_codes)))
+                    airport_ids.append(airport_codes.setdefault(f['Destination'], len(airport_codes)))
+            stop_pairs = (np.repeat(np.arange(len(routes)), 2 * lengths), np.array(airport_ids, dtype=np.int64))
+            airport_count = len(airport_codes)
+        self.all_connections = lengths - 1
+
+        #routes x airports: True where the route lands at or leaves from the airport
+        self.route_stops = np.zeros((len(routes), airport_count), dtype=bool)
+        self.route_stops[stop_pairs] = True
+
+    def normalize_data(self, data):
+        normalized_data = {}
+        for key, values in data.items():
+            values = np.asarray(values, dtype=np.float64)
+            min_value, max_value = values.min(), values.max()
+            normalized_data[key] = (values - min_value) / (max_value - min_value) if max_value > min_value else np.zeros(len(values))
+        return normalized_data
+
+    def calculate_weighted_score(self, normalized_data, weights):
+        weighted_scores = np.zeros(len(self.routes))
+        for key, weight in weights.items():
+            weighted_scores += normalized_data[key] * weight
+        return weighted_scores
+
+    def relevance(self, weighted_scores, weights):
+        '''turn weighted scores (lower is better) into a non-negative relevance (higher is better)'''
+        return sum(weights.values()) - weighted_scores
+
+    def route_scores(self, weights):
+        '''the relevance (higher is better, before diversification) of every route under 'weights' '''
+        data = {
+            "Total Route Duration": self.all_route_durations,
+            "Total Price": self.all_prices,
+            "Connections": self.all_connections
+        }
+        return self.relevance(self.calculate_weighted_score(self.normalize_data(data), weights), weights)
+
+    def route_key_columns(self):
+        '''
+        A sort key per route (one row per route, compared column by column) that
+        does not depend on the order find_routes produced them in, used to break
+        ties: the leg ids padded with -1, so a shorter route sorts before its
+        extensions, or for pandas routes the rank of their departure times and airports.
+        '''
+        if self.flight_index is not None:
+            lengths = self.all_connections + 1
+            width = int(lengths.max()) if len(lengths) else 0
+            columns = np.full((len(self.routes), width), -1, dtype=np.int64)
+            route_numbers = np.repeat(np.arange(len(self.routes)), lengths)
+            columns[route_numbers, np.arange(len(self.route_legs_flat)) - np.repeat(self.route_starts, lengths)] = self.route_legs_flat
+            return columns
+        keys = [tuple((f['Departs'].value, f['Origin'], f['Destination']) for f in route) for route in self.routes]
+        ranks = np.empty((len(keys), 1), dtype=np.int64)
+        ranks[sorted(range(len(keys)), key=keys.__getitem__), 0] = np.arange(len(keys))
+        return ranks
+
+    def diversified_order(self, relevance, top_n=None):
+        '''
+        Diversified top-N selection (greedy, MMR-style): repeatedly pick the route
+        with the highest
+
+            relevance / (1 + number of its stops already covered by the picked routes)
+
+        with ties going to the smaller route key, so the result does not depend on
+        the input order.
+
+        The scores only change when a pick covers an airport no earlier pick
+        stopped at, which can happen at most once per airport.  So the remaining
+        routes are sorted once, picked straight down that order up to the next
+        route that covers a new airport, and only then are the common-stop
+        counters of the routes stopping at the new airports bumped and the rest
+        re-sorted.
+
+        returns:
+
+            order       :   positions of the picked routes, best first
+            scores      :   their diversified scores
+        '''
+        n = len(relevance)
+        top_n = n if top_n is None else min(top_n, n)
+        key_columns = self.route_key_columns()
+        covered = np.zeros(self.route_stops.shape[1], dtype=bool)
+        common_stops = np.zeros(n, dtype=np.int64)
+
+        order, scores = [], []
+        remaining = np.arange(n)
+        while remaining.size and len(order) < top_n:
+            remaining_scores = relevance[remaining] / (1 + common_stops[remaining])
+            #only the best 'wanted' routes (and anything tied with them) can be
+            #picked before the next re-sort, the others are set aside unsorted
+            wanted = top_n - len(order)
+            set_aside = remaining[:0]
+            if wanted < remaining.size:
+                kth_score = remaining_scores[np.argpartition(-remaining_scores, wanted - 1)[wanted - 1]]
+                candidates = remaining_scores >= kth_score
+                set_aside = remaining[~candidates]
+                remaining, remaining_scores = remaining[candidates], remaining_scores[candidates]
+            by_score = np.lexsort(tuple(key_columns[remaining].T[::-1]) + (-remaining_scores,))
+            remaining, remaining_scores = remaining[by_score], remaining_scores[by_score]
+
+            #everything up to (and including) the first route with a new stop is picked as sorted:
+            new_stops = (self.route_stops[remaining] & ~covered).any(axis=1)
+            last = int(np.argmax(new_stops)) if new_stops.any() else remaining.size - 1
+            last = min(last, wanted - 1)
+            order.extend(remaining[:last + 1])
+            scores.extend(remaining_scores[:last + 1])
+
+            picked = remaining[last]
+            for airport in np.flatnonzero(self.route_stops[picked] & ~covered):
+                covered[airport] = True
+                common_stops += self.route_stops[:, airport]
+            remaining = np.concatenate([remaining[last + 1:], set_aside])
+
+        return np.array(order, dtype=np.int64), np.array(scores)
+
+    def route_legs(self, i):
+        route = self.routes[i]
+        return self.flight_index.route_rows(route) if self.flight_index is not None else route
+
+    def ranked_rows(self, order, scores, time_label):
+        '''
+        the display dicts, only for the routes in 'order'.  'Legs' is the route
+        itself (leg ids, or the list of Series): the per-leg details are only
+        built when a user opens a route (see itinerary_details)
+        '''
+        ranked = []
+        for i, score in zip(order, scores):
+            route = self.route_legs(i)
+            all_stops = [flight['Origin'] for flight in route] + [route[-1]['Destination']]
+
+            ranked.append({
+                f'Departure Time{time_label}': route[0]['Departs'].strftime('%m/%d/%Y %H:%M'),
+                f'Arrival Time{time_label}': route[-1]['Arrives'].strftime('%m/%d/%Y %H:%M'),
+                'Total In-flight Duration': sum(round(flight['Duration'] / 60, 2) for flight in route),
+                'Total Route Duration': round(self.all_route_durations[i] / 3600, 2),
+                'Total Price': self.all_prices[i],
+                'Weighted Score': score,
+                'Itinerary': tuple(all_stops),
+                'Legs': self.routes[i]
+            })
+        return pd.DataFrame(ranked, index=pd.Index(order, dtype=np.int64))
+
+    def rank_initial_routes(self, top_n=None):
+        """Rank routes based on MOO weights computed from information entropy. Return a DataFrame of ranked routes
+        (only the best top_n if given) and the MOO weight dictionary"""
+        data = {
+            "Total Route Duration": self.all_route_durations,
+            "Total Price": self.all_prices,
+            "Connections": self.all_connections
+        }
+        normalized_data = self.normalize_data(data)
+
+        normalized = np.vstack(list(normalized_data.values()))
+        p = normalized / normalized.sum(axis=1, keepdims=True)
+        entropy = -(1 / np.log(len(self.routes))) * np.nansum(p * np.log(p + 1e-9), axis=1)
+        weights = (1 - entropy) / (1 - entropy).sum()
+
+        weights_dict = {
+            "Total Route Duration": round(weights[0], 2),
+            "Total Price": round(weights[1], 2),
+            "Connections": round(weights[2], 2)
+        }
+
+        weighted_scores = self.calculate_weighted_score(normalized_data, weights_dict)
+        order, scores = self.diversified_order(self.relevance(weighted_scores, weights_dict), top_n)
+        return self.ranked_rows(order, scores, time_label=''), weights_dict
+    
+    def rerank_routes(self, top_n=None):
+        """Rank routes based on user-defined weights. Return a DataFrame of ranked routes (only the best top_n if given)"""
+        data = {
+            "Total Route Duration": self.all_route_durations,
+            "Total Price": self.all_prices,
+            "Connections": self.all_connections
+        }
+        normalized_data = self.normalize_data(data)
+        weights = {
+            "Total Route Duration": self.weight_time,
+            "Total Price": self.weight_cost,
+            "Connections": self.connection_weight  # Assuming no weight for connections in rerank_routes
+        }
+        weighted_scores = self.calculate_weighted_score(normalized_data, weights)
+        order, scores = self.diversified_order(self.relevance(weighted_scores, weights), top_n)
+        return self.ranked_rows(order, scores, time_label=':')
+
+
+def itinerary_details(route, flight_index=None):
+    '''
+    The legs of a ranked route ('Legs' of RouteRanker.ranked_rows) as display
+    dicts: memoized per route by flight_index.itinerary for leg ids, built
+    from the rows for a list of pandas Series
+    '''
+    if flight_index is not None:
+        return flight_index.itinerary(route)
+    return [{'Origin': flight['Origin'],
+             'Destination': flight['Destination'],
+             'Departs': flight['Departs'].strftime('%m/%d/%Y %H:%M'),
+             'Arrives': flight['Arrives'].strftime('%m/%d/%Y %H:%M'),
+             'Price': flight['Price'],
+             'Duration': round(flight['Duration'] / 60, 2)} for flight in route]
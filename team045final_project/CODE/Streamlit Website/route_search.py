@@ -0,0 +1,379 @@
+#this python file contains the searches that find the best routes without
+#enumerating every qualifying loop first (see flight_index.enumerate_routes
+#for the exhaustive one).
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+def leg_bounds(index, origin, min_layover):
+    '''
+    Admissible "best case to get home" bounds for every leg of a FlightIndex,
+    computed in one backward pass over the legs in descending departure order.
+    'origin' is one IATA code or a set of co-terminal ones (any of them is home).
+
+    returns (all numpy arrays indexed by leg id):
+
+        hops            :   fewest extra legs needed after this one to be back at
+                            origin (0 if it lands at origin, a large number if it
+                            cannot get back within the schedule)
+        earliest_home   :   earliest possible arrival back at origin, epoch seconds
+        cheapest_home   :   cheapest possible price of the extra legs
+    '''
+    n = len(index)
+    no_way_home = n + 1
+    first, end = index.connection_ranges(min_layover)
+
+    hops = np.full(n, no_way_home, dtype=np.int64)
+    earliest_home = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+    cheapest_home = np.full(n, np.inf)
+
+    #suffix minimums over the legs sorted by (origin, departure), so the best
+    #value over "every connection of a leg" is a single lookup at first[leg].
+    #one extra slot per airport group end keeps the lookups in range.
+    sorted_hops = np.full(n + 1, no_way_home, dtype=np.int64).tolist()
+    sorted_earliest = np.full(n + 1, np.iinfo(np.int64).max, dtype=np.int64).tolist()
+    sorted_cheapest = np.full(n + 1, np.inf).tolist()
+
+    position = np.empty(n, dtype=np.int64)
+    position[index.order] = np.arange(n)
+    #later departures first; legs of one airport that leave at the same time are
+    #done from the back of the group so the suffix they read is already filled in
+    backward = np.lexsort((-position, -index.departs)).tolist()
+    group_end = index.group_end[index.origin].tolist()
+
+    lands_home = index.lands_home(origin).tolist()
+    arrives = index.arrives.tolist()
+    price = index.price.tolist()
+    first, end = first.tolist(), end.tolist()
+    position = position.tolist()
+
+    for leg in backward:
+        if lands_home[leg]:
+            leg_hops, leg_earliest, leg_cheapest = 0, arrives[leg], 0.0
+        else:
+            start = first[leg] if first[leg] < end[leg] else n
+            leg_hops = min(1 + sorted_hops[start], no_way_home)
+            leg_earliest = sorted_earliest[start]
+            leg_cheapest = sorted_cheapest[start]
+
+        hops[leg], earliest_home[leg], cheapest_home[leg] = leg_hops, leg_earliest, leg_cheapest
+
+        #fold this leg into the suffix minimums of its own departure airport:
+        pos = position[leg]
+        after = pos + 1 if pos + 1 < group_end[leg] else n
+        sorted_hops[pos] = min(leg_hops, sorted_hops[after])
+        sorted_earliest[pos] = min(leg_earliest, sorted_earliest[after])
+        sorted_cheapest[pos] = min(price[leg] + leg_cheapest, sorted_cheapest[after])
+
+    return hops, earliest_home, cheapest_home
+
+#MQD buckets of completion_bounds: the target is cut into this many steps
+MQD_BUCKETS = 64
+
+def completion_bounds(index, origin, min_layover, target_miles, buckets=MQD_BUCKETS):
+    '''
+    For every leg and every "MQD still needed" bucket, a lower bound on the
+    price of the cheapest way home from the end of that leg that earns at
+    least that much: a dynamic program over (leg, MQD bucket) states, in one
+    backward pass like leg_bounds.
+
+    The amount still needed is rounded down to a multiple of
+    step = target_miles / buckets before looking it up, and the stop limit is
+    ignored, so the bound never overestimates.  It is infinite when no way
+    home can earn that much.
+
+    returns:
+
+        bounds          :   numpy array (legs x buckets + 1): bounds[leg, k] is the
+                            cheapest way home from leg earning at least k * step
+        step            :   the bucket width in MQD
+    '''
+    n = len(index)
+    step = max(float(target_miles), 1.0) / buckets
+    bucket_range = np.arange(buckets + 1)
+    lands_home = index.lands_home(origin)
+    first, end = index.connection_ranges(min_layover)
+
+    bounds = np.full((n, buckets + 1), np.inf)
+    #suffix minimums over the legs sorted by (origin, departure) of the price of
+    #"take this leg, then the cheapest way home": row n is the empty suffix
+    suffix = np.full((n + 1, buckets + 1), np.inf)
+
+    position = np.empty(n, dtype=np.int64)
+    position[index.order] = np.arange(n)
+    backward = np.lexsort((-position, -index.departs)).tolist()
+    group_end = index.group_end[index.origin].tolist()
+    price = index.price.tolist()
+    first, end = first.tolist(), end.tolist()
+    position = position.tolist()
+
+    for leg in backward:
+        start = first[leg] if first[leg] < end[leg] else n
+        bounds[leg] = suffix[start]
+
+        #taking this leg as the next one: it pays for ceil(price / step) buckets
+        #of what is still needed, the rest has to come after it
+        if lands_home[leg]:
+            through = np.where(bucket_range * step <= price[leg], price[leg], np.inf)
+        else:
+            paid = int(np.ceil(price[leg] / step))
+            through = price[leg] + bounds[leg][np.maximum(bucket_range - paid, 0)]
+
+        pos = position[leg]
+        after = pos + 1 if pos + 1 < group_end[leg] else n
+        np.minimum(through, suffix[after], out=suffix[pos])
+
+    return bounds, step
+
+def default_scales(index, max_stops):
+    '''
+    Fixed normalization ranges for route_score: the schedule's time span, the
+    most a route of max_stops + 2 of the dearest leg could cost, and the most
+    connections a route can have.
+    '''
+    if len(index) == 0:
+        return 1.0, 1.0, 1.0
+    duration_scale = max(float(index.arrives.max() - index.departs.min()), 1.0)
+    price_scale = max(float(index.price.max()) * (max_stops + 2), 1.0)
+    connection_scale = float(max_stops + 1)
+    return duration_scale, price_scale, connection_scale
+
+def route_score(duration, price, connections, weights, scales):
+    '''
+    The RouteRanker.rerank_routes objective (lower is better) with fixed
+    normalization ranges instead of the min-max of the candidate set:
+
+        weight_time * duration / duration_scale
+        + weight_cost * price / price_scale
+        + connection_weight * connections / connection_scale
+    '''
+    weight_time, weight_cost, connection_weight = weights
+    duration_scale, price_scale, connection_scale = scales
+    return (weight_time * (duration / duration_scale)
+            + weight_cost * (price / price_scale)
+            + connection_weight * (connections / connection_scale))
+
+def top_k_routes(index, origin, target_miles, min_layover, max_stops, k,
+                 weight_time, connection_weight=0, scales=None):
+    '''
+    Best-first search for the k best qualifying routes (same rules as
+    flight_index.enumerate_routes) under route_score, with cost weight
+    1 - weight_time as in RouteRanker.
+
+    Partial routes are expanded in order of an admissible lower bound on the
+    score of any route they can still become (see leg_bounds), and are dropped
+    as soon as they cannot close the loop back to origin within max_stops + 2
+    legs and the schedule, or their bound is already worse than the k-th best
+    route found so far.  The result is the same as scoring every route from the
+    exhaustive search and keeping the k best (ties broken by leg ids).
+
+    returns:
+
+        routes          :   list of up to k tuples of leg ids, best first
+        scores          :   list of their route_score
+    '''
+    weights = (weight_time, 1 - weight_time, connection_weight)
+    scales = scales if scales is not None else default_scales(index, max_stops)
+    max_legs = max_stops + 2
+    hops, earliest_home, cheapest_home = leg_bounds(index, origin, min_layover)
+
+    connections = index.connection_lists(min_layover)
+    lands_home = index.lands_home(origin).tolist()
+    price = index.price.tolist()
+    departs = index.departs.tolist()
+    arrives = index.arrives.tolist()
+    hops, earliest_home, cheapest_home = hops.tolist(), earliest_home.tolist(), cheapest_home.tolist()
+
+    def bound(route, total, leg):
+        #cheapest_home is summed in a different order than the real route, so
+        #allow for rounding to keep the bound from creeping above the real score
+        best_price = max(total + cheapest_home[leg] - 1e-9, target_miles)
+        return route_score(earliest_home[leg] - departs[route[0]], best_price,
+                           len(route) + hops[leg] - 1, weights, scales)
+
+    #heap of (score or bound, leg ids, running price, is complete)
+    frontier = []
+    #scores of the best k complete routes pushed so far, as a max-heap
+    kth_best = []
+
+    def push(entry):
+        score = entry[0]
+        if len(kth_best) == k and score > -kth_best[0]:
+            return
+        heapq.heappush(frontier, entry)
+        if entry[3]:
+            heapq.heappush(kth_best, -score)
+            if len(kth_best) > k:
+                heapq.heappop(kth_best)
+
+    if k <= 0:
+        return [], []
+
+    for leg in index.departure_legs(origin):
+        if 1 + hops[leg] <= max_legs:
+            push((bound((leg,), price[leg], leg), (leg,), price[leg], False))
+
+    routes, scores = [], []
+    while frontier and len(routes) < k:
+        score, route, total, complete = heapq.heappop(frontier)
+        if complete:
+            routes.append(route)
+            scores.append(score)
+            continue
+
+        for leg in connections(route[-1]):
+            new_total = total + price[leg]
+            new_route = route + (leg,)
+            if lands_home[leg]:
+                if new_total >= target_miles:
+                    exact = route_score(arrives[leg] - departs[route[0]], new_total,
+                                        len(new_route) - 1, weights, scales)
+                    push((exact, new_route, new_total, True))
+            elif len(route) <= max_stops and len(new_route) + hops[leg] <= max_legs:
+                push((bound(new_route, new_total, leg), new_route, new_total, False))
+
+    return routes, scores
+
+#objectives optimal_route can minimize
+OBJECTIVES = ('price', 'duration')
+
+def optimal_route(index, origin, target_miles, min_layover, max_stops, objective='price', max_duration=None):
+    '''
+    The provably optimal qualifying route (same rules as
+    flight_index.enumerate_routes) for one objective, e.g. "the cheapest loop
+    from ATL reaching 5000 MQD within 3 days", without enumerating every route.
+
+    A* search over partial routes on the time-expanded network: partial
+    routes are expanded cheapest lower bound first (leg_bounds for time and
+    stops, completion_bounds for the price still needed to reach
+    target_miles), so the first complete route taken off the heap is optimal.
+    Partial routes that cannot reach target_miles at all are never pushed.  A
+    partial route is skipped when one already expanded at the same leg
+    dominates it:
+
+        price       :   no more legs, and the same price or a lower one that
+                        already reaches target_miles (with max_duration, also
+                        a first departure no earlier)
+        duration    :   no more legs, a first departure no earlier and a price
+                        no lower (a higher running price only helps reach the
+                        target)
+
+    inputs:
+
+        objective       :   'price' (cheapest total price, i.e. the fewest MQD
+                            over target_miles) or 'duration' (shortest total
+                            route duration)
+        max_duration    :   optional timedelta: only routes that are back
+                            within this long of their first departure
+
+    returns:
+
+        route           :   tuple of leg ids, None if no route qualifies
+        value           :   its total price or its total route duration in seconds
+    '''
+    if objective not in OBJECTIVES:
+        raise ValueError(f'objective must be one of {OBJECTIVES}, not {objective!r}')
+    by_price = objective == 'price'
+    limit = None if max_duration is None else pd.Timedelta(max_duration).total_seconds()
+    max_legs = max_stops + 2
+    hops, earliest_home, _ = leg_bounds(index, origin, min_layover)
+    completion, step = completion_bounds(index, origin, min_layover, target_miles)
+    buckets = completion.shape[1] - 1
+
+    connections = index.connection_lists(min_layover, arrays=True)
+    lands_home = index.lands_home(origin)
+    price = index.price
+    departs = index.departs
+    arrives = index.arrives
+
+    def bounds(first_departs, totals, legs):
+        '''lower bounds on the objective for partial routes ending at 'legs' with running prices 'totals' '''
+        if by_price:
+            #the MQD still needed, rounded down to a bucket
+            needed = np.clip((target_miles - totals - 1e-9) // step, 0, buckets).astype(np.int64)
+            #nudged down to absorb rounding from summing in a different order
+            return np.maximum(totals + completion[legs, needed] - 1e-9, target_miles)
+        return (earliest_home[legs] - first_departs).astype(np.float64)
+
+    def can_finish(first_departs, totals, length, legs):
+        '''mask of the partial routes of 'length' legs ending at 'legs' that can still qualify'''
+        needed = np.clip((target_miles - totals - 1e-9) // step, 0, buckets).astype(np.int64)
+        mask = (length + hops[legs] <= max_legs) & (completion[legs, needed] < np.inf)
+        if limit is not None:
+            mask &= earliest_home[legs] - first_departs <= limit
+        return mask
+
+    def dominates(a, b):
+        a_departs, a_length, a_total = a
+        b_departs, b_length, b_total = b
+        if a_length > b_length:
+            return False
+        if by_price:
+            return ((a_total == b_total or target_miles <= a_total <= b_total)
+                    and (limit is None or a_departs >= b_departs))
+        return a_departs >= b_departs and a_total >= b_total
+
+    #heap of (bound or exact value, rank, leg ids, first departure, running price).  Ties in value
+    #(common for price: most bounds are target_miles itself) go to complete routes (rank 0), then
+    #to the longest partial routes, which are the closest to completing
+    frontier = []
+    #value of the best complete route pushed so far: partial routes bounded above it can never win
+    incumbent = np.inf
+
+    starts = np.asarray(index.departure_legs(origin), dtype=np.int64)
+    if len(starts):
+        keep = can_finish(departs[starts], price[starts], 1, starts)
+        values = bounds(departs[starts][keep], price[starts][keep], starts[keep])
+        for value, leg in zip(values.tolist(), starts[keep].tolist()):
+            heapq.heappush(frontier, (value, max_legs, (leg,), int(departs[leg]), float(price[leg])))
+
+    #labels (first departure, legs, running price) already expanded, per leg
+    expanded = {}
+    while frontier:
+        value, rank, route, first_departs, total = heapq.heappop(frontier)
+        if rank == 0:
+            return route, value
+        if value > incumbent:
+            continue
+
+        leg = route[-1]
+        label = (first_departs, len(route), total)
+        seen = expanded.setdefault(leg, [])
+        if any(dominates(other, label) for other in seen):
+            continue
+        seen.append(label)
+
+        following = connections(leg)
+        if not len(following):
+            continue
+        totals = total + price[following]
+        home = lands_home[following]
+
+        #closing the loop: only the best completion of this partial route can be the answer
+        closes = home & (totals >= target_miles)
+        if limit is not None:
+            closes &= arrives[following] - first_departs <= limit
+        if closes.any():
+            values = totals[closes] if by_price else (arrives[following[closes]] - first_departs).astype(np.float64)
+            best = int(np.argmin(values))
+            if values[best] <= incumbent:
+                incumbent = float(values[best])
+                heapq.heappush(frontier, (incumbent, 0, route + (int(following[closes][best]),),
+                                          first_departs, float(totals[closes][best])))
+
+        #going on to another airport, while the route may still have more legs
+        if len(route) > max_stops:
+            continue
+        extends = ~home
+        extends[extends] = can_finish(first_departs, totals[extends], len(route) + 1, following[extends])
+        if not extends.any():
+            continue
+        values = bounds(first_departs, totals[extends], following[extends])
+        fits = values <= incumbent
+        for value, next_leg, new_total in zip(values[fits].tolist(), following[extends][fits].tolist(),
+                                              totals[extends][fits].tolist()):
+            heapq.heappush(frontier, (value, max_legs - len(route), route + (next_leg,), first_departs, new_total))
+
+    return None, None
@@ -0,0 +1,181 @@
+#this python file contains the store of every qualifying route of a search,
+#paged for display: the results table shows one bounded page at a time, sorted
+#and filtered on the server, instead of sending thousands of rows to the
+#browser (or only ever showing the top 20).
+#
+#the route metrics live in numpy arrays.  Every sort key gets a presorted
+#order of the routes the first time it is asked for, and every filter the
+#positions that pass it (in that order), so turning pages is a slice of a
+#precomputed array: O(page size), with display rows built for that page only.
+#
+#a store is shared by every session showing the same search: the sorted
+#orders and filtered views are built outside of its lock, which only guards
+#the bookkeeping of its caches.
+
+import threading
+from collections import OrderedDict, namedtuple
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from flight_index import DETAIL_DATE_FORMAT
+
+#sort keys, and the direction that puts the best routes first
+SORT_KEYS = {'Weighted Score': False, 'Total Price': True, 'Total Route Duration': True,
+             'Connections': True, 'Departure Time': True}
+
+MAX_PAGE_SIZE = 500
+
+#filtered views kept per store (each is one int64 array over the routes that pass)
+CACHED_VIEWS = 16
+
+#one page of results: the display rows (indexed by route number), the page
+#number (from 0), the number of pages and the number of routes that pass the filters
+Page = namedtuple('Page', ['rows', 'number', 'pages', 'total'])
+
+class RouteStore:
+    """Every route of a search with its metrics, served as sorted, filtered pages"""
+    def __init__(self, flight_index, routes, scores=None):
+        '''
+        inputs:
+
+            flight_index    :   the FlightIndex the routes were found in
+            routes          :   list of tuples of leg ids (RouteFinder.find_route_ids)
+            scores          :   optional relevance of every route (higher is
+                                better), e.g. RouteRanker.route_scores
+        '''
+        self.flight_index = flight_index
+        self.routes = routes
+        self.durations, self.prices, self.connections = flight_index.route_metrics(routes)
+        lengths = self.connections + 1
+        legs = np.fromiter(chain.from_iterable(routes), dtype=np.int64, count=int(lengths.sum()))
+        self.starts = np.cumsum(lengths) - lengths
+        self.departs = flight_index.departs[legs[self.starts]] if len(routes) else np.empty(0, dtype=np.int64)
+        self.arrives = flight_index.arrives[legs[self.starts + lengths - 1]] if len(routes) else np.empty(0, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float64) if scores is not None else None
+
+        #the airports of every route (where each leg leaves from, and the last
+        #arrival) as one flat array of airport ids with the route number of each
+        last = legs[self.starts + lengths - 1] if len(routes) else legs[:0]
+        self.stops = np.concatenate([flight_index.origin[legs], flight_index.destination[last]])
+        self.stop_routes = np.concatenate([np.repeat(np.arange(len(routes)), lengths), np.arange(len(routes))])
+
+        self.orders = {}
+        self.views = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.routes)
+
+    @property
+    def nbytes(self):
+        with self.lock:
+            cached = list(self.orders.values()) + list(self.views.values())
+        arrays = [self.durations, self.prices, self.connections, self.starts, self.departs, self.arrives,
+                  self.stops, self.stop_routes] + cached
+        if self.scores is not None:
+            arrays.append(self.scores)
+        return sum(array.nbytes for array in arrays)
+
+    def sort_keys(self):
+        return [key for key in SORT_KEYS if key != 'Weighted Score' or self.scores is not None]
+
+    def airports(self):
+        '''IATA codes of every airport some route stops at, sorted'''
+        return sorted(self.flight_index.airports[np.unique(self.stops)])
+
+    def metric(self, key):
+        if key == 'Weighted Score':
+            if self.scores is None:
+                raise ValueError('this store has no scores to sort by')
+            return self.scores
+        return {'Total Price': self.prices, 'Total Route Duration': self.durations,
+                'Connections': self.connections, 'Departure Time': self.departs}[key]
+
+    def order(self, sort_by='Weighted Score', ascending=None):
+        '''
+        route numbers sorted by 'sort_by' (ties in route number order), built
+        once per key and direction.  ascending=None sorts best first.
+        '''
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f'sort_by must be one of {list(SORT_KEYS)}, not {sort_by!r}')
+        ascending = SORT_KEYS[sort_by] if ascending is None else ascending
+        order = self.orders.get((sort_by, ascending))
+        if order is None:
+            values = self.metric(sort_by)
+            order = np.lexsort((np.arange(len(values)), values if ascending else -values))
+            order.flags.writeable = False
+            order = self.orders.setdefault((sort_by, ascending), order)
+        return order
+
+    def passes(self, max_price=None, max_duration=None, max_connections=None, airports=()):
+        '''
+        boolean mask over the routes: at most max_price, max_duration hours and
+        max_connections, and stopping at every one of 'airports'
+        '''
+        mask = np.ones(len(self), dtype=bool)
+        if max_price is not None:
+            mask &= self.prices <= max_price
+        if max_duration is not None:
+            mask &= self.durations <= max_duration * 3600
+        if max_connections is not None:
+            mask &= self.connections <= max_connections
+        for code in airports:
+            airport = self.flight_index.airport_id(code)
+            visits = np.zeros(len(self), dtype=bool)
+            visits[self.stop_routes[self.stops == airport]] = True
+            mask &= visits
+        return mask
+
+    def view(self, sort_by='Weighted Score', ascending=None, **filters):
+        '''route numbers that pass the filters (see passes), sorted: computed once and cached'''
+        filters = {name: value for name, value in filters.items() if value is not None and value != ()}
+        key = (sort_by, ascending, tuple(sorted((name, tuple(value) if name == 'airports' else value)
+                                                for name, value in filters.items())))
+        with self.lock:
+            view = self.views.get(key)
+            if view is not None:
+                self.views.move_to_end(key)
+                return view
+        order = self.order(sort_by, ascending)
+        view = order[self.passes(**filters)[order]] if filters else order
+        view.flags.writeable = False
+        with self.lock:
+            self.views[key] = view
+            if len(self.views) > CACHED_VIEWS:
+                self.views.popitem(last=False)
+        return view
+
+    def page(self, number=0, page_size=50, sort_by='Weighted Score', ascending=None, **filters):
+        '''
+        One page of the sorted, filtered routes (see view): a Page whose rows are
+        display rows built for that page only.  Page numbers start at 0 and are
+        clamped to the last page.
+        '''
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        view = self.view(sort_by, ascending, **filters)
+        pages = max(1, -(-len(view) // page_size))
+        number = min(max(number, 0), pages - 1)
+        return Page(self.rows(view[number * page_size:(number + 1) * page_size]), number, pages, len(view))
+
+    def rows(self, positions):
+        '''display rows for the routes at 'positions', indexed by route number'''
+        positions = np.asarray(positions, dtype=np.int64)
+        airports = self.flight_index.airports
+        itineraries = []
+        for i in positions.tolist():
+            route = self.routes[i]
+            stops = [airports[origin] for origin in self.flight_index.origin[list(route)]]
+            stops.append(airports[self.flight_index.destination[route[-1]]])
+            itineraries.append(tuple(stops))
+        rows = {'Departure Time': pd.to_datetime(self.departs[positions], unit='s').strftime(DETAIL_DATE_FORMAT),
+                'Arrival Time': pd.to_datetime(self.arrives[positions], unit='s').strftime(DETAIL_DATE_FORMAT),
+                'Total Route Duration': (self.durations[positions] / 3600).round(2),
+                'Total Price': self.prices[positions],
+                'Connections': self.connections[positions]}
+        if self.scores is not None:
+            rows['Weighted Score'] = self.scores[positions]
+        rows['Itinerary'] = itineraries
+        rows['Legs'] = [self.routes[i] for i in positions.tolist()]
+        return pd.DataFrame(rows, index=pd.Index(positions, dtype=np.int64))
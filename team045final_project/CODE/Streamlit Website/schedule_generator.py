@@ -0,0 +1,136 @@
+#this python file contains the synthetic Delta-like schedules, for measuring
+#the route search on networks much bigger than the cached demo csv: generated
+#ones (generate_schedule) and copies of a real one (replicate_schedule).
+#
+#a schedule is a hub and spoke network: a few hub airports, many spoke
+#airports, and every leg either touches a hub or (less often) links two spokes
+#directly.  Airports get random positions over the continental US, block
+#times follow the great circle distance and fares grow with distance, with
+#noise drawn from the chosen price distribution.  The output has the columns
+#of the flight cache (see flight_cache.LEG_COLUMNS), sorted by departure like
+#FlightData.data, so it can be searched directly or written out as a
+#cached_flights csv.
+
+import numpy as np
+import pandas as pd
+
+import flight_cache
+from great_circle import haversine_miles
+
+#area the airports are scattered over: (min, max) latitude and longitude
+LATITUDES = (25.0, 48.0)
+LONGITUDES = (-124.0, -70.0)
+
+#block time: taxi and climb allowance plus cruise speed, minutes
+FIXED_MINUTES = 40
+MILES_PER_MINUTE = 8.0
+
+#first and last departure of the day, minutes after midnight
+FIRST_DEPARTURE = 6 * 60
+LAST_DEPARTURE = 23 * 60
+
+PRICE_DISTRIBUTIONS = ('lognormal', 'uniform', 'pareto')
+
+def airport_codes(hubs, spokes):
+    '''hub codes H00, H01, ... followed by spoke codes S00, S01, ...'''
+    width = max(2, len(str(max(hubs, spokes) - 1)))
+    return ([f'H{i:0{width}d}' for i in range(hubs)] +
+            [f'S{i:0{width}d}' for i in range(spokes)])
+
+def fare_noise(rng, distribution, size, spread):
+    '''multiplicative fare noise with median 1'''
+    if distribution == 'lognormal':
+        return rng.lognormal(0.0, spread, size)
+    if distribution == 'uniform':
+        return rng.uniform(1 - spread, 1 + spread, size).clip(0.05)
+    if distribution == 'pareto':
+        #mostly cheap fares with a heavy tail of expensive ones
+        return (1 + rng.pareto(1 / spread, size)) / 2 ** spread
+    raise ValueError(f'price distribution must be one of {PRICE_DISTRIBUTIONS}, not {distribution!r}')
+
+def generate_schedule(airports=30, hubs=4, legs_per_day=500, days=7, start_date='2024-11-14',
+                      hub_share=0.8, price_distribution='lognormal', base_fare=90.0,
+                      fare_per_mile=0.18, price_spread=0.35, seed=0):
+    '''
+    A synthetic schedule of legs.
+
+    inputs:
+
+        airports            :   number of airports, hubs included
+        hubs                :   number of hub airports (the first codes, H00...)
+        legs_per_day        :   legs flown every day
+        days                :   number of days, starting at start_date
+        hub_share           :   share of the legs that touch a hub, the rest link
+                                two spokes directly
+        price_distribution  :   'lognormal', 'uniform' or 'pareto' noise on the
+                                distance based fare
+        base_fare           :   fare of a zero mile leg
+        fare_per_mile       :   fare added per great circle mile
+        price_spread        :   width of the fare noise (sigma for lognormal,
+                                +- fraction for uniform, tail weight for pareto)
+        seed                :   random seed, the same inputs always give the same schedule
+
+    returns a dataframe with the columns of flight_cache.LEG_COLUMNS, sorted by
+    departure, with Departs / Arrives as datetimes and Duration in minutes
+    '''
+    if not 0 < hubs <= airports or airports < 2:
+        raise ValueError('need at least two airports and between 1 and airports hubs')
+    rng = np.random.default_rng(seed)
+    codes = np.array(airport_codes(hubs, airports - hubs))
+    latitude = rng.uniform(*LATITUDES, airports)
+    longitude = rng.uniform(*LONGITUDES, airports)
+
+    n = legs_per_day * days
+    #hub legs: a hub to any other airport, either way round
+    hub = rng.integers(0, hubs, n)
+    other = (hub + rng.integers(1, airports, n)) % airports
+    outbound = rng.random(n) < 0.5
+    origin = np.where(outbound, hub, other)
+    destination = np.where(outbound, other, hub)
+    #point to point legs between two spokes (only if there are at least two)
+    if airports - hubs >= 2:
+        direct = rng.random(n) >= hub_share
+        spoke = rng.integers(hubs, airports, direct.sum())
+        origin[direct] = spoke
+        destination[direct] = hubs + (spoke - hubs + rng.integers(1, airports - hubs, direct.sum())) % (airports - hubs)
+
+    miles = haversine_miles(latitude[origin], longitude[origin], latitude[destination], longitude[destination])
+    duration = (FIXED_MINUTES + miles / MILES_PER_MINUTE).round().astype(np.int64)
+    price = (base_fare + fare_per_mile * miles) * fare_noise(rng, price_distribution, n, price_spread)
+
+    day = np.repeat(np.arange(days), legs_per_day)
+    minute = rng.integers(FIRST_DEPARTURE, LAST_DEPARTURE + 1, n)
+    departs = pd.Timestamp(start_date) + pd.to_timedelta(day * 24 * 60 + minute, unit='m')
+    arrives = departs + pd.to_timedelta(duration, unit='m')
+
+    legs = pd.DataFrame({'Origin': codes[origin], 'Destination': codes[destination],
+                         'Departs': departs, 'Arrives': arrives,
+                         'Duration': duration, 'Price': price.round(2)})
+    legs = legs.sort_values(['Departs', 'Origin', 'Destination'], kind='stable').reset_index(drop=True)
+    #FlightLabs style leg ids: origin-departure--destination-arrival
+    legs.insert(0, 'id', legs['Origin'] + '-' + legs['Departs'].dt.strftime('%y%m%d%H%M') + '--' +
+                legs['Destination'] + '-' + legs['Arrives'].dt.strftime('%y%m%d%H%M') + '-' +
+                pd.Series(np.arange(n)).astype(str))
+    legs.insert(1, 'CarrierName', 'Delta')
+    return legs[flight_cache.LEG_COLUMNS]
+
+def replicate_schedule(flights, copies):
+    '''
+    Build a schedule 'copies' times larger than 'flights' (e.g. the cached demo
+    csv): copy 0 is the original network, every other copy is the same network
+    with its airports relabelled (ATL -> ATL1, ...).  A search from an original
+    airport returns the same routes as on the original data, but has to deal
+    with a table that is 'copies' times larger.
+    '''
+    frames = [flights]
+    for copy in range(1, copies):
+        relabelled = flights.copy()
+        relabelled['Origin'] = relabelled['Origin'].astype(str) + str(copy)
+        relabelled['Destination'] = relabelled['Destination'].astype(str) + str(copy)
+        frames.append(relabelled)
+    return pd.concat(frames, ignore_index=True)
+
+def write_schedule(legs, csv_path):
+    '''write a generated schedule as a cached_flights csv the app can load'''
+    legs.to_csv(csv_path, date_format=flight_cache.CSV_DATE_FORMAT)
+    return len(legs)
@@ -0,0 +1,82 @@
+#this python file contains the in-memory cache for route search results, so
+#that a repeated search (or a streamlit rerun caused by an unrelated widget)
+#does not run find_routes and the ranking again.
+
+import sys
+import threading
+from collections import OrderedDict
+
+def estimate_bytes(value):
+    '''
+    Rough size in bytes of a cached search result: pandas dataframes and numpy
+    arrays are measured, containers are counted with sys.getsizeof plus their
+    nested containers (the ints/floats inside routes are mostly shared objects
+    and are not counted).
+    '''
+    if hasattr(value, 'memory_usage') and hasattr(value, 'columns'):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_bytes(each) for each in value
+                                          if not isinstance(each, (int, float, str)))
+    return sys.getsizeof(value)
+
+class SearchCache:
+    """LRU cache of search results keyed by the search parameters, bounded by entry count and memory"""
+    def __init__(self, max_entries=32, max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        #streamlit runs every session in its own thread
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        '''the cached value for 'key' (marking it as most recently used), or None'''
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value, nbytes=None):
+        '''
+        Cache 'value' under 'key', then evict least recently used entries until
+        the cache is back under max_entries and max_bytes.  A value bigger than
+        max_bytes on its own is not cached at all.
+        '''
+        nbytes = estimate_bytes(value) if nbytes is None else nbytes
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.sizes.pop(key)
+                del self.entries[key]
+            if nbytes > self.max_bytes:
+                return
+            self.entries[key] = value
+            self.sizes[key] = nbytes
+            self.total_bytes += nbytes
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                old_key, _ = self.entries.popitem(last=False)
+                self.total_bytes -= self.sizes.pop(old_key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes,
+                    'hits': self.hits, 'misses': self.misses}
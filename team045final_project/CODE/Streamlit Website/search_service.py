@@ -0,0 +1,580 @@
+#this python file contains the route search as a service: the search, ranking
+#and result building of the app without streamlit, for batch runs, scripts and
+#an HTTP endpoint.  The streamlit app is just one client of it (see
+#mileagerun_finder_oop.main_build).
+#
+#a SearchService loads the flight legs once and keeps the connection index of
+#the (airports, date window) pairs it was asked about and the results of
+#recent searches, so thousands of queries in one process share one loaded
+#table and a handful of indexes.  One service is shared by every thread
+#(streamlit sessions, HTTP requests) and only read by them: each client keeps
+#its own inputs and latest results in a SearchContext, and identical searches
+#or index builds running at the same time share one computation instead of
+#queueing behind a lock.
+#
+#run from the "Streamlit Website" folder (same as the app):
+#
+#    python search_service.py search --origin JFK --target-miles 3000 --max-stops 2
+#    python search_service.py search --origin 'JFK|LGA' --tier Gold --current-mqd 4000 --format arrow --output routes.arrow
+#    python search_service.py batch queries.csv --output results.jsonl
+#    python search_service.py serve --port 8000
+#
+#    curl 'localhost:8000/search?origin=JFK&target_miles=3000&max_stops=2'
+#    curl -d '{"origin": ["JFK", "LGA"], "tier": "Gold", "current_mqd": 4000}' localhost:8000/search
+#
+#a query (command line, batch csv / JSON lines row, query string or JSON body)
+#has an origin (one IATA code, or co-terminal ones separated by '|'), either
+#target_miles or a tier and the current_mqd already earned, and optionally
+#max_stops, start_date / end_date (YYYY-MM-DD, default: the whole schedule)
+#and top_n.  Results come back as JSON, or as an Arrow IPC stream of the
+#ranked routes.
+
+import argparse
+import csv
+import io
+import json
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    #pyarrow comes with streamlit, without it results are JSON only
+    pa = None
+
+import tracing
+from flight_index import FlightIndex, origin_codes
+from pareto_front import ParetoFront
+from route_finder import FlightData, RouteFinder, RouteRanker
+from route_store import RouteStore
+from search_cache import SearchCache, estimate_bytes
+
+DEFAULT_CSV = 'data/cached_flights_1.csv'
+
+#airports every search may connect through (the origin's are added to them)
+SEARCH_AIRPORTS = ('ATL', 'LAX', 'JFK', 'SFO')
+
+MIN_LAYOVER = timedelta(hours=1)
+MAX_STOPS = 2
+TOP_N = 20
+
+#connection indexes kept per service, by (airports, start date, end date)
+CACHED_INDEXES = 16
+
+#Delta Medallion MQD thresholds (as in Main.py): a tier and the MQD already
+#earned give the target of a search
+TIER_THRESHOLDS = {'Silver': 5000, 'Gold': 10000, 'Platinum': 15000, 'Diamond': 28000}
+
+#what a search returns, everything the app shows is built from it:
+#the index the routes were found in, every qualifying route (tuples of leg
+#ids), the top ranked ones (RouteRanker.ranked_rows) with the MOO weights
+#they were ranked by, the Pareto front and the paged store of every route
+SearchResult = namedtuple('SearchResult', ['flight_index', 'routes', 'ranked', 'moo_weights',
+                                           'pareto_front', 'route_store'])
+
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+
+#results a SearchContext keeps for its own client
+CONTEXT_RESULTS = 4
+
+class NoRoutesFound(ValueError):
+    """No route of the search reaches the target"""
+
+class _Pending:
+    """A search or index build in progress, waited on by identical requests"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+def target_for_tier(tier, current_mqd=0):
+    '''the MQD still needed to reach 'tier' (see TIER_THRESHOLDS)'''
+    if tier not in TIER_THRESHOLDS:
+        raise ValueError(f'tier must be one of {list(TIER_THRESHOLDS)}, not {tier!r}')
+    need = TIER_THRESHOLDS[tier] - current_mqd
+    if need <= 0:
+        raise ValueError(f'{current_mqd:g} MQD already reaches {tier}')
+    return need
+
+def parse_query(params):
+    '''
+    The keyword arguments of SearchService.search for a query given as a
+    dictionary of text (a query string, csv row or command line) or of JSON
+    values.  Raises ValueError for a missing or malformed parameter.
+    '''
+    def value(name, convert, default=None):
+        raw = params.get(name)
+        if isinstance(raw, list) and name != 'origin':
+            raw = raw[-1]
+        if raw is None or raw == '':
+            return default
+        try:
+            return convert(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f'{name}: cannot read {raw!r}') from None
+
+    origin = params.get('origin')
+    if not origin:
+        raise ValueError('origin is required')
+    if isinstance(origin, str):
+        origin = [origin]
+    origin = origin_codes([code.strip().upper() for each in origin for code in str(each).split('|') if code.strip()])
+
+    target_miles = value('target_miles', float)
+    if target_miles is None:
+        tier = value('tier', lambda text: str(text).strip().title())
+        if tier is None:
+            raise ValueError('either target_miles or tier (with current_mqd) is required')
+        target_miles = target_for_tier(tier, value('current_mqd', float, 0))
+
+    def as_date(text):
+        return text if isinstance(text, date) else date.fromisoformat(str(text).strip())
+
+    return {'origin': origin, 'target_miles': target_miles,
+            'max_stops': value('max_stops', int, MAX_STOPS),
+            'start_date': value('start_date', as_date), 'end_date': value('end_date', as_date),
+            'min_layover': value('min_layover', lambda minutes: timedelta(minutes=float(minutes)), MIN_LAYOVER),
+            'top_n': value('top_n', int, TOP_N)}
+
+class SearchService:
+    """Route searches over one loaded flight table, reusing its connection indexes and recent results"""
+    def __init__(self, csv_path=DEFAULT_CSV, search_airports=SEARCH_AIRPORTS, cache=None):
+        '''
+        inputs:
+
+            csv_path        :   cached_flights csv to search (loaded through its parquet cache)
+            search_airports :   airports every search may connect through
+            cache           :   SearchCache for the results, default: at most 32 searches / 256 MB
+        '''
+        self.flight_data = FlightData(csv_path)
+        self.flight_data.load_data()
+        self.search_airports = tuple(search_airports)
+        self.cache = cache if cache is not None else SearchCache(max_entries=32, max_bytes=256 * 2**20)
+        self.indexes = OrderedDict()
+        self.indexes_built = 0
+        #searches run in many threads (streamlit sessions, HTTP requests): the
+        #lock only guards the bookkeeping, never a search or an index build
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.shared = 0
+
+    def once(self, key, call):
+        '''
+        call(), unless an identical call (same key) is already running in
+        another thread: then wait for its result (or error) instead
+        '''
+        with self.lock:
+            pending = self.pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self.pending[key] = _Pending()
+            else:
+                self.shared += 1
+
+        if not owner:
+            tracing.count('shared_computations')
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = call()
+            return pending.value
+        except BaseException as error:
+            pending.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+            pending.done.set()
+
+    def schedule_dates(self):
+        '''first and last departure date of the flight table'''
+        departs = self.flight_data.departs
+        return (pd.Timestamp(departs[0]).date(), pd.Timestamp(departs[-1]).date()) if len(departs) else (None, None)
+
+    def flight_index(self, airports, start_date, end_date):
+        '''the connection index over the flights between airports in a date range, built once and kept'''
+        key = (tuple(airports), start_date, end_date)
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is not None:
+                self.indexes.move_to_end(key)
+                return index
+        return self.once(('index',) + key, lambda: self.build_index(key))
+
+    def build_index(self, key):
+        '''build and keep the index of key = (airports, start date, end date), see flight_index'''
+        airports, start_date, end_date = key
+        with tracing.span('filter_airports', airports=len(airports)):
+            flights = self.flight_data.filter_airports(list(airports))
+        with tracing.span('filter_dates'):
+            flights = flights.filter_dates(start_date, end_date)
+        with tracing.span('build_index', legs=len(flights)):
+            index = FlightIndex(flights.data)
+        with self.lock:
+            self.indexes_built += 1
+            self.indexes[key] = index
+            if len(self.indexes) > CACHED_INDEXES:
+                self.indexes.popitem(last=False)
+        return index
+
+    @tracing.traced('search')
+    def search(self, origin, target_miles, max_stops=MAX_STOPS, start_date=None, end_date=None,
+               min_layover=MIN_LAYOVER, top_n=TOP_N):
+        '''
+        Every route from origin (an IATA code or co-terminal codes) flying at
+        least target_miles with at most max_stops connections, leaving between
+        start_date and end_date (default: the first / last day of the schedule),
+        ranked by the MOO weights.
+
+        returns a SearchResult (shared with later identical searches: treat it
+        as read-only), raises NoRoutesFound if no route qualifies.  Threads
+        asking for a search that is running wait for it instead of running it too.
+        '''
+        origin = origin_codes(origin)
+        first_day, last_day = self.schedule_dates()
+        start_date = start_date if start_date is not None else first_day
+        end_date = end_date if end_date is not None else last_day
+        search_key = (origin, target_miles, max_stops, min_layover, start_date, end_date, top_n)
+        cached = self.cache.get(search_key)
+        tracing.count('search_cache_hits' if cached is not None else 'search_cache_misses')
+        if cached is not None:
+            return cached
+        return self.once(('search',) + search_key, lambda: self.run_search(*search_key))
+
+    def run_search(self, origin, target_miles, max_stops, min_layover, start_date, end_date, top_n):
+        '''run and cache a search that is not cached yet (see search)'''
+        #only the qualifying flights (the index is kept per airports and date range):
+        airports = self.search_airports + tuple(code for code in origin if code not in self.search_airports)
+        with tracing.span('load_flight_index'):
+            flight_index = self.flight_index(airports, start_date, end_date)
+        route_finder = RouteFinder(flight_index.flights, origin, target_miles, min_layover, max_stops,
+                                   flight_index=flight_index)
+        with tracing.span('find_routes', legs=len(flight_index.flights), max_stops=max_stops):
+            all_routes = route_finder.find_route_ids()
+        tracing.count('nodes_expanded', route_finder.search_stats.get('explored', 0))
+        tracing.count('branches_pruned', route_finder.search_stats.get('pruned', 0))
+        tracing.count('candidate_routes', len(all_routes))
+        if not all_routes:
+            raise NoRoutesFound(f'no route from {"/".join(origin)} flies {target_miles:g} miles '
+                                f'with at most {max_stops} stops between {start_date} and {end_date}')
+
+        #routes that all tie on a metric make its entropy weight 0 / 0 (NaN, see finite)
+        with tracing.span('rank_initial_routes', routes=len(all_routes)), np.errstate(invalid='ignore', divide='ignore'):
+            ranker = RouteRanker(all_routes, 0.5, flight_index=flight_index)
+            ranked, moo_weights = ranker.rank_initial_routes(top_n=top_n)
+        #every route, for the paged results table:
+        with tracing.span('route_store'):
+            route_store = RouteStore(flight_index, all_routes, ranker.route_scores(moo_weights))
+        #the non-dominated routes, for the time / price trade-off view and its knee:
+        with tracing.span('pareto_front'):
+            pareto_front = ParetoFront.from_routes(flight_index, all_routes)
+        tracing.count('pareto_routes', len(pareto_front))
+        result = SearchResult(flight_index, all_routes, ranked, moo_weights, pareto_front, route_store)
+        search_key = (origin, target_miles, max_stops, min_layover, start_date, end_date, top_n)
+        self.cache.put(search_key, result, nbytes=estimate_bytes(all_routes) + estimate_bytes(ranked) +
+                                                  estimate_bytes(route_store))
+        return result
+
+    @tracing.traced('rerank')
+    def rerank(self, result, time_weight, connection_weight=0, top_n=TOP_N):
+        '''
+        The best top_n routes of a search under user weights (time_weight, the
+        rest on cost), ranked over every route of the search: only the best
+        route is sure to be on the Pareto front, the runners-up often are not
+        '''
+        with tracing.span('rerank_routes', routes=len(result.routes)):
+            ranker = RouteRanker(result.routes, time_weight, connection_weight, flight_index=result.flight_index)
+            return ranker.rerank_routes(top_n=top_n)
+
+class SearchContext:
+    """
+    The searches of one client (a streamlit session, a script): its inputs,
+    its latest result and its own recent results.  Nothing in a context is
+    shared, while the SearchService behind it is shared by every context.
+    """
+    def __init__(self, service, max_results=CONTEXT_RESULTS):
+        '''
+        inputs:
+
+            service         :   the SearchService to search with
+            max_results     :   recent results kept by this context, so its
+                                reruns do not depend on the shared cache still
+                                holding them
+        '''
+        self.service = service
+        #{'origin', 'target_miles', 'max_stops', 'start_date', 'end_date' and
+        #optionally 'min_layover'} of the search, and {'time_weight',
+        #'cost_weight'} of the rerank, set by the client
+        self.route_inputs = None
+        self.preference_inputs = None
+        self.result = None
+        self.results = SearchCache(max_entries=max_results)
+
+    def search(self, top_n=TOP_N):
+        '''
+        The SearchResult for route_inputs (see SearchService.search), kept as
+        this context's latest result.  Raises NoRoutesFound if no route qualifies.
+        '''
+        #a failed search leaves no result behind to rerank:
+        self.result = None
+        inputs = self.route_inputs
+        key = (origin_codes(inputs['origin']), inputs['target_miles'], inputs['max_stops'],
+               inputs['start_date'], inputs['end_date'], inputs.get('min_layover', MIN_LAYOVER), top_n)
+        result = self.results.get(key)
+        tracing.count('context_result_hits' if result is not None else 'context_result_misses')
+        if result is None:
+            result = self.service.search(*key)
+            #the result is the service's: it is counted in its cache, not again here
+            self.results.put(key, result, nbytes=0)
+        self.result = result
+        return result
+
+    def rerank(self, connection_weight=0, top_n=TOP_N):
+        '''the latest result reranked by preference_inputs (see SearchService.rerank)'''
+        return self.service.rerank(self.result, self.preference_inputs['time_weight'], connection_weight, top_n)
+
+def finite(value):
+    '''a number as JSON takes it: NaN / infinity (e.g. weights of a single route) become None'''
+    if isinstance(value, (float, np.floating)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def ranked_records(ranked, flight_index):
+    '''ranked rows as JSON-ready dicts, with the legs of each route as itinerary details'''
+    return [{**{column: finite(value) for column, value in row.items() if column != 'Legs'},
+             'Route': int(route), 'Itinerary': list(row['Itinerary']),
+             'Flights': flight_index.itinerary(row['Legs'])}
+            for route, row in zip(ranked.index, ranked.to_dict('records'))]
+
+def result_record(result, ranked=None):
+    '''a search result (or a rerank of it, 'ranked') as a JSON-ready dict'''
+    ranked = result.ranked if ranked is None else ranked
+    return {'routes': len(result.routes), 'pareto_routes': len(result.pareto_front),
+            'moo_weights': {name: finite(weight) for name, weight in result.moo_weights.items()},
+            'ranked': ranked_records(ranked, result.flight_index)}
+
+def query_record(query):
+    '''the parsed query (parse_query) as a JSON-ready dict'''
+    return {'origin': list(query['origin']), 'target_miles': query['target_miles'],
+            'max_stops': query['max_stops'],
+            'start_date': query['start_date'] and query['start_date'].isoformat(),
+            'end_date': query['end_date'] and query['end_date'].isoformat(),
+            'min_layover_minutes': query['min_layover'].total_seconds() / 60, 'top_n': query['top_n']}
+
+def arrow_table(records):
+    '''
+    The ranked routes of JSON records (result_record, each optionally with
+    'query' numbers in a 'Query' field) as one Arrow table, a row per route
+    '''
+    if pa is None:
+        raise RuntimeError('Arrow output needs pyarrow (pip install pyarrow)')
+    rows = [{**({'Query': record['query_number']} if 'query_number' in record else {}), **row}
+            for record in records for row in record['ranked']]
+    return pa.Table.from_pylist(rows)
+
+def arrow_bytes(table):
+    '''an Arrow table as an IPC stream'''
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def run_query(service, query, time_weight=None):
+    '''
+    Run one parsed query (parse_query): its JSON record.  time_weight reranks
+    the routes by user weights instead of the MOO weights.  Raises
+    NoRoutesFound if no route qualifies.
+    '''
+    first_day, last_day = service.schedule_dates()
+    query = {**query, 'start_date': query['start_date'] or first_day, 'end_date': query['end_date'] or last_day}
+    result = service.search(**query)
+    ranked = service.rerank(result, time_weight, top_n=query['top_n']) if time_weight is not None else None
+    return {'query': query_record(query), **result_record(result, ranked)}
+
+def run_batch(service, queries, time_weight=None):
+    '''
+    Every query (dictionaries of parameters, see parse_query) in turn on the
+    same service: a record each, numbered, with an 'error' instead of the
+    routes for an invalid query or one without routes
+    '''
+    for number, params in enumerate(queries):
+        try:
+            yield {'query_number': number, **run_query(service, parse_query(params), time_weight)}
+        except ValueError as error:
+            yield {'query_number': number, 'query': params, 'error': str(error)}
+
+def read_queries(path):
+    '''the queries of a csv (with a header row) or JSON lines (.jsonl / .json) file'''
+    with open(path, newline='') as f:
+        if path.endswith(('.jsonl', '.json')):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+def write_output(records, output_format, output):
+    '''JSON lines (one record per query) or an Arrow IPC stream of all their routes, to a file or stdout'''
+    if output_format == 'arrow':
+        data = arrow_bytes(arrow_table([record for record in records if 'ranked' in record]))
+        if output:
+            with open(output, 'wb') as f:
+                f.write(data)
+        else:
+            sys.stdout.buffer.write(data)
+        return
+    text = ''.join(json.dumps(record, default=str) + '\n' for record in records)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """
+    HTTP endpoint of a SearchService (the server's 'service' attribute):
+
+        GET  /health                    the table and caches
+        GET  /search?origin=...&...     one query, as a query string
+        POST /search                    one query, as a JSON object
+
+    format=arrow (or an Accept header of ARROW_MIME) returns the ranked routes
+    as an Arrow IPC stream instead of JSON
+    """
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == '/health':
+            service = self.server.service
+            self.send_json(200, {'status': 'ok', 'legs': len(service.flight_data.data),
+                                 'indexes': len(service.indexes), 'indexes_built': service.indexes_built,
+                                 'cached_searches': len(service.cache),
+                                 'cache_hits': service.cache.hits, 'cache_misses': service.cache.misses})
+        elif url.path == '/search':
+            self.answer(params)
+        else:
+            self.send_json(404, {'error': f'no such endpoint: {url.path}'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/search':
+            self.send_json(404, {'error': f'no such endpoint: {url.path}'})
+            return
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError as error:
+            self.send_json(400, {'error': f'body is not JSON: {error}'})
+            return
+        if not isinstance(params, dict):
+            self.send_json(400, {'error': 'body must be a JSON object'})
+            return
+        params.update({name: values[-1] for name, values in parse_qs(url.query).items()})
+        self.answer(params)
+
+    def answer(self, params):
+        arrow = params.pop('format', None) == 'arrow' or ARROW_MIME in self.headers.get('Accept', '')
+        time_weight = params.pop('time_weight', None)
+        try:
+            time_weight = float(time_weight) if time_weight is not None else None
+            query = parse_query(params)
+        except ValueError as error:
+            self.send_json(400, {'error': str(error)})
+            return
+        if arrow and pa is None:
+            self.send_json(406, {'error': 'Arrow output needs pyarrow on the server'})
+            return
+        try:
+            record = run_query(self.server.service, query, time_weight)
+        except NoRoutesFound as error:
+            self.send_json(404, {'query': query_record(query), 'error': str(error)})
+            return
+        if arrow:
+            self.send(200, ARROW_MIME, arrow_bytes(arrow_table([record])))
+        else:
+            self.send_json(200, record)
+
+    def send_json(self, status, record):
+        self.send(status, 'application/json', json.dumps(record, default=str).encode())
+
+    def send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve(service, host='127.0.0.1', port=8000):
+    '''answer searches over HTTP (see SearchHandler) until interrupted, a thread per request'''
+    server = ThreadingHTTPServer((host, port), SearchHandler)
+    server.service = service
+    print(f'serving {len(service.flight_data.data)} legs on http://{host}:{server.server_port}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless mileage run route search')
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='cached_flights csv to search')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    searcher = commands.add_parser('search', help='run one search')
+    searcher.add_argument('--origin', required=True, help="IATA code, or co-terminal codes as 'JFK|LGA'")
+    searcher.add_argument('--target-miles', type=float)
+    searcher.add_argument('--tier', choices=list(TIER_THRESHOLDS), help='instead of --target-miles')
+    searcher.add_argument('--current-mqd', type=float, default=0)
+    searcher.add_argument('--max-stops', type=int, default=MAX_STOPS)
+    searcher.add_argument('--start-date', help='YYYY-MM-DD, default: the first day of the schedule')
+    searcher.add_argument('--end-date', help='YYYY-MM-DD, default: the last day of the schedule')
+    searcher.add_argument('--min-layover', type=float, default=MIN_LAYOVER.total_seconds() / 60, help='minutes')
+    searcher.add_argument('--top-n', type=int, default=TOP_N)
+
+    batcher = commands.add_parser('batch', help='run every query of a csv or JSON lines file')
+    batcher.add_argument('queries', help='csv with a header row, or .jsonl: one query per row')
+
+    for command in (searcher, batcher):
+        command.add_argument('--time-weight', type=float,
+                             help='rerank by this time weight (the rest on cost) instead of the MOO weights')
+        command.add_argument('--format', choices=['json', 'arrow'], default='json')
+        command.add_argument('--output', help='output file (default: stdout)')
+
+    server = commands.add_parser('serve', help='answer searches over HTTP')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8000)
+
+    args = parser.parse_args()
+    service = SearchService(args.csv)
+    if args.command == 'serve':
+        serve(service, args.host, args.port)
+        return 0
+
+    if args.command == 'search':
+        queries = [{name: getattr(args, name) for name in ('origin', 'target_miles', 'tier', 'current_mqd', 'max_stops',
+                                                           'start_date', 'end_date', 'min_layover', 'top_n')}]
+    else:
+        queries = read_queries(args.queries)
+    start = time.perf_counter()
+    records = list(run_batch(service, queries, args.time_weight))
+    elapsed = time.perf_counter() - start
+    write_output(records, args.format, args.output)
+
+    failed = sum('error' in record for record in records)
+    print(f'{len(records)} queries ({failed} without routes or invalid) in {elapsed:.2f}s, '
+          f'{service.indexes_built} indexes built, {service.cache.hits} cache hits', file=sys.stderr)
+    return 1 if failed == len(records) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#the app's modules are imported from the "Streamlit Website" folder and read
+#their files from its data/ folder, so the tests run from there too
+
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from flight_cache import CSV_DATE_FORMAT
+from search_service import SearchService
+
+AIRPORTS = ['ATL', 'JFK', 'LAX', 'SFO', 'SEA', 'MIA']
+
+def random_schedule(seed, legs=120, airports=AIRPORTS, days=3):
+    '''
+    A small random flights dataframe in the cached_flights layout: departures
+    on a 30 minute grid (so some legs leave at the same time), 1 to 5 hour
+    legs and whole dollar prices (so some routes tie on price).
+    '''
+    random = np.random.RandomState(seed)
+    origin = random.randint(len(airports), size=legs)
+    destination = (origin + random.randint(1, len(airports), size=legs)) % len(airports)
+    departs = pd.Timestamp('2024-11-14') + pd.to_timedelta(random.randint(days * 48, size=legs) * 30, unit='min')
+    duration = random.randint(60, 301, size=legs)
+    return pd.DataFrame({'id': [f'DL{i}' for i in range(legs)],
+                         'CarrierName': 'Delta',
+                         'Origin': np.asarray(airports)[origin],
+                         'Destination': np.asarray(airports)[destination],
+                         'Departs': departs,
+                         'Arrives': departs + pd.to_timedelta(duration, unit='min'),
+                         'Duration': duration,
+                         'Price': random.randint(50, 400, size=legs).astype(np.float64)})
+
+def dead_end_schedule(seed=36, legs=200):
+    '''
+    random_schedule over five airports sorted by departure: the last legs into
+    each airport have no connection, so their (empty) connection ranges start
+    where the next airport's departures do
+    '''
+    flights = random_schedule(seed, legs=legs, airports=['ATL', 'JFK', 'LAX', 'SFO', 'SEA'])
+    return flights.sort_values('Departs', kind='stable', ignore_index=True)
+
+def brute_force_routes(flights, origin, target_miles, min_layover, max_stops):
+    '''
+    Every qualifying loop, straight from the rules: leave a home airport, connect
+    at the landing airport no sooner than min_layover later, end as soon as a
+    leg lands at a home airport (kept if the total price reaches target_miles),
+    at most max_stops + 2 legs.  Returns {route (tuple of row positions): price}.
+    '''
+    home = {origin} if isinstance(origin, str) else set(origin)
+    layover = pd.Timedelta(min_layover)
+    rows = list(flights[['Origin', 'Destination', 'Departs', 'Arrives', 'Price']].itertuples(index=False))
+    found = {}
+
+    def extend(route, total):
+        last = rows[route[-1]]
+        for leg, row in enumerate(rows):
+            if row.Origin != last.Destination or row.Departs < last.Arrives + layover:
+                continue
+            if row.Destination in home:
+                if total + row.Price >= target_miles:
+                    found[route + (leg,)] = total + row.Price
+            elif len(route) <= max_stops:
+                extend(route + (leg,), total + row.Price)
+
+    for leg, row in enumerate(rows):
+        if row.Origin in home and row.Destination not in home:
+            extend((leg,), row.Price)
+    return found
+
+def write_schedule_csv(flights, path):
+    '''a schedule in the cached_flights csv layout (see flight_cache.read_csv_legs)'''
+    dates = {column: flights[column].dt.strftime(CSV_DATE_FORMAT) for column in ('Departs', 'Arrives')}
+    flights.assign(**dates).to_csv(path)
+    return str(path)
+
+@pytest.fixture(scope='module')
+def schedule_csv(tmp_path_factory):
+    '''a random schedule of every airport in AIRPORTS as a cached_flights csv'''
+    return write_schedule_csv(random_schedule(7, legs=240), tmp_path_factory.mktemp('flights') / 'flights.csv')
+
+@pytest.fixture(scope='module')
+def service(schedule_csv):
+    '''a SearchService over schedule_csv, shared by the tests of a module'''
+    return SearchService(schedule_csv, search_airports=AIRPORTS)
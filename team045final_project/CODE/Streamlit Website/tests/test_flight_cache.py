@@ -0,0 +1,40 @@
+#flight_cache: the csv of scraped legs and the parquet cache loaded from it
+
+import pytest
+
+import flight_cache
+from conftest import random_schedule, write_schedule_csv
+
+@pytest.fixture(params=['parquet', 'csv'])
+def reader(request, monkeypatch):
+    '''load_legs through the parquet cache, and without pyarrow'''
+    if request.param == 'csv':
+        monkeypatch.setattr(flight_cache, 'pq', None)
+    return flight_cache.load_legs
+
+def test_load_legs_keeps_the_schedule(tmp_path, reader):
+    flights = random_schedule(21)
+    legs = reader(write_schedule_csv(flights, tmp_path / 'flights.csv'))
+    assert sorted(legs['id']) == sorted(flights['id'])
+    assert legs['Departs'].is_monotonic_increasing
+    assert legs['Price'].sum() == pytest.approx(flights['Price'].sum())
+
+def test_legs_appended_again_are_loaded_once(tmp_path, reader):
+    #a re-run scrape is served from the response cache and appends the same legs
+    flights = random_schedule(22)
+    path = str(tmp_path / 'flights.csv')
+    flight_cache.append_legs(path, flights)
+    assert len(reader(path)) == len(flights)
+    changed = flights.iloc[:10].assign(Price=1.0)
+    flight_cache.append_legs(path, flights)
+    flight_cache.append_legs(path, changed)
+    legs = reader(path)
+    assert len(legs) == len(flights) and legs['id'].is_unique
+    #the last fetch of a leg wins
+    assert (legs.set_index('id').loc[changed['id'], 'Price'] == 1.0).all()
+
+def test_append_nothing(tmp_path):
+    path = tmp_path / 'flights.csv'
+    flight_cache.append_legs(str(path), None)
+    flight_cache.append_legs(str(path), random_schedule(23).iloc[:0])
+    assert not path.exists()
@@ -0,0 +1,124 @@
+#flight_fetcher against a stub retrieveFlights server on localhost: the request
+#rate it keeps to and how it retries incomplete / failed responses
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import flight_fetcher
+import flightlabs
+from response_cache import ResponseCache
+
+def stub_payload(date, status):
+    leg = {'id': f'DL1-{date}', 'carriers': {'marketing': [{'id': flightlabs.DELTA_CARRIER_ID, 'name': 'Delta'}]},
+           'origin': {'id': 'ATL'}, 'destination': {'id': 'JFK'},
+           'departure': f'{date}T08:00:00', 'arrival': f'{date}T10:05:00', 'durationInMinutes': 125}
+    return {'itineraries': [{'price': {'raw': 250.0}, 'legs': [leg]}], 'context': {'status': status}}
+
+class StubAPI:
+    '''
+    A retrieveFlights stand-in: the first 'failures' calls of each date get an
+    http 500, the next 'incomplete' ones an incomplete response, then the
+    complete one.  Calls that arrive before 'hold' seconds have passed are
+    answered together at that moment.
+    '''
+    def __init__(self, failures=0, incomplete=0, hold=0.0):
+        self.failures = failures
+        self.incomplete = incomplete
+        self.lock = threading.Lock()
+        self.calls = []
+        self.calls_by_date = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                date = parse_qs(urlparse(self.path).query)['date'][0]
+                now = time.monotonic()
+                with stub.lock:
+                    stub.calls.append(now)
+                    stub.calls_by_date.setdefault(date, []).append(now)
+                    count = len(stub.calls_by_date[date])
+                if now < stub.release_at:
+                    time.sleep(stub.release_at - now)
+                if count <= stub.failures:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                status = 'incomplete' if count <= stub.failures + stub.incomplete else 'complete'
+                body = json.dumps(stub_payload(date, status)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/retrieveFlights'
+        self.release_at = time.monotonic() + hold
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def fetch(stub, dates, **settings):
+    queries = [('ATL', 'JFK', date) for date in dates]
+    return asyncio.run(flight_fetcher.fetch_flights('test-key', queries, base_url=stub.url,
+                                                    cache=ResponseCache(':memory:'), **settings))
+
+def dates(n):
+    return [f'2024-11-{day:02d}' for day in range(1, n + 1)]
+
+def test_request_rate_holds_when_connection_slots_free_up_together():
+    #the first four calls are answered together: the calls queued behind them
+    #must still go out one token at a time, not all at once
+    rate, burst = 20.0, 1
+    with StubAPI(hold=0.5) as stub:
+        results = fetch(stub, dates(12), concurrency=4, rate=rate, burst=burst)
+    assert len(results) == 12 and all(result.complete for result in results)
+    calls = sorted(stub.calls)
+    assert len(calls) == 12
+    for first in range(len(calls)):
+        for last in range(first + 1, len(calls)):
+            #calls in any window, with one call and 10 ms of slack for scheduling
+            allowed = burst + rate * (calls[last] - calls[first] + 0.01) + 1
+            assert last - first + 1 <= allowed, (first, last, calls[last] - calls[first])
+
+def test_incomplete_responses_are_retried_with_backoff():
+    backoff = 0.05
+    with StubAPI(incomplete=2) as stub:
+        results = fetch(stub, dates(3), rate=1000, burst=10, max_retries=3, backoff=backoff)
+    for result in results:
+        assert result.complete and result.attempts == 3
+        assert list(result.legs['Origin']) == ['ATL'] and result.legs['Price'].iloc[0] == 250.0
+    for calls in stub.calls_by_date.values():
+        assert len(calls) == 3
+        #backoff, then twice the backoff (plus up to 10% jitter)
+        assert calls[1] - calls[0] >= backoff
+        assert calls[2] - calls[1] >= 2 * backoff
+
+def test_failed_requests_give_up_after_max_retries():
+    with StubAPI(failures=100) as stub:
+        [result] = fetch(stub, dates(1), rate=1000, burst=10, max_retries=2, backoff=0.01)
+    assert not result.complete and result.legs is None and result.attempts == 3
+    assert len(stub.calls) == 3
+
+def test_complete_responses_come_from_the_cache_the_second_time():
+    cache = ResponseCache(':memory:')
+    queries = [('ATL', 'JFK', date) for date in dates(2)]
+    with StubAPI() as stub:
+        for _ in range(2):
+            results = asyncio.run(flight_fetcher.fetch_flights('test-key', queries, base_url=stub.url,
+                                                               cache=cache, rate=1000, burst=10))
+            assert all(result.complete for result in results)
+    assert len(stub.calls) == 2
@@ -0,0 +1,123 @@
+#flight_index: the connection index and the route enumeration on it, checked
+#against a search written straight from the rules (conftest.brute_force_routes)
+
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import flight_index
+from conftest import brute_force_routes, dead_end_schedule, random_schedule
+from flight_index import FlightIndex, enumerate_routes, parallel_enumerate_routes
+
+@pytest.mark.parametrize('flights', [random_schedule(1), dead_end_schedule()])
+def test_connection_ranges_hold_exactly_the_legs_that_can_follow(flights):
+    index = FlightIndex(flights)
+    first, end = index.connection_ranges('45min')
+    #one closure for every leg, as enumerate_routes uses it
+    connections = index.connection_lists('45min')
+    dead_ends = 0
+    for leg in range(len(flights)):
+        expected = set(np.flatnonzero((flights['Origin'] == flights['Destination'][leg]).to_numpy() &
+                                      (flights['Departs'] >= flights['Arrives'][leg] + pd.Timedelta('45min')).to_numpy()))
+        assert set(index.order[first[leg]:end[leg]].tolist()) == expected
+        assert connections(leg) == sorted(expected)
+        dead_ends += not expected
+    assert dead_ends
+
+def test_departure_legs_leave_home_and_do_not_land_there():
+    flights = random_schedule(2)
+    index = FlightIndex(flights)
+    legs = index.departure_legs(['LAX', 'SFO'])
+    expected = flights.index[flights['Origin'].isin(['LAX', 'SFO']) & ~flights['Destination'].isin(['LAX', 'SFO'])]
+    assert legs == expected.tolist()
+    assert index.lands_home('ATL').tolist() == (flights['Destination'] == 'ATL').tolist()
+    assert index.departure_legs('XXX') == []
+
+@pytest.mark.parametrize('origin', ['ATL', 'JFK', ('LAX', 'SFO'), ('JFK', 'ATL', 'MIA')])
+@pytest.mark.parametrize('max_stops', [0, 1, 2])
+def test_enumerate_routes_matches_brute_force(origin, max_stops):
+    flights = random_schedule(3)
+    index = FlightIndex(flights)
+    expected = brute_force_routes(flights, origin, 500, '1h', max_stops)
+    routes, prices, durations = enumerate_routes(index, origin, 500, '1h', max_stops)
+    assert len(routes) == len(set(routes))
+    assert dict(zip(routes, prices)) == pytest.approx(expected)
+    for route, duration in zip(routes, durations):
+        assert duration == (flights['Arrives'][route[-1]] - flights['Departs'][route[0]]).total_seconds()
+
+@pytest.mark.parametrize('origin', ['JFK', ('JFK', 'LAX'), 'SEA'])
+@pytest.mark.parametrize('max_stops', [1, 2])
+def test_enumerate_routes_with_dead_end_legs_matches_brute_force(origin, max_stops):
+    flights = dead_end_schedule()
+    index = FlightIndex(flights)
+    expected = brute_force_routes(flights, origin, 0, '2h', max_stops)
+    routes, prices, durations = enumerate_routes(index, origin, 0, '2h', max_stops)
+    assert dict(zip(routes, prices)) == pytest.approx(expected)
+    assert min(durations) > 0
+
+def test_co_terminal_first_leg_never_continues_through_home():
+    #LAX -> SFO is a first leg between two home airports: no route may start with it
+    flights = pd.DataFrame({'Origin': ['LAX', 'SFO', 'SEA'], 'Destination': ['SFO', 'SEA', 'LAX'],
+                            'Departs': pd.to_datetime(['2024-11-14 08:00', '2024-11-14 11:00', '2024-11-14 15:00']),
+                            'Arrives': pd.to_datetime(['2024-11-14 09:30', '2024-11-14 13:00', '2024-11-14 17:30']),
+                            'Duration': [90, 120, 150], 'Price': [100.0, 200.0, 300.0]})
+    index = FlightIndex(flights)
+    routes, _, _ = enumerate_routes(index, ('LAX', 'SFO'), 0, '30min', 2)
+    assert routes == [(1, 2)]
+    routes, _, _ = enumerate_routes(index, ('LAX', 'SFO'), 0, '30min', 2, first_legs=[0, 1])
+    assert routes == [(1, 2)]
+    assert parallel_enumerate_routes(index, ('LAX', 'SFO'), 0, '30min', 2, workers=1)[0] == [(1, 2)]
+
+def test_parallel_enumeration_returns_the_same_lists():
+    flights = random_schedule(4, legs=200)
+    index = FlightIndex(flights)
+    for origin in ('ATL', ('LAX', 'SFO')):
+        expected = enumerate_routes(index, origin, 600, '1h', 2)
+        assert parallel_enumerate_routes(index, origin, 600, '1h', 2, workers=2, shards_per_worker=3) == expected
+
+def test_index_is_read_only_and_pickles_without_the_dataframe():
+    index = FlightIndex(random_schedule(5))
+    with pytest.raises(ValueError):
+        index.price[0] = 0
+    index.itinerary((0,))
+    copy = pickle.loads(pickle.dumps(index))
+    assert copy.flights is None and len(copy) == len(index)
+    assert np.array_equal(copy.keys, index.keys)
+
+def test_itinerary_shows_each_leg():
+    flights = random_schedule(6)
+    index = FlightIndex(flights)
+    route = tuple(enumerate_routes(index, 'ATL', 0, '1h', 1)[0][0])
+    details = index.itinerary(route)
+    assert [leg['Origin'] for leg in details] == flights['Origin'][list(route)].tolist()
+    assert details[0]['Departs'] == flights['Departs'][route[0]].strftime('%m/%d/%Y %H:%M')
+    assert details[0]['Duration'] == round(flights['Duration'][route[0]] / 60, 2)
+    assert index.itinerary(route) is details
+
+def test_rows_and_itineraries_kept_are_bounded(monkeypatch):
+    monkeypatch.setattr(flight_index, 'CACHED_ROWS', 3)
+    monkeypatch.setattr(flight_index, 'CACHED_ITINERARIES', 2)
+    flights = random_schedule(9)
+    index = FlightIndex(flights)
+    for leg in range(10):
+        assert index.row(leg)['id'] == flights['id'][leg]
+    assert list(index._rows) == [7, 8, 9]
+    index.row(7)
+    index.row(0)
+    assert list(index._rows) == [9, 7, 0]
+
+    routes = [(leg,) for leg in range(5)]
+    for route in routes:
+        index.itinerary(route)
+    assert list(index._itineraries) == routes[-2:]
+
+def test_shared_index_serves_threads_the_same_details():
+    index = FlightIndex(random_schedule(10))
+    routes = [tuple(range(start, start + 3)) for start in range(0, 60, 3)]
+    expected = [index.build_itinerary(route) for route in routes]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(index.itinerary, routes * 20))
+    assert results == expected * 20
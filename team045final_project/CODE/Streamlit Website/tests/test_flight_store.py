@@ -0,0 +1,119 @@
+#flight_store: which cells a refresh fetches, how fetched legs and their price
+#history are recorded, and the cached_flights csv exported from the store
+
+import asyncio
+
+import pandas as pd
+import pytest
+
+import flight_cache
+import flight_store
+from conftest import random_schedule
+from flight_fetcher import FetchResult
+from flight_store import FlightStore
+
+DAY = 24 * 3600
+
+@pytest.fixture
+def store():
+    store = FlightStore(':memory:', ttl=lambda date, now: DAY)
+    yield store
+    store.close()
+
+def cell_legs(seed, origin='ATL', destination='JFK', legs=5):
+    return random_schedule(seed, legs=legs).assign(Origin=origin, Destination=destination,
+                                                   id=[f'{origin}{destination}{seed}-{i}' for i in range(legs)])
+
+class StubFetcher:
+    '''fetch_flights stand-in: answers every query with cell_legs, except the cells in 'failing' '''
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.queries = []
+
+    async def __call__(self, api_key, queries, on_result=None, **options):
+        results = []
+        for origin, destination, date in queries:
+            self.queries.append((origin, destination, date))
+            legs = None if (origin, destination, date) in self.failing else cell_legs(len(self.queries), origin, destination)
+            results.append(FetchResult(origin, destination, date, legs, legs is not None, 1))
+            on_result(results[-1])
+        return results
+
+def test_stale_cells(store):
+    cells = store.stale_cells(['ATL', 'JFK'], ['2024-11-14', '2024-11-15'], now=0)
+    assert cells == [('ATL', 'JFK', '2024-11-14'), ('ATL', 'JFK', '2024-11-15'),
+                     ('JFK', 'ATL', '2024-11-14'), ('JFK', 'ATL', '2024-11-15')]
+    store.record('ATL', 'JFK', '2024-11-14', cell_legs(1), complete=True, now=0)
+    store.record('ATL', 'JFK', '2024-11-15', cell_legs(2), complete=False, now=0)
+    #fetched incomplete: stale right away, fetched complete: stale after its ttl
+    assert store.stale_cells(['ATL', 'JFK'], ['2024-11-14', '2024-11-15'], now=DAY - 1) == cells[1:]
+    assert store.stale_cells(['ATL', 'JFK'], ['2024-11-14', '2024-11-15'], now=DAY) == cells
+
+def test_cells_that_never_expire():
+    store = FlightStore(':memory:', ttl=lambda date, now: None)
+    store.record('ATL', 'JFK', '2024-11-14', cell_legs(1), complete=True, now=0)
+    assert store.stale_cells(['ATL', 'JFK'], ['2024-11-14'], now=10**9) == [('JFK', 'ATL', '2024-11-14')]
+
+def test_record_upserts_legs_and_keeps_their_price_history(store):
+    legs = cell_legs(1)
+    assert store.record('ATL', 'JFK', '2024-11-14', legs, complete=True, now=10) == len(legs)
+    #the same legs again: nothing changed, no new prices
+    assert store.record('ATL', 'JFK', '2024-11-14', legs, complete=True, now=20) == 0
+    changed = legs.copy()
+    changed.loc[0, 'Price'] += 25
+    changed.loc[1, 'Duration'] += 5
+    assert store.record('ATL', 'JFK', '2024-11-14', changed, complete=True, now=30) == 2
+
+    stored = store.legs().set_index('id')
+    assert len(stored) == len(legs)
+    assert stored.loc[legs['id'][0], 'Price'] == legs['Price'][0] + 25
+    assert stored.loc[legs['id'][1], 'Duration'] == legs['Duration'][1] + 5
+    history = store.price_history(legs['id'][0])
+    assert history['Price'].tolist() == [legs['Price'][0], legs['Price'][0] + 25]
+    assert history['observed_at'].tolist() == list(pd.to_datetime([10, 30], unit='s'))
+    #a change that is not the price adds no price_history row
+    assert len(store.price_history(legs['id'][1])) == 1
+    assert store.db.execute('SELECT first_seen, last_seen FROM legs WHERE id = ?',
+                            (legs['id'][2],)).fetchone() == (10, 30)
+
+def test_record_keeps_the_last_of_duplicate_legs(store):
+    legs = cell_legs(1, legs=2)
+    again = legs.iloc[[0]].assign(Price=1.0)
+    assert store.record('ATL', 'JFK', '2024-11-14', pd.concat([legs, again]), complete=True, now=0) == 2
+    assert store.legs().set_index('id')['Price'][legs['id'][0]] == 1.0
+    assert store.record('ATL', 'JFK', '2024-11-15', None, complete=True, now=0) == 0
+
+def test_export_csv_is_loaded_like_a_scraped_csv(store, tmp_path):
+    for seed, (origin, destination) in enumerate([('ATL', 'JFK'), ('JFK', 'ATL'), ('ATL', 'LAX')]):
+        store.record(origin, destination, '2024-11-14', cell_legs(seed, origin, destination), complete=True, now=0)
+    path = str(tmp_path / 'cached_flights.csv')
+    pd.DataFrame({'stale': [1]}).to_csv(path)
+    assert store.export_csv(path) == 15
+    loaded = flight_cache.load_legs(path, carriers=['Delta'])
+    stored = store.legs()
+    assert sorted(loaded['id']) == sorted(stored['id'])
+    merged = loaded.merge(stored, on='id', suffixes=('', '_stored'))
+    for column in ('Departs', 'Arrives', 'Price'):
+        assert (merged[column] == merged[f'{column}_stored']).all()
+
+def test_refresh_fetches_only_stale_cells(store, monkeypatch):
+    fetcher = StubFetcher(failing=[('JFK', 'ATL', '2024-11-14')])
+    monkeypatch.setattr(flight_store.flight_fetcher, 'fetch_flights', fetcher)
+    store.record('ATL', 'LAX', '2024-11-14', cell_legs(1, 'ATL', 'LAX'), complete=True)
+    summary = store.refresh('test-key', ['ATL', 'JFK', 'LAX'], ['2024-11-14'])
+    assert summary == {'cells': 6, 'fetched': 5, 'changed': 20}
+    assert ('ATL', 'LAX', '2024-11-14') not in fetcher.queries
+    #the failed cell is the only one left to fetch
+    fetcher.queries.clear()
+    assert store.refresh('test-key', ['ATL', 'JFK', 'LAX'], ['2024-11-14'])['fetched'] == 1
+    assert fetcher.queries == [('JFK', 'ATL', '2024-11-14')]
+
+def test_refresh_inside_a_running_event_loop(store, monkeypatch):
+    monkeypatch.setattr(flight_store.flight_fetcher, 'fetch_flights', StubFetcher())
+
+    async def refresh():
+        with pytest.raises(RuntimeError, match='refresh_async'):
+            store.refresh('test-key', ['ATL', 'JFK'], ['2024-11-14'])
+        return await store.refresh_async('test-key', ['ATL', 'JFK'], ['2024-11-14'])
+
+    assert asyncio.run(refresh()) == {'cells': 2, 'fetched': 2, 'changed': 10}
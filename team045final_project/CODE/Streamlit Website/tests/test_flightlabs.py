@@ -0,0 +1,41 @@
+#flightlabs.parse_flights: the delta legs of a retrieveFlights response
+
+import json
+
+import pandas as pd
+
+from flightlabs import DELTA_CARRIER_ID, parse_flights
+
+def leg(leg_id, carrier_id, origin, destination, departs, arrives, minutes):
+    return {'id': leg_id, 'carriers': {'marketing': [{'id': carrier_id, 'name': 'Delta' if carrier_id == DELTA_CARRIER_ID else 'Other'}]},
+            'origin': {'id': origin}, 'destination': {'id': destination},
+            'departure': departs, 'arrival': arrives, 'durationInMinutes': minutes}
+
+RESPONSE = {'itineraries': [
+                {'price': {'raw': 310.5}, 'legs': [
+                    leg('a', DELTA_CARRIER_ID, 'ATL', 'JFK', '2024-11-14T08:00:00', '2024-11-14T10:05:00', 125),
+                    leg('b', -1, 'JFK', 'BOS', '2024-11-14T12:00:00', '2024-11-14T13:10:00', 70)]},
+                {'price': {'raw': 199.0}, 'legs': [
+                    leg('c', DELTA_CARRIER_ID, 'ATL', 'LAX', '2024-11-14T09:30:00', '2024-11-14T11:20:00', 290)]}],
+            'context': {'status': 'complete'}}
+
+def test_only_delta_legs_are_kept_with_their_itinerary_price():
+    legs, complete = parse_flights(RESPONSE)
+    assert complete
+    assert list(legs.columns) == ['id', 'CarrierName', 'Origin', 'Destination', 'Departs', 'Arrives', 'Duration', 'Price']
+    assert list(legs['id']) == ['a', 'c']
+    assert list(legs['Destination']) == ['JFK', 'LAX']
+    assert list(legs['Price']) == [310.5, 199.0]
+    assert list(legs['Duration']) == [125, 290]
+    assert legs['Departs'].iloc[0] == pd.Timestamp('2024-11-14 08:00:00')
+
+def test_raw_body_parses_like_the_decoded_json():
+    body = json.dumps(RESPONSE)
+    for payload in (body, body.encode()):
+        legs, complete = parse_flights(payload)
+        pd.testing.assert_frame_equal(legs, parse_flights(RESPONSE)[0])
+
+def test_incomplete_empty_response_keeps_its_columns():
+    legs, complete = parse_flights({'itineraries': [], 'context': {'status': 'incomplete'}})
+    assert not complete and legs.empty
+    assert 'Departs' in legs.columns and 'Price' in legs.columns
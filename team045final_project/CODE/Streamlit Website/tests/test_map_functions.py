@@ -0,0 +1,37 @@
+#map_functions: the node and arc records drawn on the route map
+
+import numpy as np
+import pytest
+
+import map_functions
+from map_functions import map_payload
+
+def test_every_airport_and_leg_is_drawn_once():
+    nodes, arcs = map_payload((('ATL', 'JFK', 'ATL'), ('ATL', 'LAX', 'JFK', 'ATL')), (0.9, 0.5))
+    assert sorted(node['IATA'] for node in nodes) == ['ATL', 'JFK', 'LAX']
+    assert [node['Color'] for node in nodes if node['IATA'] == 'ATL'] == [map_functions.ORIGIN_COLOR]
+    #ATL-JFK, ATL-LAX and JFK-LAX, the best route's legs drawn widest
+    assert len(arcs) == 3
+    assert max(arc['Width'] for arc in arcs) == map_functions.ARC_WIDTHS[1]
+    for arc in arcs:
+        assert 2 <= len(arc['path']) <= map_functions.ARC_POINTS
+        assert np.isfinite(arc['path']).all()
+
+def test_airports_without_coordinates_are_left_out():
+    nodes, arcs = map_payload((('ATL', 'XYZ', 'ATL'), ('ATL', 'JFK', 'ATL')), (0.9, 0.5))
+    assert sorted(node['IATA'] for node in nodes) == ['ATL', 'JFK']
+    assert len(arcs) == 1
+    ends = [arc['path'][0] for arc in arcs] + [arc['path'][-1] for arc in arcs]
+    assert np.isfinite(ends).all()
+
+def test_only_unknown_legs():
+    nodes, arcs = map_payload((('ATL', 'XYZ', 'ATL'),), (0.9,))
+    assert [node['IATA'] for node in nodes] == ['ATL'] and arcs == []
+    assert map_payload((), ()) == ([], [])
+
+@pytest.mark.parametrize('pair', [('ATL', 'ATL'), ('ATL', 'JFK'), ('JFK', 'ATL')])
+def test_arcs_run_between_their_airports(pair):
+    path, = map_functions.airport_arcs([pair])
+    coordinates = map_functions.dataloader.registry.batch_coordinates(sorted(pair))
+    assert path[0] == pytest.approx(coordinates[0][::-1].tolist(), abs=0.01)
+    assert path[-1] == pytest.approx(coordinates[1][::-1].tolist(), abs=0.01)
@@ -0,0 +1,59 @@
+#pareto_front: the non-dominated routes of a search and the knee of the
+#time / price trade-off
+
+import numpy as np
+import pytest
+
+from conftest import random_schedule
+from flight_index import FlightIndex, enumerate_routes
+from pareto_front import ParetoFront, non_dominated
+
+def brute_force_non_dominated(objectives):
+    return np.array([not any((other <= row).all() and (other < row).any() for other in objectives)
+                     for row in objectives], dtype=bool)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_non_dominated_matches_pairwise_comparison(seed):
+    #small integers, so there are ties and duplicates
+    objectives = np.random.RandomState(seed).randint(0, 6, size=(80, 3))
+    assert np.array_equal(non_dominated(objectives), brute_force_non_dominated(objectives))
+
+@pytest.mark.parametrize('counts', [1, 4])
+def test_non_dominated_of_a_larger_search(counts):
+    #durations on a 5 minute grid and cents prices, so ties happen but are rare
+    random = np.random.RandomState(counts)
+    objectives = np.column_stack([random.randint(12, 600, size=1500) * 300.0,
+                                  random.randint(50000, 200000, size=1500) / 100,
+                                  random.randint(0, counts, size=1500)])
+    dominates = ((objectives[:, None] <= objectives[None]).all(axis=2) &
+                 (objectives[:, None] < objectives[None]).any(axis=2))
+    assert np.array_equal(non_dominated(objectives), ~dominates.any(axis=0))
+
+def test_identical_rows_are_all_kept():
+    assert non_dominated([[1, 2, 0], [1, 2, 0], [2, 2, 0]]).tolist() == [True, True, False]
+    assert non_dominated(np.empty((0, 3))).tolist() == []
+
+def test_front_of_a_search_holds_exactly_the_non_dominated_routes():
+    index = FlightIndex(random_schedule(8, legs=200))
+    routes, prices, durations = enumerate_routes(index, 'ATL', 500, '1h', 2)
+    front = ParetoFront.from_routes(index, routes)
+    objectives = np.column_stack([durations, prices, [len(route) - 1 for route in routes]])
+    expected = [route for route, kept in zip(routes, brute_force_non_dominated(objectives)) if kept]
+    assert 0 < len(front) < len(routes)
+    assert front.routes == sorted(expected)
+    by_route = dict(zip(routes, objectives.tolist()))
+    for route, row in zip(front.routes, front.objectives.tolist()):
+        assert row == pytest.approx(by_route[route])
+
+def test_knee_is_the_route_farthest_below_the_fastest_to_cheapest_line():
+    #fastest (1 h, $900), cheapest (10 h, $100) and a knee well below the line between them
+    front = ParetoFront([(0,), (1,), (2,), (3,)], np.array([1, 10, 3, 6]) * 3600.0,
+                        [900.0, 100.0, 250.0, 200.0], [0, 0, 1, 1])
+    assert front.routes[front.knee()] == (2,)
+    frame = front.frame()
+    assert frame['Total Route Duration'].tolist() == [1, 3, 6, 10]
+    assert frame['Knee'].tolist() == [False, True, False, False]
+
+def test_knee_of_a_single_route_and_of_no_routes():
+    assert ParetoFront([(4,)], [3600.0], [300.0], [0]).knee() == 0
+    assert ParetoFront([], [], [], []).knee() is None
@@ -0,0 +1,102 @@
+#response_cache: what a response is keyed by, what is stored, and identical
+#queries in flight at the same time sharing one call
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from response_cache import ResponseCache, request_key
+
+URL = 'https://www.goflightlabs.com/retrieveFlights'
+STUB_URL = 'http://127.0.0.1:8000/retrieveFlights'
+
+PARAMS = {'access_key': 'key-1', 'originSkyId': 'ATL', 'destinationSkyId': 'JFK',
+          'originEntityId': 95673800, 'destinationEntityId': 95565058, 'date': '2030-01-15',
+          'cabinClass': 'premium_economy'}
+
+def payload(status='complete', price=250.0):
+    return {'itineraries': [{'price': {'raw': price}, 'legs': []}], 'context': {'status': status}}
+
+def test_key_ignores_the_api_key_and_code_case_but_not_the_url():
+    same = dict(PARAMS, access_key='key-2', originSkyId='atl ')
+    assert request_key(URL, same) == request_key(URL, PARAMS)
+    assert request_key(URL, dict(PARAMS, date='2030-01-16')) != request_key(URL, PARAMS)
+    assert request_key(STUB_URL, PARAMS) != request_key(URL, PARAMS)
+
+def test_stub_server_responses_are_not_served_for_the_real_api():
+    cache = ResponseCache(':memory:')
+    cache.put(STUB_URL, PARAMS, payload(price=1.0))
+    assert cache.get(URL, PARAMS) is None
+    assert cache.get(STUB_URL, PARAMS)['itineraries'][0]['price']['raw'] == 1.0
+
+def test_only_complete_responses_are_stored_and_they_expire():
+    cache = ResponseCache(':memory:', ttl=lambda date, now: 60)
+    assert not cache.put(URL, PARAMS, payload('incomplete'), now=0)
+    assert cache.get(URL, PARAMS, now=0) is None
+    assert cache.put(URL, PARAMS, payload(), now=0)
+    assert cache.get(URL, PARAMS, now=59) == payload()
+    assert cache.get(URL, PARAMS, now=60) is None
+    assert cache.purge(now=60) == 1
+
+def test_threads_asking_for_the_same_query_share_one_call():
+    cache = ResponseCache(':memory:')
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return payload()
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(cache.fetch, URL, PARAMS, call) for _ in range(8)]
+        #every thread is either making the call or waiting on it before it returns
+        deadline = time.monotonic() + 5
+        while cache.shared < 7 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1 and cache.shared == 7
+    assert all(result == payload() for result in results)
+    assert cache.stats()['entries'] == 1
+
+def test_waiting_threads_get_the_error_of_the_shared_call():
+    cache = ResponseCache(':memory:')
+    release = threading.Event()
+
+    def call():
+        release.wait(5)
+        raise ConnectionError('api down')
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(cache.fetch, URL, PARAMS, call) for _ in range(4)]
+        deadline = time.monotonic() + 5
+        while cache.shared < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            with pytest.raises(ConnectionError):
+                future.result()
+    assert not cache.pending
+
+def test_coroutines_asking_for_the_same_query_share_one_call():
+    cache = ResponseCache(':memory:')
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return payload()
+
+    async def main():
+        return await asyncio.gather(*(cache.fetch_async(URL, PARAMS, call) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1 and cache.shared == 4
+    assert all(result == payload() for result in results)
+    #and the next one is a cache hit
+    assert asyncio.run(cache.fetch_async(URL, PARAMS, call)) == payload() and len(calls) == 1
@@ -0,0 +1,85 @@
+#route_search: the searches that skip the exhaustive enumeration must find the
+#same routes as scoring every route of conftest.brute_force_routes
+
+from datetime import timedelta
+
+import pytest
+
+from conftest import brute_force_routes, dead_end_schedule, random_schedule
+from flight_index import FlightIndex
+from route_search import default_scales, optimal_route, route_score, top_k_routes
+
+ORIGINS = ['ATL', 'SEA', ('LAX', 'SFO')]
+
+def route_duration(index, route):
+    return float(index.arrives[route[-1]] - index.departs[route[0]])
+
+@pytest.mark.parametrize('origin', ORIGINS)
+@pytest.mark.parametrize('max_stops', [0, 1, 2])
+@pytest.mark.parametrize('seed', [11, 12])
+def test_optimal_route_matches_exhaustive_search(seed, origin, max_stops):
+    flights = random_schedule(seed)
+    index = FlightIndex(flights)
+    found = brute_force_routes(flights, origin, 600, '1h', max_stops)
+
+    route, value = optimal_route(index, origin, 600, '1h', max_stops, 'price')
+    if not found:
+        assert (route, value) == (None, None)
+        return
+    assert route in found and value == pytest.approx(min(found.values()))
+
+    route, value = optimal_route(index, origin, 600, '1h', max_stops, 'duration')
+    assert route in found
+    assert value == route_duration(index, route) == min(route_duration(index, each) for each in found)
+
+@pytest.mark.parametrize('origin', ['JFK', ('JFK', 'LAX'), 'SEA'])
+@pytest.mark.parametrize('target_miles', [800, 1400])
+def test_optimal_route_with_dead_end_legs_matches_brute_force(origin, target_miles):
+    flights = dead_end_schedule()
+    index = FlightIndex(flights)
+    found = brute_force_routes(flights, origin, target_miles, '2h', 2)
+    assert found
+    route, value = optimal_route(index, origin, target_miles, '2h', 2, 'price')
+    assert route in found and value == pytest.approx(min(found.values()))
+    route, value = optimal_route(index, origin, target_miles, '2h', 2, 'duration')
+    assert route in found and value == min(route_duration(index, each) for each in found)
+
+@pytest.mark.parametrize('objective', ['price', 'duration'])
+def test_optimal_route_within_max_duration(objective):
+    flights = random_schedule(13, legs=200)
+    index = FlightIndex(flights)
+    limit = timedelta(hours=30)
+    found = {route: price for route, price in brute_force_routes(flights, 'JFK', 500, '1h', 2).items()
+             if route_duration(index, route) <= limit.total_seconds()}
+    assert found
+    route, value = optimal_route(index, 'JFK', 500, '1h', 2, objective, max_duration=limit)
+    assert route in found
+    if objective == 'price':
+        assert value == pytest.approx(min(found.values()))
+    else:
+        assert value == min(route_duration(index, each) for each in found)
+
+def test_optimal_route_rejects_other_objectives():
+    with pytest.raises(ValueError):
+        optimal_route(FlightIndex(random_schedule(14)), 'ATL', 500, '1h', 1, 'connections')
+
+@pytest.mark.parametrize('flights', [random_schedule(15, legs=160), dead_end_schedule()])
+@pytest.mark.parametrize('origin', ORIGINS)
+@pytest.mark.parametrize('weight_time, connection_weight', [(0.0, 0), (0.5, 0), (1.0, 0), (0.3, 0.4)])
+def test_top_k_routes_matches_scoring_every_route(flights, origin, weight_time, connection_weight):
+    index = FlightIndex(flights)
+    scales = default_scales(index, 2)
+    weights = (weight_time, 1 - weight_time, connection_weight)
+    found = brute_force_routes(flights, origin, 500, '2h', 2)
+    #ties broken by leg ids, as top_k_routes does
+    expected = sorted((route_score(route_duration(index, route), price, len(route) - 1, weights, scales), route)
+                      for route, price in found.items())
+    for k in (1, 10, len(found) + 5):
+        routes, scores = top_k_routes(index, origin, 500, '2h', 2, k, weight_time, connection_weight)
+        assert routes == [route for _, route in expected[:k]]
+        assert scores == pytest.approx([score for score, _ in expected[:k]])
+
+def test_top_k_routes_of_nothing():
+    index = FlightIndex(random_schedule(16))
+    assert top_k_routes(index, 'ATL', 500, '1h', 2, 0, 0.5) == ([], [])
+    assert top_k_routes(index, 'ATL', 10**6, '1h', 2, 5, 0.5) == ([], [])
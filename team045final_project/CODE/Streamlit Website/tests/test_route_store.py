@@ -0,0 +1,91 @@
+#route_store: sorted, filtered pages of every route of a search, checked
+#against sorting and filtering a dataframe of all the routes
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import route_store
+from conftest import random_schedule
+from flight_index import FlightIndex, enumerate_routes
+from route_store import MAX_PAGE_SIZE, RouteStore
+
+@pytest.fixture(scope='module')
+def store():
+    index = FlightIndex(random_schedule(17, legs=200))
+    routes, _, _ = enumerate_routes(index, 'ATL', 500, '1h', 2)
+    #few distinct scores, so the sorts have ties
+    scores = np.random.RandomState(0).randint(0, 5, len(routes)) / 4
+    return RouteStore(index, routes, scores)
+
+def all_routes(store):
+    '''every route of the store as a dataframe, indexed by route number'''
+    index = store.flight_index
+    return pd.DataFrame({'Weighted Score': store.scores,
+                         'Total Price': [index.price[list(route)].sum() for route in store.routes],
+                         'Total Route Duration': [index.arrives[route[-1]] - index.departs[route[0]] for route in store.routes],
+                         'Connections': [len(route) - 1 for route in store.routes],
+                         'Departure Time': [index.departs[route[0]] for route in store.routes],
+                         'Stops': [{index.airports[index.origin[leg]] for leg in route} for route in store.routes]})
+
+@pytest.mark.parametrize('sort_by, ascending', [('Weighted Score', None), ('Total Price', None), ('Total Price', False),
+                                                ('Total Route Duration', None), ('Connections', None),
+                                                ('Departure Time', False)])
+def test_pages_walk_through_the_sorted_routes(store, sort_by, ascending):
+    frame = all_routes(store)
+    best_first = ascending if ascending is not None else route_store.SORT_KEYS[sort_by]
+    #ties keep route number order, whichever way the sort goes
+    expected = frame.assign(number=frame.index).sort_values([sort_by, 'number'], ascending=[best_first, True]).index
+    seen = []
+    first = store.page(0, 40, sort_by, ascending)
+    assert first.total == len(store) and first.pages == -(-len(store) // 40)
+    for number in range(first.pages):
+        page = store.page(number, 40, sort_by, ascending)
+        assert page.number == number and len(page.rows) <= 40
+        seen.extend(page.rows.index)
+    assert seen == expected.tolist()
+
+def test_filters_match_the_dataframe(store):
+    frame = all_routes(store)
+    page = store.page(0, MAX_PAGE_SIZE, 'Total Price', max_price=900, max_duration=50, max_connections=2,
+                      airports=('JFK',))
+    expected = frame[(frame['Total Price'] <= 900) & (frame['Total Route Duration'] <= 50 * 3600) &
+                     (frame['Connections'] <= 2) & frame['Stops'].map(lambda stops: 'JFK' in stops)]
+    assert 0 < page.total == len(expected) < len(store)
+    assert sorted(page.rows.index) == sorted(expected.index)
+    assert all('JFK' in itinerary for itinerary in page.rows['Itinerary'])
+
+def test_page_rows_describe_their_routes(store):
+    page = store.page(0, 5, 'Total Price')
+    index = store.flight_index
+    for number, row in page.rows.iterrows():
+        route = store.routes[number]
+        assert row['Legs'] == route
+        assert row['Total Price'] == pytest.approx(index.price[list(route)].sum())
+        assert row['Itinerary'][0] == 'ATL' and row['Itinerary'][-1] == 'ATL'
+        assert len(row['Itinerary']) == len(route) + 1
+
+def test_page_numbers_and_sizes_are_clamped(store):
+    last = store.page(10**6, 50)
+    assert last.number == last.pages - 1
+    assert store.page(-3, 50).number == 0
+    assert len(store.page(0, 10**6).rows) == min(MAX_PAGE_SIZE, len(store))
+    empty = store.page(0, 50, max_price=0)
+    assert (empty.total, empty.pages, len(empty.rows)) == (0, 1, 0)
+
+def test_views_kept_are_bounded(store, monkeypatch):
+    monkeypatch.setattr(route_store, 'CACHED_VIEWS', 3)
+    store = RouteStore(store.flight_index, store.routes, store.scores)
+    for price in range(10):
+        store.page(0, 10, max_price=500 + 10 * price)
+    assert len(store.views) == 3
+
+def test_unknown_sort_keys_and_stores_without_scores():
+    index = FlightIndex(random_schedule(18))
+    routes, _, _ = enumerate_routes(index, 'ATL', 500, '1h', 1)
+    unscored = RouteStore(index, routes)
+    assert 'Weighted Score' not in unscored.sort_keys()
+    with pytest.raises(ValueError):
+        unscored.page(0, 10, 'Weighted Score')
+    with pytest.raises(ValueError):
+        unscored.page(0, 10, 'Legroom')
@@ -0,0 +1,39 @@
+#schedule_generator: generated and replicated synthetic schedules
+
+import subprocess
+import sys
+
+import numpy as np
+
+from conftest import APP_DIR, random_schedule
+from flight_index import FlightIndex, enumerate_routes
+from great_circle import haversine_miles
+from schedule_generator import FIXED_MINUTES, generate_schedule, replicate_schedule
+
+def test_generated_schedule_is_reproducible_and_sorted():
+    legs = generate_schedule(airports=12, hubs=2, legs_per_day=80, days=3, seed=4)
+    assert legs.equals(generate_schedule(airports=12, hubs=2, legs_per_day=80, days=3, seed=4))
+    assert len(legs) == 240
+    assert legs['Departs'].is_monotonic_increasing
+    assert (legs['Origin'] != legs['Destination']).all()
+    assert ((legs['Arrives'] - legs['Departs']).dt.total_seconds() == legs['Duration'] * 60).all()
+    assert (legs['Duration'] >= FIXED_MINUTES).all() and (legs['Price'] > 0).all()
+
+def test_replicated_schedule_has_the_same_routes_from_an_original_airport():
+    flights = random_schedule(21)
+    bigger = replicate_schedule(flights, 3)
+    assert len(bigger) == 3 * len(flights)
+    assert set(bigger['Origin'][len(flights):2 * len(flights)]) == {code + '1' for code in flights['Origin']}
+    original = enumerate_routes(FlightIndex(flights), 'ATL', 500, '1h', 1)
+    assert enumerate_routes(FlightIndex(bigger), 'ATL', 500, '1h', 1) == original
+
+def test_haversine_distance():
+    #JFK to LAX: 2475 miles on the ellipsoid, within 0.5% of that on the sphere
+    assert abs(haversine_miles(40.6413, -73.7781, 33.9416, -118.4085) - 2475) < 0.005 * 2475
+    assert np.allclose(haversine_miles([0, 0], [0, 0], [0, 90], [1, 0]), [69.09, 6218.4], rtol=1e-3)
+
+def test_schedule_generator_does_not_load_the_app():
+    loaded = subprocess.run([sys.executable, '-c', 'import sys, schedule_generator; '
+                             'print(sorted(m for m in ("streamlit", "dataloader", "geostuff") if m in sys.modules))'],
+                            cwd=APP_DIR, capture_output=True, text=True, check=True).stdout
+    assert loaded.strip() == '[]'
@@ -0,0 +1,51 @@
+#search_cache: the LRU of search results, bounded by entries and by bytes
+
+import numpy as np
+import pandas as pd
+
+from search_cache import SearchCache, estimate_bytes
+
+def test_least_recently_used_entry_goes_first():
+    cache = SearchCache(max_entries=3, max_bytes=10**6)
+    for key in 'abc':
+        cache.put(key, key.upper(), nbytes=10)
+    assert cache.get('a') == 'A'
+    cache.put('d', 'D', nbytes=10)
+    assert cache.get('b') is None
+    assert [key for key in 'acd' if cache.get(key) is not None] == ['a', 'c', 'd']
+    assert len(cache) == 3
+
+def test_entries_are_evicted_until_under_max_bytes():
+    cache = SearchCache(max_entries=10, max_bytes=100)
+    cache.put('a', 1, nbytes=40)
+    cache.put('b', 2, nbytes=40)
+    cache.put('c', 3, nbytes=40)
+    assert cache.get('a') is None and cache.get('b') == 2 and cache.get('c') == 3
+    assert cache.stats()['bytes'] == 80
+    #putting a key again replaces its size instead of adding to it
+    cache.put('c', 4, nbytes=10)
+    assert cache.stats()['bytes'] == 50 and cache.get('c') == 4
+
+def test_value_bigger_than_max_bytes_is_not_cached():
+    cache = SearchCache(max_entries=10, max_bytes=100)
+    cache.put('a', 1, nbytes=50)
+    cache.put('big', 2, nbytes=101)
+    assert cache.get('big') is None and cache.get('a') == 1
+    #and it drops an older value cached under the same key
+    cache.put('a', 3, nbytes=101)
+    assert cache.get('a') is None and cache.stats()['bytes'] == 0
+
+def test_hits_misses_and_clear():
+    cache = SearchCache()
+    cache.put('a', 1, nbytes=1)
+    cache.get('a'), cache.get('b')
+    assert cache.stats() == {'entries': 1, 'bytes': 1, 'hits': 1, 'misses': 1}
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()['bytes'] == 0
+
+def test_estimate_bytes_measures_arrays_and_frames():
+    array = np.zeros(1000)
+    frame = pd.DataFrame({'a': np.zeros(1000)})
+    assert estimate_bytes(array) == 8000
+    assert estimate_bytes(frame) >= 8000
+    assert estimate_bytes([array, {'frame': frame}]) > 16000
@@ -0,0 +1,174 @@
+#search_service: searches and reranks through the service, and the searches
+#of one client through its SearchContext
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+import pytest
+
+from conftest import AIRPORTS
+from flight_index import enumerate_routes, origin_codes
+from route_finder import RouteRanker
+from search_service import (MIN_LAYOVER, TOP_N, NoRoutesFound, SearchContext, SearchHandler,
+                            SearchService, parse_query, run_batch)
+
+def test_rerank_returns_the_top_n_of_every_route(service):
+    result = service.search('ATL', 500, max_stops=2)
+    assert len(result.routes) > 20
+    for time_weight in (0.0, 0.3, 0.7, 1.0):
+        reranked = service.rerank(result, time_weight, top_n=20)
+        expected = RouteRanker(result.routes, time_weight, flight_index=result.flight_index).rerank_routes(top_n=20)
+        assert len(reranked) == 20
+        assert reranked.index.tolist() == expected.index.tolist()
+        assert np.allclose(reranked['Weighted Score'], expected['Weighted Score'])
+        #the best route under any weights is on the Pareto front
+        assert result.routes[reranked.index[0]] in result.pareto_front.routes
+
+def test_search_finds_every_route_of_the_index(service):
+    result = service.search(('LAX', 'SFO'), 600, max_stops=1)
+    routes, prices, _ = enumerate_routes(result.flight_index, ('LAX', 'SFO'), 600, MIN_LAYOVER, 1)
+    assert result.routes == routes
+    assert len(result.ranked) == min(TOP_N, len(routes))
+    assert len(result.route_store) == len(routes)
+    assert set(result.pareto_front.routes) <= set(routes)
+
+def test_repeated_searches_reuse_the_result_and_the_index(schedule_csv):
+    service = SearchService(schedule_csv, search_airports=AIRPORTS)
+    first = service.search('ATL', 500, max_stops=1)
+    assert service.search('ATL', 500, max_stops=1) is first
+    #another target over the same airports and dates: a new search, the same index
+    other = service.search('ATL', 800, max_stops=1)
+    assert other is not first and other.flight_index is first.flight_index
+    assert service.indexes_built == 1
+    start, end = service.schedule_dates()
+    service.search('ATL', 500, max_stops=1, start_date=start, end_date=start)
+    assert service.indexes_built == 2
+
+def test_identical_searches_at_the_same_time_run_once(schedule_csv, monkeypatch):
+    service = SearchService(schedule_csv, search_airports=AIRPORTS)
+    runs = []
+    run_search = service.run_search
+
+    def slow_run_search(*args):
+        runs.append(args)
+        time.sleep(0.2)
+        return run_search(*args)
+
+    monkeypatch.setattr(service, 'run_search', slow_run_search)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: service.search('SEA', 500, max_stops=1), range(8)))
+    assert len(runs) == 1
+    assert all(result is results[0] for result in results)
+    assert service.shared + service.cache.hits == 7
+
+def test_no_route_reaching_the_target_raises(service):
+    with pytest.raises(NoRoutesFound):
+        service.search('ATL', 10**6, max_stops=1)
+
+def test_parse_query_reads_text_and_json_values():
+    query = parse_query({'origin': 'jfk| lga', 'tier': 'gold', 'current_mqd': '4000', 'max_stops': '1',
+                         'start_date': '2024-11-14', 'min_layover': '90'})
+    assert query['origin'] == ('JFK', 'LGA') and query['target_miles'] == 6000
+    assert query['max_stops'] == 1 and query['start_date'] == date(2024, 11, 14)
+    assert query['min_layover'] == timedelta(minutes=90) and query['top_n'] == TOP_N
+    assert parse_query({'origin': ['ATL'], 'target_miles': 3000})['origin'] == ('ATL',)
+    for params in ({'target_miles': 3000}, {'origin': 'ATL'}, {'origin': 'ATL', 'target_miles': 'far'},
+                   {'origin': 'ATL', 'tier': 'Gold', 'current_mqd': 10000}):
+        with pytest.raises(ValueError):
+            parse_query(params)
+
+def test_batch_records_errors_per_query(service):
+    records = list(run_batch(service, [{'origin': 'ATL', 'target_miles': '500', 'max_stops': '1'},
+                                       {'origin': 'ATL'},
+                                       {'origin': 'ATL', 'target_miles': '1000000', 'max_stops': '1'}],
+                             time_weight=0.5))
+    assert [record['query_number'] for record in records] == [0, 1, 2]
+    assert records[0]['routes'] > 0 and len(records[0]['ranked']) == min(TOP_N, records[0]['routes'])
+    assert records[0]['ranked'][0]['Flights'][0]['Origin'] == 'ATL'
+    assert 'error' in records[1] and 'error' in records[2]
+    json.dumps(records, default=str)
+
+def test_http_endpoint(service):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SearchHandler)
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        with urlopen(f'{url}/search?origin=ATL&target_miles=500&max_stops=1&top_n=5') as response:
+            record = json.load(response)
+        assert len(record['ranked']) == 5 and record['query']['origin'] == ['ATL']
+        request = Request(f'{url}/search', data=json.dumps({'origin': ['LAX', 'SFO'], 'target_miles': 600,
+                                                            'max_stops': 1}).encode(), method='POST')
+        with urlopen(request) as response:
+            assert json.load(response)['query']['origin'] == ['LAX', 'SFO']
+        for path, status in (('/search?origin=ATL', 400), ('/search?origin=ATL&target_miles=1000000', 404),
+                             ('/nowhere', 404)):
+            with pytest.raises(HTTPError) as error:
+                urlopen(url + path)
+            assert error.value.code == status
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def route_inputs(origin, target_miles, max_stops=1, start_date=None, end_date=None):
+    return {'origin': origin, 'target_miles': target_miles, 'max_stops': max_stops,
+            'start_date': start_date, 'end_date': end_date}
+
+def test_context_keeps_its_own_results(service):
+    context = SearchContext(service, max_results=2)
+    context.route_inputs = route_inputs('ATL', 500)
+    result = context.search()
+    assert context.result is result
+    #the shared cache may drop it, the context still has it
+    service.cache.clear()
+    assert context.search() is result
+    for target in (600, 700):
+        context.route_inputs = route_inputs('ATL', target)
+        context.search()
+    assert len(context.results) == 2
+    context.route_inputs = route_inputs('ATL', 500)
+    assert context.search() is not result
+
+def test_failed_search_leaves_no_result_to_rerank(service):
+    context = SearchContext(service)
+    context.route_inputs = route_inputs('ATL', 500)
+    context.search()
+    context.route_inputs = route_inputs('ATL', 10**6)
+    with pytest.raises(NoRoutesFound):
+        context.search()
+    assert context.result is None
+
+def test_context_reranks_its_latest_result(service):
+    context = SearchContext(service)
+    context.route_inputs = route_inputs('SEA', 500, max_stops=2)
+    result = context.search()
+    context.preference_inputs = {'time_weight': 0.8, 'cost_weight': 0.2}
+    reranked = context.rerank(top_n=20)
+    assert len(reranked) == min(20, len(result.routes))
+    assert reranked.index.tolist() == service.rerank(result, 0.8, top_n=20).index.tolist()
+
+def test_contexts_in_many_threads_only_see_their_own_searches(service):
+    inputs = [route_inputs(origin, target) for origin in ('ATL', 'JFK', 'SEA', ('LAX', 'SFO'))
+              for target in (500, 700)]
+    expected = [service.search(*(origin_codes(each['origin']), each['target_miles'], each['max_stops'],
+                                 *service.schedule_dates())).routes for each in inputs]
+
+    def session(number):
+        context = SearchContext(service)
+        mismatches = 0
+        for step in range(20):
+            which = (number + step) % len(inputs)
+            context.route_inputs = inputs[which]
+            mismatches += context.search().routes != expected[which]
+        return mismatches
+
+    with ThreadPoolExecutor(16) as pool:
+        assert sum(pool.map(session, range(32))) == 0
@@ -0,0 +1,258 @@
+#this python file contains the tracing used to see where the time of a search
+#goes: timed spans around the pipeline stages (filtering, route search,
+#ranking, serialization, the table and the map), counters (nodes expanded,
+#branches pruned, candidate routes, cache hits, rows rendered) and an optional
+#cProfile / pyinstrument capture of the whole request.
+#
+#a Trace belongs to one script run: it is made current with 'with trace:' and
+#the module level span() / count() calls record into the current trace of the
+#calling thread (streamlit runs every session in its own thread), or do
+#nothing when there is none, so instrumented code costs next to nothing
+#outside a trace.
+#
+#a trace is exported as plain JSON records or as an OTLP/JSON
+#ExportTraceServiceRequest that OpenTelemetry collectors accept.
+
+import cProfile
+import contextvars
+import functools
+import io
+import json
+import pstats
+import secrets
+import time
+from contextlib import contextmanager
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+SERVICE_NAME = 'mileage-run-finder'
+
+#lines of the cProfile report, by cumulative time
+PROFILE_LINES = 40
+
+_current = contextvars.ContextVar('trace', default=None)
+
+class Span:
+    """One timed stage of a trace"""
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'started')
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        #wall clock for the export, a monotonic clock for the duration
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter_ns()
+        self.end_ns = None
+
+    @property
+    def duration_ms(self):
+        return None if self.end_ns is None else (self.end_ns - self.start_ns) / 1e6
+
+class Trace:
+    """Spans and counters of one request, with an optional profile of it"""
+    def __init__(self, name, profiler=None):
+        '''
+        inputs:
+
+            name        :   what the request is, e.g. 'search'
+            profiler    :   None, 'cprofile' or 'pyinstrument' (needs the
+                            pyinstrument package): profile the code run
+                            while the trace is current
+        '''
+        if profiler is not None and profiler not in PROFILERS:
+            raise ValueError(f'profiler must be None or one of {PROFILERS}, not {profiler!r}')
+        self.name = name
+        self.trace_id = secrets.token_hex(16)
+        self.profiler = profiler
+        self.spans = []
+        self.counters = {}
+        self.stack = []
+        self.tokens = []
+        self.profile_reports = []
+        self.cprofile = None
+        self.pyinstrument = None
+
+    def __enter__(self):
+        self.tokens.append(_current.set(self))
+        self.start_profiler()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_profiler()
+        _current.reset(self.tokens.pop())
+        return False
+
+    @contextmanager
+    def span(self, name, **attributes):
+        '''time the block as a span, nested in the span it is opened in'''
+        span = Span(name, self.stack[-1].span_id if self.stack else None, attributes)
+        self.spans.append(span)
+        self.stack.append(span)
+        try:
+            yield span
+        finally:
+            self.stack.pop()
+            span.end_ns = span.start_ns + (time.perf_counter_ns() - span.started)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def start_profiler(self):
+        if self.profiler == 'cprofile':
+            self.cprofile = cProfile.Profile()
+            try:
+                self.cprofile.enable()
+            except ValueError as error:
+                #only one profiler can run at a time (e.g. another session is profiling)
+                self.profile_reports.append(f'cProfile not started: {error}')
+                self.cprofile = None
+        elif self.profiler == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                self.profile_reports.append('pyinstrument is not installed (pip install pyinstrument)')
+                return
+            self.pyinstrument = Profiler()
+            try:
+                self.pyinstrument.start()
+            except RuntimeError as error:
+                self.profile_reports.append(f'pyinstrument not started: {error}')
+                self.pyinstrument = None
+
+    def stop_profiler(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            output = io.StringIO()
+            pstats.Stats(self.cprofile, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+            self.profile_reports.append(output.getvalue())
+            self.cprofile = None
+        if self.pyinstrument is not None:
+            self.pyinstrument.stop()
+            self.profile_reports.append(self.pyinstrument.output_text(unicode=False, color=False))
+            self.pyinstrument = None
+
+    @property
+    def profile(self):
+        '''the profiler reports as text, None if the trace was not profiled'''
+        return '\n'.join(self.profile_reports) if self.profile_reports else None
+
+    def depth(self, span):
+        parents = {each.span_id: each.parent_id for each in self.spans}
+        depth, parent = 0, span.parent_id
+        while parent is not None:
+            depth, parent = depth + 1, parents.get(parent)
+        return depth
+
+    def records(self):
+        '''the trace as JSON-serializable records'''
+        return {'trace_id': self.trace_id, 'name': self.name,
+                'spans': [{'name': span.name, 'span_id': span.span_id, 'parent_id': span.parent_id,
+                           'start_unix_nano': span.start_ns, 'end_unix_nano': span.end_ns,
+                           'duration_ms': span.duration_ms, 'attributes': span.attributes}
+                          for span in self.spans],
+                'counters': dict(self.counters),
+                'profile': self.profile}
+
+    def to_json(self):
+        return json.dumps(self.records(), indent=2, default=str)
+
+    def to_otlp(self):
+        '''
+        The spans as an OTLP/JSON ExportTraceServiceRequest (what an OpenTelemetry
+        collector's /v1/traces endpoint takes).  The counters are attributes of a
+        span named after the trace that every top level span is a child of.
+        '''
+        starts = [span.start_ns for span in self.spans]
+        ends = [span.end_ns for span in self.spans if span.end_ns is not None]
+        root_id = secrets.token_hex(8)
+        root = {'traceId': self.trace_id, 'spanId': root_id, 'name': self.name, 'kind': 1,
+                'startTimeUnixNano': str(min(starts, default=0)),
+                'endTimeUnixNano': str(max(ends, default=0)),
+                'attributes': otlp_attributes({f'counter.{name}': value for name, value in self.counters.items()})}
+        spans = [root] + [{'traceId': self.trace_id, 'spanId': span.span_id,
+                           'parentSpanId': span.parent_id or root_id, 'name': span.name, 'kind': 1,
+                           'startTimeUnixNano': str(span.start_ns),
+                           'endTimeUnixNano': str(span.end_ns if span.end_ns is not None else span.start_ns),
+                           'attributes': otlp_attributes(span.attributes)}
+                          for span in self.spans]
+        return {'resourceSpans': [{
+                    'resource': {'attributes': otlp_attributes({'service.name': SERVICE_NAME})},
+                    'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}]}]}
+
+    def append_to(self, path):
+        '''append the trace records as one line of a JSON lines file, for offline analysis'''
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.records(), default=str) + '\n')
+
+def otlp_attributes(attributes):
+    '''a dictionary as OTLP key / typed value pairs'''
+    output = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            #64 bit integers are strings in OTLP/JSON
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        output.append({'key': key, 'value': typed})
+    return output
+
+def current():
+    '''the trace current in this thread, None outside of one'''
+    return _current.get()
+
+@contextmanager
+def span(name, **attributes):
+    '''a span of the current trace, or nothing if there is none'''
+    trace = _current.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attributes) as opened:
+        yield opened
+
+def count(name, n=1):
+    '''add n to a counter of the current trace, if there is one'''
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, n)
+
+def traced(name):
+    '''decorator: every call of the function is a span of the current trace'''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def debug_panel(trace, label='Debug: where the time went'):
+    '''collapsible streamlit panel with the spans, counters and profile of a trace, and its exports'''
+    import pandas as pd
+    import streamlit as st
+
+    with st.expander(label):
+        st.dataframe(pd.DataFrame({'Stage': ['    ' * trace.depth(span) + span.name for span in trace.spans],
+                                   'Milliseconds': [span.duration_ms for span in trace.spans],
+                                   'Attributes': [json.dumps(span.attributes, default=str) if span.attributes else ''
+                                                  for span in trace.spans]}),
+                     use_container_width=True, hide_index=True)
+        if trace.counters:
+            st.write('Counters:')
+            st.json(trace.counters)
+        if trace.profile is not None:
+            st.code(trace.profile, language=None)
+        c1, c2 = st.columns(2)
+        with c1:
+            st.download_button('Download trace (JSON)', trace.to_json(), file_name=f'trace-{trace.trace_id}.json',
+                               mime='application/json', key=f'trace-json-{trace.trace_id}')
+        with c2:
+            st.download_button('Download trace (OTLP JSON)', json.dumps(trace.to_otlp()),
+                               file_name=f'trace-{trace.trace_id}.otlp.json', mime='application/json',
+                               key=f'trace-otlp-{trace.trace_id}')